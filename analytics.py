@@ -0,0 +1,167 @@
+# analytics.py
+# Per-product price statistics over the history store: 7/30/90-day moving
+# averages of M.C., MIN/MAX spread, volatility and the percentile rank of
+# the latest price. A market's whole history is loaded into one pandas
+# frame sorted by (product, package, date) and every statistic is computed
+# with grouped, time-based rolling windows in a single vectorized pass.
+# Results are cached per latest bulletin date (and bulletin count, so a
+# backfilled older bulletin also triggers a rebuild). Frames are loaded from
+# the market's memory-mapped columnar archive (columnar_archive.py) when it
+# is up to date with the history, and from SQLite otherwise.
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from columnar_archive import open_archive
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MOVING_AVERAGE_DAYS = (7, 30, 90)
+VOLATILITY_DAYS = 30
+KEY = ["product", "package"]
+ROW_COLUMNS = ["bulletin_date", "product", "package", "min_cents", "mc_cents", "max_cents", "situation"]
+
+def _reais(values):
+    """Centavos (float array, NaN for missing) -> reais rounded to centavos."""
+    return np.round(values / 100, 2)
+
+class MarketAnalytics:
+    """Statistics for one market, computed once for its latest bulletin date."""
+
+    def __init__(self, market, frame, version=None):
+        """frame has the ROW_COLUMNS (see frame_from_rows and ColumnarArchive.to_frame)."""
+        self.market = market
+        self.version = version
+        frame = frame[ROW_COLUMNS].copy()
+        for column in ("bulletin_date", "product", "package", "situation"):
+            frame[column] = frame[column].astype(object) # Categoricals from the archive group like plain strings
+        frame["date"] = pd.to_datetime(frame["bulletin_date"])
+        for column in ("min_cents", "mc_cents", "max_cents"):
+            frame[column] = frame[column].astype("float64") # None -> NaN
+        frame = frame.sort_values(KEY + ["date"], kind="stable").reset_index(drop=True)
+        self.latest_date = frame["bulletin_date"].max() if len(frame) else None
+
+        groups = frame.groupby(KEY, sort=False)
+        # Rolling results come back in group order, which is the frame order
+        for days in MOVING_AVERAGE_DAYS:
+            frame[f"ma_{days}"] = groups.rolling(f"{days}D", on="date")["mc_cents"].mean().to_numpy()
+        frame["spread"] = frame["max_cents"] - frame["min_cents"]
+        # Volatility: standard deviation of bulletin-to-bulletin % changes of M.C.
+        # (explicit shift: NaN gaps stay NaN instead of being filled forward)
+        frame["change_pct"] = (frame["mc_cents"] / groups["mc_cents"].shift() - 1) * 100
+        frame["volatility"] = (
+            frame.groupby(KEY, sort=False).rolling(f"{VOLATILITY_DAYS}D", on="date")["change_pct"].std().to_numpy()
+        )
+        # Share of the product's history priced at or below each row's M.C.
+        frame["percentile_rank"] = groups["mc_cents"].rank(method="max", pct=True) * 100
+        self.frame = frame
+        self._positions = groups.indices # (product, package) -> row positions, sorted by date
+        self._packages = {}
+        for key in sorted(self._positions):
+            self._packages.setdefault(key[0], []).append(key)
+        self._summary = None
+
+    def _records(self, frame):
+        records = pd.DataFrame({
+            "bulletin_date": frame["bulletin_date"],
+            "MIN": _reais(frame["min_cents"]),
+            "M.C.": _reais(frame["mc_cents"]),
+            "MAX": _reais(frame["max_cents"]),
+            **{f"ma_{days}": _reais(frame[f"ma_{days}"]) for days in MOVING_AVERAGE_DAYS},
+            "spread": _reais(frame["spread"]),
+            "volatility": np.round(frame["volatility"], 2),
+        })
+        return records.astype(object).where(records.notna(), None).to_dict("records")
+
+    def _product_summary(self, frame):
+        latest = frame.iloc[-1]
+        mc = frame["mc_cents"]
+        return {
+            "bulletin_date": latest["bulletin_date"],
+            "M.C.": _none_if_nan(_reais(latest["mc_cents"])),
+            **{f"ma_{days}": _none_if_nan(_reais(latest[f"ma_{days}"])) for days in MOVING_AVERAGE_DAYS},
+            "spread": _none_if_nan(_reais(latest["spread"])),
+            "volatility": _none_if_nan(round(latest["volatility"], 2)),
+            "percentile_rank": _none_if_nan(round(latest["percentile_rank"], 1)),
+            "min_price": _none_if_nan(_reais(mc.min())),
+            "max_price": _none_if_nan(_reais(mc.max())),
+            "bulletins": int(len(frame)),
+        }
+
+    def product_stats(self, product, package=None):
+        """Full history with rolling stats for a product (every package unless
+        one is given). None if the product never appeared."""
+        keys = [key for key in self._packages.get(product, ()) if package is None or key[1] == package]
+        if not keys:
+            return None
+        result = []
+        for key in keys:
+            frame = self.frame.iloc[self._positions[key]]
+            result.append({
+                "Produtos": key[0],
+                "Embalagem": key[1],
+                "summary": self._product_summary(frame),
+                "history": self._records(frame),
+            })
+        return result
+
+    def summary(self):
+        """Stats of every product on the latest bulletin, computed once."""
+        if self._summary is None:
+            latest = self.frame[self.frame["bulletin_date"] == self.latest_date]
+            records = pd.DataFrame({
+                "Produtos": latest["product"],
+                "Embalagem": latest["package"],
+                "M.C.": _reais(latest["mc_cents"]),
+                **{f"ma_{days}": _reais(latest[f"ma_{days}"]) for days in MOVING_AVERAGE_DAYS},
+                "spread": _reais(latest["spread"]),
+                "volatility": np.round(latest["volatility"], 2),
+                "percentile_rank": np.round(latest["percentile_rank"], 1),
+            })
+            self._summary = records.astype(object).where(records.notna(), None).to_dict("records")
+        return self._summary
+
+def frame_from_rows(rows):
+    """DataFrame of HistoryStore.price_rows tuples."""
+    return pd.DataFrame.from_records(rows, columns=ROW_COLUMNS)
+
+def _none_if_nan(value):
+    return None if pd.isna(value) else float(value)
+
+class AnalyticsCache:
+    """MarketAnalytics per market, rebuilt when the history gets another bulletin.
+
+    archive_path(market) -> path of the market's columnar history archive, or None.
+    """
+
+    def __init__(self, history, archive_path=None):
+        self.history = history
+        self.archive_path = archive_path
+        self._by_market = {}
+        self._lock = threading.Lock()
+
+    def get(self, market):
+        version = self.history.bulletin_version(market)
+        if version[0] is None:
+            return None
+        analytics = self._by_market.get(market)
+        if analytics is not None and analytics.version == version:
+            return analytics
+        with self._lock:
+            analytics = self._by_market.get(market)
+            if analytics is None or analytics.version != version:
+                with STEP_SECONDS.time(step="analytics_frame"):
+                    analytics = MarketAnalytics(market, self._frame(market, version), version)
+                self._by_market[market] = analytics
+                logger.info(f"Estatísticas de {market} recalculadas até {analytics.latest_date} ({len(analytics.frame)} linhas).")
+        return analytics
+
+    def _frame(self, market, version):
+        path = self.archive_path(market) if self.archive_path else None
+        archive = open_archive(path) if path else None
+        if archive is not None and archive.market == market and archive.version == tuple(version):
+            return archive.to_frame()
+        if path:
+            logger.info(f"Arquivo colunar de {market} ausente ou desatualizado; lendo o histórico do SQLite.")
+        return frame_from_rows(self.history.price_rows(market))
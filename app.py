@@ -1,301 +1,612 @@
 # app.py
-import sys
-sys.path.append("/opt/.manus/.sandbox-runtime")
-from flask import Flask, send_file, render_template_string, Response
-from playwright.sync_api import sync_playwright
-import pandas as pd
-from bs4 import BeautifulSoup
-from io import StringIO
-import traceback
+# Only Flask and the light local modules are imported here, so a cold start
+# can serve the snapshot left on disk right away. requests/BeautifulSoup load
+# with the first scrape, pandas/numpy with the first statistics, comparison
+# or archive write, and a background warm-up thread preloads them all
+# (python bench_startup.py measures the import cost against a budget).
+from flask import Flask, Response, request, g
 from datetime import datetime
+import importlib
+import threading
+import time
 import json
 import os
 import logging
+from single_flight import SingleFlight
+from browser_pool import BrowserPool
+from fetch_engines import HttpFetchEngine, PlaywrightFetchEngine, HostLimiter
+from concurrent.futures import ThreadPoolExecutor
+from history_store import HistoryStore, to_iso_date
+from http_cache import Payload, conditional_response
+from snapshot import SnapshotStore, SnapshotWriter, load_snapshot, BULLETIN_DATE_NOT_FOUND
+from raw_archive import RawArchive
+from bulletin_probe import BulletinProbe, NEW, UNCHANGED
+from ingestion import IngestionJob, PersistStage, PublishStage, build_pipeline
+from price_query import PriceQuery, QueryError, DEFAULT_PAGE_SIZE
+from product_search import ProductSearchCache, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT
+from metrics import REGISTRY, CONTENT_TYPE, STAGE_SECONDS, SCRAPES, STALE_SERVED, SNAPSHOT_AGE, REQUEST_SECONDS
+import atexit
 
 # --- Configuration ---
 HTML_INPUT_FILE = "post_response.html" # Temporary file for browser HTML
 DATA_FILE = "ceasa_data.json"
 HTML_OUTPUT_FILE = "ceasa_tabela.html"
+HISTORY_DB_FILE = os.environ.get("HISTORY_DB_FILE", "ceasa_history.sqlite3") # Every bulletin ever processed
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "ceasa_archive") # Columnar copies of each bulletin and of the history ("" disables)
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR", "ceasa_raw") # Every downloaded page, by content hash ("" disables)
 FILTER_URL = "http://200.198.51.71/detec/filtro_boletim_es/filtro_boletim_es.php"
 TARGET_MARKET_NAME = "CEASA GRANDE VITÓRIA"
-TARGET_MARKET_OPTION_INDEX = 1 # Index for CEASA GRANDE VITÓRIA in the dropdown
-LATEST_DATE_OPTION_INDEX = 1 # Index for the latest date in the dropdown
-MARKET_SELECT_INDEX = 3 # Browser index for market dropdown
-DATE_SELECT_INDEX = 4 # Browser index for date dropdown
-OK_BUTTON_INDEX = 5 # Browser index for the OK button
+TARGET_MARKET_VALUE = "211" # Option value for CEASA GRANDE VITÓRIA (used by the HTTP engine's nmgp_parms)
+
+# --- Background refresh configuration ---
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+REFRESH_INTERVAL_SECONDS = int(os.environ.get("REFRESH_INTERVAL_SECONDS", 3600)) # Normal refresh interval
+PUBLICATION_WINDOW_START_HOUR = int(os.environ.get("PUBLICATION_WINDOW_START_HOUR", 10)) # CEASA usually publishes late morning
+PUBLICATION_WINDOW_END_HOUR = int(os.environ.get("PUBLICATION_WINDOW_END_HOUR", 14))
+PUBLICATION_WINDOW_INTERVAL_SECONDS = int(os.environ.get("PUBLICATION_WINDOW_INTERVAL_SECONDS", 600)) # Faster polling inside the window
+REFRESH_RETRY_SECONDS = int(os.environ.get("REFRESH_RETRY_SECONDS", 300)) # Minimum gap between background attempts after a failure
+PROBE_ENABLED = os.environ.get("PROBE_ENABLED", "1") == "1" # Poll the date list and scrape only when a new date appears
+PROBE_INTERVAL_SECONDS = int(os.environ.get("PROBE_INTERVAL_SECONDS", 900)) # Date list polling interval
+PUBLICATION_WINDOW_PROBE_INTERVAL_SECONDS = int(os.environ.get("PUBLICATION_WINDOW_PROBE_INTERVAL_SECONDS", 120)) # Inside the window
+SCRAPE_WAIT_TIMEOUT_SECONDS = float(os.environ.get("SCRAPE_WAIT_TIMEOUT_SECONDS", 90)) # Max wait on a scrape started by someone else
+LATEST_DATE_KEY = "latest" # Single-flight key for "whatever the newest bulletin is"
+
+# --- Browser pool configuration ---
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 1)) # Warm browsers, also the cap on concurrent pages
+BROWSER_RECYCLE_AFTER_SCRAPES = int(os.environ.get("BROWSER_RECYCLE_AFTER_SCRAPES", 50))
+BROWSER_RECYCLE_AFTER_SECONDS = int(os.environ.get("BROWSER_RECYCLE_AFTER_SECONDS", 6 * 3600))
+BROWSER_JOB_TIMEOUT_SECONDS = int(os.environ.get("BROWSER_JOB_TIMEOUT_SECONDS", 180)) # Includes waiting for a free browser
+
+# --- Fetch engines, tried in order until one returns a valid bulletin ---
+FETCH_ENGINES = [name.strip() for name in os.environ.get("FETCH_ENGINES", "http,playwright").split(",") if name.strip()]
+HTTP_TIMEOUT_SECONDS = int(os.environ.get("HTTP_TIMEOUT_SECONDS", 30))
+
+# --- Cold start ---
+# Heavy modules imported by a background thread right after startup ("" disables)
+WARMUP_MODULES = [name.strip() for name in os.environ.get("WARMUP_MODULES", "requests,bs4,numpy,pandas").split(",") if name.strip()]
+
+# --- Multi-market scraping ---
+MARKET_WORKERS = int(os.environ.get("MARKET_WORKERS", 4)) # Markets scraped at the same time
+HOST_MAX_CONCURRENT_REQUESTS = int(os.environ.get("HOST_MAX_CONCURRENT_REQUESTS", 4)) # Politeness towards the CEASA host
+HOST_MIN_REQUEST_INTERVAL_SECONDS = float(os.environ.get("HOST_MIN_REQUEST_INTERVAL_SECONDS", 0.25))
 
 app = Flask(__name__)
+# Static assets are referenced with a content hash (?v=...), so they can be cached for a year
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 365 * 24 * 3600
 logging.basicConfig(level=logging.INFO)
 
-# --- Helper Functions (from process_html.py, adapted) ---
-def process_html_data(html_content):
-    app.logger.info("Processando dados do HTML extraído...")
-    try:
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        # Parse the result table
-        app.logger.info("Procurando tabela de dados no HTML...")
-        tables = soup.find_all("table")
-        app.logger.info(f"Encontradas {len(tables)} tabelas.")
-
-        data_table = None
-        # Look for the table within div#sc_grid_body or with specific content
-        grid_body_div = soup.find("div", id="sc_grid_body")
-        if grid_body_div:
-            data_table = grid_body_div.find("table", class_="scGridTabela")
-            if data_table:
-                app.logger.info("Tabela encontrada via div#sc_grid_body > table.scGridTabela")
-        
-        if not data_table:
-             # Fallback: Look for table with border=1 and specific text
-            for i, table in enumerate(tables):
-                if table.get("border") == "1" and "Produtos" in table.text:
-                    app.logger.info(f"Tabela de dados encontrada por fallback (índice {i}).")
-                    data_table = table
-                    break
-
-        if not data_table:
-            app.logger.error("ERRO: Tabela de dados não encontrada no HTML.")
-            return None, None
-
-        # Use pandas to read the HTML table
-        try:
-            table_html = str(data_table)
-            # app.logger.debug(f"Table HTML: {table_html[:500]}") # Log start of table HTML if needed
-            
-            # Read table, ensure correct decimal parsing
-            df_list = pd.read_html(StringIO(table_html), header=0, decimal=",", thousands=".")
-
-            if not df_list:
-                app.logger.error("ERRO: pandas não conseguiu ler nenhuma tabela do HTML encontrado.")
-                return None, None
-
-            df = df_list[0]
-            app.logger.info(f"Dados extraídos com sucesso. {len(df)} linhas.")
-            original_cols = df.columns.tolist()
-            app.logger.info(f"Colunas detectadas: {original_cols}")
-
-            # Clean and rename columns
-            df = df.dropna(how="all")
-            expected_cols = ["Produtos", "Embalagem", "MIN", "M.C.", "MAX", "Situação"]
-            if len(original_cols) == len(expected_cols):
-                last_col_name = original_cols[-1]
-                rename_map = {
-                    original_cols[0]: "Produtos",
-                    original_cols[1]: "Embalagem",
-                    original_cols[2]: "MIN",
-                    original_cols[3]: "M.C.",
-                    original_cols[4]: "MAX",
-                    last_col_name: "Situação"
-                }
-                df.rename(columns=rename_map, inplace=True)
-                app.logger.info(f"Colunas renomeadas para: {df.columns.tolist()}")
-            else:
-                 app.logger.warning(f"Número de colunas ({len(df.columns)}) não corresponde ao esperado ({len(expected_cols)}).")
-
-            df = df.dropna(subset=["MIN", "M.C.", "MAX"], how="all")
-            app.logger.info(f"Linhas após limpeza inicial: {len(df)}")
-
-            price_cols = ["MIN", "M.C.", "MAX"]
-            for col in price_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-            app.logger.info(f"Tipos de dados após conversão: \n{df.dtypes}")
-
-            timestamp = datetime.now().isoformat()
-            bulletin_date_str = "Não encontrada"
-            # Extract date from page title or header (more robustly)
-            title_tag = soup.find("title")
-            header_td = soup.find("td", class_="scGridLabel") # Common in ScriptCase
-            date_info = soup.find(lambda tag: tag.name == "td" and "Data Pesquisada:" in tag.get_text())
-            
-            if date_info:
-                 try:
-                    bulletin_date_str = date_info.get_text().split("Data Pesquisada:")[1].split("Mercado:")[0].strip()
-                    app.logger.info(f"Data do boletim extraída da página: {bulletin_date_str}")
-                 except Exception as e:
-                    app.logger.warning(f"Não foi possível extrair data do boletim da tag TD: {e}")
-            elif header_td and "Data Pesquisada:" in header_td.text:
-                 try:
-                    bulletin_date_str = header_td.get_text().split("Data Pesquisada:")[1].split("Mercado:")[0].strip()
-                    app.logger.info(f"Data do boletim extraída da tag TD.scGridLabel: {bulletin_date_str}")
-                 except Exception as e:
-                    app.logger.warning(f"Não foi possível extrair data do boletim da tag TD.scGridLabel: {e}")
-            elif title_tag and "Data Pesquisada:" in title_tag.text:
-                 try:
-                    bulletin_date_str = title_tag.get_text().split("Data Pesquisada:")[1].split("Mercado:")[0].strip()
-                    app.logger.info(f"Data do boletim extraída da tag TITLE: {bulletin_date_str}")
-                 except Exception as e:
-                    app.logger.warning(f"Não foi possível extrair data do boletim da tag TITLE: {e}")
-            else:
-                app.logger.warning("Não foi possível encontrar a data do boletim na página.")
-
-            # Store data as JSON
-            data_to_store = {
-                "timestamp": timestamp,
-                "market": TARGET_MARKET_NAME,
-                "bulletin_date": bulletin_date_str,
-                "data": df.to_dict(orient="records")
-            }
-            try:
-                with open(DATA_FILE, "w", encoding="utf-8") as f:
-                    json.dump(data_to_store, f, ensure_ascii=False, indent=4)
-                app.logger.info(f"Dados salvos em {DATA_FILE}")
-            except Exception as e:
-                app.logger.error(f"Erro ao salvar arquivo JSON {DATA_FILE}: {e}")
-                return None, None
-
-            # Create simple HTML table for display
-            html_content_output = f"""
-            <!DOCTYPE html>
-            <html lang="pt-BR">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Cotação CEASA-ES ({TARGET_MARKET_NAME})</title>
-                <style>
-                    body {{ font-family: sans-serif; margin: 0; padding: 10px; background-color: #f8f9fa; }}
-                    h2 {{ color: #343a40; text-align: center; margin-bottom: 15px; }}
-                    .table-container {{ max-width: 100%; overflow-x: auto; background-color: #ffffff; padding: 15px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-                    table {{ border-collapse: collapse; width: 100%; margin-top: 0; }}
-                    th, td {{ border: 1px solid #dee2e6; padding: 8px 10px; text-align: left; font-size: 0.9em; }}
-                    th {{ background-color: #e9ecef; color: #495057; font-weight: bold; }}
-                    tr:nth-child(even) {{ background-color: #f8f9fa; }}
-                    tr:hover {{ background-color: #e2e6ea; }}
-                    caption {{ caption-side: bottom; padding-top: 12px; font-size: 0.85em; color: #6c757d; text-align: center; }}
-                    .container {{ max-width: 1200px; margin: 10px auto; }}
-                    td:nth-child(3), td:nth-child(4), td:nth-child(5) {{ text-align: right; }}
-                    th:nth-child(3), th:nth-child(4), th:nth-child(5) {{ text-align: right; }}
-                    a {{ color: #007bff; text-decoration: none; }}
-                    a:hover {{ text-decoration: underline; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h2>Cotação CEASA-ES - {TARGET_MARKET_NAME}</h2>
-                    <div class="table-container">
-                        {df.to_html(index=False, escape=False, float_format="%.2f", na_rep="", classes="dataframe")}
-                    </div>
-                    <caption>Dados atualizados em: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")} (Data do boletim: {bulletin_date_str})<br>Fonte: <a href="{FILTER_URL}" target="_blank">CEASA-ES</a></caption>
-                </div>
-            </body>
-            </html>
-            """
-            try:
-                with open(HTML_OUTPUT_FILE, "w", encoding="utf-8") as f:
-                    f.write(html_content_output)
-                app.logger.info(f"Tabela HTML salva em {HTML_OUTPUT_FILE}")
-            except Exception as e:
-                app.logger.error(f"Erro ao salvar arquivo HTML {HTML_OUTPUT_FILE}: {e}")
-                return None, None
-
-            return DATA_FILE, HTML_OUTPUT_FILE
-
-        except Exception as e:
-            app.logger.error(f"Erro ao processar tabela com pandas: {e}")
-            traceback.print_exc()
-            return None, None
+_browser_pool = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    recycle_after_jobs=BROWSER_RECYCLE_AFTER_SCRAPES,
+    recycle_after_seconds=BROWSER_RECYCLE_AFTER_SECONDS,
+)
+atexit.register(_browser_pool.shutdown)
 
-    except Exception as e:
-        app.logger.error(f"Ocorreu um erro inesperado ao processar o HTML: {e}")
-        traceback.print_exc()
-        return None, None
-
-# --- Scraping Function ---
-def scrape_ceasa_data():
-    app.logger.info("Iniciando scraping com Playwright...")
-    html_content = None
+_history = HistoryStore(HISTORY_DB_FILE)
+_snapshots = SnapshotStore() # Latest snapshot per market; routes only ever read from here
+_snapshot_writer = SnapshotWriter(_history, ARCHIVE_DIR or None) # Writes files and history off the request path
+_analytics = None # AnalyticsCache: rolling price statistics, recomputed once per new bulletin
+_comparisons = None # ComparisonCache: product x market price matrix per date, pivoted once per date
+_lazy_lock = threading.Lock()
+_search = ProductSearchCache(_history, _snapshots) # Product name index, rebuilt once per new snapshot or bulletin
+
+def analytics_cache():
+    """The AnalyticsCache, created (and pandas imported) on first use."""
+    global _analytics
+    with _lazy_lock:
+        if _analytics is None:
+            from analytics import AnalyticsCache
+            _analytics = AnalyticsCache(_history, _history_archive if ARCHIVE_DIR else None)
+    return _analytics
+
+def _history_archive(market_name):
+    """Path of the columnar history archive SnapshotWriter keeps for a market."""
+    from columnar_archive import history_path
+    market_value = next((value for value, name in get_markets().items() if name == market_name), None)
+    return history_path(ARCHIVE_DIR, market_value) if market_value else None
+
+def comparison_cache():
+    """The ComparisonCache, created (and pandas imported) on first use."""
+    global _comparisons
+    with _lazy_lock:
+        if _comparisons is None:
+            from market_comparison import ComparisonCache
+            _comparisons = ComparisonCache(_history)
+    return _comparisons
+
+# --- Helper Functions ---
+def market_files(market_value):
+    """(data file, html file) for a market. The default market keeps the historical names."""
+    if market_value == TARGET_MARKET_VALUE:
+        return DATA_FILE, HTML_OUTPUT_FILE
+    return f"ceasa_data_{market_value}.json", f"ceasa_tabela_{market_value}.html"
+
+# --- Fetch engines ---
+_host_limiter = HostLimiter(max_concurrent=HOST_MAX_CONCURRENT_REQUESTS, min_interval=HOST_MIN_REQUEST_INTERVAL_SECONDS)
+_engines_by_name = {
+    "http": HttpFetchEngine(timeout=HTTP_TIMEOUT_SECONDS, limiter=_host_limiter),
+    "playwright": PlaywrightFetchEngine(_browser_pool, timeout=BROWSER_JOB_TIMEOUT_SECONDS, limiter=_host_limiter),
+}
+_fetch_engines = [_engines_by_name[name] for name in FETCH_ENGINES if name in _engines_by_name]
+
+# --- Market discovery ---
+_markets_lock = threading.Lock()
+_markets = {TARGET_MARKET_VALUE: TARGET_MARKET_NAME} # option value -> market name
+_markets_discovered = False
+
+def get_markets():
+    with _markets_lock:
+        return dict(_markets)
+
+def discover_markets():
+    """Refresh the market list from the filter form's dropdown. Keeps the old list on failure."""
+    return set_markets(_engines_by_name["http"].list_markets())
+
+def set_markets(discovered):
+    """Replace the market list with [(value, name), ...] from the filter form,
+    unless it is empty, and load snapshots left on disk for new markets."""
+    global _markets_discovered
+    if not discovered:
+        app.logger.warning("Não foi possível descobrir os mercados. Mantendo lista atual.")
+        return get_markets()
+    with _markets_lock:
+        _markets.clear()
+        _markets.update(discovered)
+        # Keep the default market's name stable: it keys the history store
+        _markets[TARGET_MARKET_VALUE] = TARGET_MARKET_NAME
+        _markets_discovered = True
+    app.logger.info(f"Mercados disponíveis: {', '.join(name for _, name in discovered)}")
+    for market_value in get_markets():
+        if _snapshots.get(market_value) is None:
+            load_snapshot_from_disk(market_value)
+    return get_markets()
+
+# --- In-memory snapshots and background refresh ---
+_scrape_flights = SingleFlight(os.path.dirname(os.path.abspath(DATA_FILE))) # One scrape per (market, date) across threads and workers
+_last_refresh_attempt = {} # market value -> time.monotonic() of the last refresh attempt
+_market_executor = ThreadPoolExecutor(max_workers=MARKET_WORKERS, thread_name_prefix="ceasa-market")
+PERSIST_WAIT_TIMEOUT_SECONDS = 30
+_raw_archive = RawArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None
+# fetch -> raw_archive -> parse -> normalize -> validate -> render, then swap into memory and
+# write to disk. Readers are served from memory as soon as "publish" runs; the persist wait only
+# keeps the cross-process lock held until other workers can reload the files. A page identical to
+# the one this worker's current snapshot came from stops the job after raw_archive.
+_pipeline = build_pipeline(_fetch_engines, persist=[
+    ("publish", PublishStage(_snapshots)),
+    ("persist", PersistStage(_snapshot_writer, market_files, PERSIST_WAIT_TIMEOUT_SECONDS)),
+], on_stage=lambda stage, seconds, ok: STAGE_SECONDS.observe(seconds, stage=stage),
+   raw_archive=_raw_archive, unchanged=lambda job: _serves_page(job.market_value, job.content_hash))
+SNAPSHOT_AGE.set_function(lambda: {(value,): snapshot.age_seconds() for value, snapshot in _snapshots.all().items()})
+
+def _serves_page(market_value, content_hash):
+    """Whether the market's snapshot in memory was built from this downloaded
+    page. Snapshots loaded from disk don't know their page, so they never match."""
+    snapshot = _snapshots.get(market_value)
+    return snapshot is not None and snapshot.content_hash is not None and snapshot.content_hash == content_hash
+
+def load_snapshot_from_disk(market_value=TARGET_MARKET_VALUE):
+    """Warm restart: rebuild a market's snapshot from the files of a previous run."""
+    data_file, _ = market_files(market_value)
     try:
-        with sync_playwright() as p:
-            # Launch browser - use args for Render compatibility
-            browser = p.chromium.launch(headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"])
-            page = browser.new_page()
-            app.logger.info(f"Navegando para {FILTER_URL}")
-            page.goto(FILTER_URL, timeout=60000) # Increased timeout
-            app.logger.info("Página carregada. Selecionando opções...")
-            
-            # Select Market
-            page.locator(f"select").nth(MARKET_SELECT_INDEX - 1).select_option(index=TARGET_MARKET_OPTION_INDEX)
-            app.logger.info(f"Mercado selecionado: {TARGET_MARKET_NAME}")
-            page.wait_for_timeout(1000) # Wait for potential dynamic loading
-            
-            # Select Date (latest)
-            page.locator(f"select").nth(DATE_SELECT_INDEX - 1).select_option(index=LATEST_DATE_OPTION_INDEX)
-            app.logger.info("Data mais recente selecionada.")
-            page.wait_for_timeout(500)
-            
-            # Click OK
-            app.logger.info("Clicando no botão OK...")
-            # Use a more robust selector if index fails
-            ok_button_selector = f":nth-match(a:has-text(\"Ok\"), {OK_BUTTON_INDEX})"
-            page.locator(ok_button_selector).click()
-            
-            app.logger.info("Aguardando navegação para a página de resultados...")
-            page.wait_for_load_state("networkidle", timeout=60000) # Wait for network to be idle
-            app.logger.info(f"Página de resultados carregada: {page.url}")
-            
-            # Get HTML content
-            html_content = page.content()
-            app.logger.info("Conteúdo HTML da página de resultados obtido.")
-            
-            browser.close()
-            
+        snapshot = load_snapshot(market_value, data_file)
     except Exception as e:
-        app.logger.error(f"Erro durante o scraping com Playwright: {e}")
-        traceback.print_exc()
-        return None # Indicate failure
+        app.logger.error(f"Erro ao carregar snapshot do disco ({data_file}): {e}")
+        return False
+    if snapshot is None:
+        return False
+    _snapshots.swap(snapshot)
+    app.logger.info(f"Snapshot carregado do disco ({data_file}, gerado em {snapshot.generated_at.isoformat()}).")
+    return True
+
+def _recently_attempted(market_value):
+    last_attempt = _last_refresh_attempt.get(market_value)
+    return last_attempt is not None and time.monotonic() - last_attempt < REFRESH_RETRY_SECONDS
+
+def _scrape_and_process(market_value):
+    _last_refresh_attempt[market_value] = time.monotonic()
+    market_name = get_markets().get(market_value, TARGET_MARKET_NAME)
+    app.logger.info(f"Iniciando atualização do mercado {market_value} (motores: {', '.join(e.name for e in _fetch_engines)})...")
+    job = _pipeline.run(IngestionJob(market_value, market_name))
+    return _record_refresh(market_value, job)
+
+def _record_refresh(market_value, job):
+    """Count a finished refresh job; an unchanged page keeps the snapshot and confirms it current."""
+    SCRAPES.inc(market=market_value, result="failure" if not job.ok else "unchanged" if job.skipped else "success")
+    if job.skipped:
+        _snapshots.confirm(market_value)
+        app.logger.info(f"Boletim de {market_value} inalterado; snapshot em memória mantido (motor {job.engine}).")
+    elif job.ok:
+        app.logger.info(f"Snapshot em memória de {market_value} atualizado (motor {job.engine}).")
+    return job.ok
+
+def _reload_after_peer_refresh(market_value):
+    # Another worker process just scraped; pick up the files it wrote
+    previous = _snapshots.get(market_value)
+    if not load_snapshot_from_disk(market_value):
+        return False
+    return previous is None or _snapshots.get(market_value).generated_at > previous.generated_at
+
+def refresh_data(market_value=TARGET_MARKET_VALUE, wait_timeout=SCRAPE_WAIT_TIMEOUT_SECONDS):
+    """Scrape and process a new bulletin, swapping it into the in-memory cache.
+
+    Concurrent callers (threads or gunicorn workers) share a single scrape per
+    (market, date) key. Returns True when the cache was updated; False when the
+    scrape failed or the wait for someone else's scrape timed out, in which
+    case the caller keeps serving the last good snapshot.
+    """
+    key = (market_value, LATEST_DATE_KEY)
+    result = _scrape_flights.run(
+        key,
+        lambda: _scrape_and_process(market_value),
+        wait_timeout,
+        on_peer_finished=lambda: _reload_after_peer_refresh(market_value),
+    )
+    return bool(result)
+
+def refresh_markets(market_values=None):
+    """Refresh several markets concurrently (all known markets by default).
+
+    The worker pool bounds how many run at once and the host limiter keeps
+    requests to the CEASA server polite. Returns {market value: success}.
+    """
+    market_values = list(market_values or get_markets())
+    results = _market_executor.map(refresh_data, market_values)
+    return dict(zip(market_values, results))
+
+def refresh_in_background(market_value=TARGET_MARKET_VALUE):
+    """Start a refresh in the market pool unless one is running or failed recently."""
+    if _scrape_flights.in_flight((market_value, LATEST_DATE_KEY)) or _recently_attempted(market_value):
+        return
+    _market_executor.submit(refresh_data, market_value)
+
+def in_publication_window(now=None):
+    hour = (now or datetime.now()).hour
+    return PUBLICATION_WINDOW_START_HOUR <= hour < PUBLICATION_WINDOW_END_HOUR
+
+def current_refresh_interval(now=None):
+    if in_publication_window(now):
+        return min(PUBLICATION_WINDOW_INTERVAL_SECONDS, REFRESH_INTERVAL_SECONDS)
+    return REFRESH_INTERVAL_SECONDS
+
+def _market_age(market_value):
+    return _snapshots.age_seconds(market_value)
+
+# --- New bulletin probe ---
+def current_probe_interval(now=None):
+    if in_publication_window(now):
+        return min(PUBLICATION_WINDOW_PROBE_INTERVAL_SECONDS, PROBE_INTERVAL_SECONDS)
+    return PROBE_INTERVAL_SECONDS
 
-    return html_content
+def _known_bulletin_date(market_value):
+    snapshot = _snapshots.get(market_value)
+    return to_iso_date(snapshot.bulletin_date) if snapshot is not None and snapshot.bulletin_date else None
+
+# The browser records the date-list call the first time the HTTP probe finds no dates
+_probe = BulletinProbe(
+    _engines_by_name["http"], _known_bulletin_date,
+    learn=_engines_by_name["playwright"].list_dates if "playwright" in FETCH_ENGINES else None,
+)
+_last_probe = {} # market value -> time.monotonic() of the last probe
+
+def _markets_to_probe():
+    """Markets with a snapshot whose last probe is older than the probe interval."""
+    if not PROBE_ENABLED:
+        return []
+    now, interval = time.monotonic(), current_probe_interval()
+    return [
+        market_value for market_value in get_markets()
+        if _snapshots.get(market_value) is not None and not _recently_attempted(market_value)
+        and (market_value not in _last_probe or now - _last_probe[market_value] >= interval)
+    ]
+
+def probe_market(market_value):
+    """Check the market's date list over HTTP: NEW, UNCHANGED or UNKNOWN."""
+    _last_probe[market_value] = time.monotonic()
+    return _record_probe(market_value, _probe.check(market_value))
+
+def _record_probe(market_value, result):
+    # Still the bulletin we hold: counts as a refresh, no scrape needed
+    if result == UNCHANGED:
+        _snapshots.confirm(market_value)
+    return result
+
+def _due_markets(probed):
+    """Markets needing a full scrape, given {market value: probe result} of
+    this round: a new date was listed, there is no snapshot yet, or the
+    snapshot is older than the refresh interval (probe off or inconclusive)."""
+    interval = current_refresh_interval()
+    due = []
+    for market_value in get_markets():
+        if _recently_attempted(market_value):
+            continue
+        age = _market_age(market_value)
+        if probed.get(market_value) == NEW or age is None or age >= interval:
+            due.append(market_value)
+    return due
+
+def _scheduler_loop():
+    app.logger.info("Agendador de atualização iniciado.")
+    while True:
+        try:
+            if not _markets_discovered:
+                discover_markets()
+            interval = current_refresh_interval()
+            to_probe = _markets_to_probe()
+            due = _due_markets(dict(zip(to_probe, _market_executor.map(probe_market, to_probe))))
+            if due:
+                refresh_markets(due)
+            # Sleep until the oldest market is due again, but wake up at least once
+            # a minute so probes run on time and entering the publication window
+            # shortens the wait promptly.
+            ages = [_market_age(market_value) for market_value in get_markets()]
+            oldest = max((age for age in ages if age is not None), default=interval)
+            time.sleep(max(1, min(interval - oldest, 60)) if oldest < interval else 60)
+        except Exception:
+            app.logger.exception("Erro no agendador de atualização.")
+            time.sleep(60)
+
+def _warm_up():
+    for name in WARMUP_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            app.logger.warning(f"Pré-carregamento de {name} falhou: {e}")
+            continue
+        app.logger.info(f"Módulo {name} pré-carregado em {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+def start_warm_up():
+    """Import the heavy modules in the background, so the first scrape or
+    statistics request doesn't pay for them and startup doesn't either."""
+    thread = threading.Thread(target=_warm_up, name="ceasa-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def start_scheduler():
+    thread = threading.Thread(target=_scheduler_loop, name="ceasa-scheduler", daemon=True)
+    thread.start()
+    return thread
 
 # --- Flask Routes ---
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route("/metrics")
+def get_metrics():
+    """Prometheus metrics: stage/step histograms, scrape counters, snapshot age and route latency."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def _requested_market():
+    """Market value from ?market=, defaulting to CEASA GRANDE VITÓRIA. None if unknown."""
+    market_value = request.args.get("market", TARGET_MARKET_VALUE)
+    if market_value not in get_markets() and not _markets_discovered:
+        discover_markets()
+    return market_value if market_value in get_markets() else None
+
 @app.route("/")
 def get_data():
     app.logger.info("Recebida requisição para /")
-    
-    # 1. Scrape data using Playwright
-    html_content = scrape_ceasa_data()
-    
-    if not html_content:
-        # Try to return last known good data if scraping fails
-        if os.path.exists(HTML_OUTPUT_FILE):
-            app.logger.warning("Scraping falhou. Servindo último arquivo HTML válido.")
-            try:
-                return send_file(HTML_OUTPUT_FILE)
-            except Exception as e:
-                 app.logger.error(f"Erro ao servir arquivo HTML existente {HTML_OUTPUT_FILE}: {e}")
-                 return "Erro ao obter dados do CEASA e ao servir dados antigos.", 500
-        else:
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+
+    snapshot = _snapshots.get(market_value)
+    if snapshot is None or request.args.get("refresh") == "1":
+        # Cold cache or forced refresh: scrape synchronously, coalesced with
+        # any scrape already in flight; on failure keep the last snapshot
+        app.logger.warning("Cache vazio ou atualização forçada. Executando scraping síncrono.")
+        refreshed = refresh_data(market_value)
+        snapshot = _snapshots.get(market_value)
+        if snapshot is None:
             app.logger.error("Scraping falhou e não há dados antigos para servir.")
             return "Erro ao obter dados do CEASA.", 500
+        if not refreshed:
+            STALE_SERVED.inc(market=market_value, reason="refresh_failed")
+    elif _market_age(market_value) >= current_refresh_interval():
+        # Stale-while-revalidate: serve what we have and refresh behind the scenes
+        app.logger.info("Dados em cache expirados. Servindo cache e atualizando em segundo plano.")
+        STALE_SERVED.inc(market=market_value, reason="expired")
+        refresh_in_background(market_value)
 
-    # 2. Process the scraped HTML
-    data_file, html_file = process_html_data(html_content)
+    page = snapshot.html
+    if request.args.get("situation"):
+        # Filtered variants are rendered with the snapshot, never per request
+        page = snapshot.variants.get(request.args["situation"].upper())
+        if page is None:
+            return "Situação não encontrada neste boletim.", 404
+    return conditional_response(page, request, {
+        "X-Data-Age": str(snapshot.age_seconds()),
+        "X-Data-Timestamp": snapshot.generated_at.isoformat(),
+    })
 
-    if not html_file:
-        app.logger.error("Processamento do HTML falhou.")
-        return "Erro ao processar os dados do CEASA.", 500
+def query_document(snapshot, args, default_limit=None):
+    """Filtered/sorted/paginated records of snapshot as a JSON string. Raises QueryError."""
+    query = PriceQuery.from_args(args, default_limit=default_limit)
+    records, total, next_cursor = snapshot.index.query(query, version=snapshot.json.etag)
+    document = {
+        "timestamp": snapshot.generated_at.isoformat(),
+        "market": snapshot.market_name,
+        "bulletin_date": snapshot.bulletin_date or BULLETIN_DATE_NOT_FOUND,
+        "total": total,
+        "next_cursor": next_cursor,
+        "data": records,
+    }
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":"))
 
-    # 3. Return the generated HTML file
+def _query_response(snapshot, default_limit=None):
+    """Filtered/sorted/paginated records of snapshot, driven by the query string."""
     try:
-        return send_file(html_file)
-    except Exception as e:
-        app.logger.error(f"Erro ao servir arquivo HTML gerado {html_file}: {e}")
-        return "Erro ao servir os dados processados.", 500
+        body = query_document(snapshot, request.args, default_limit)
+    except QueryError as e:
+        return f"Parâmetro inválido: {e}", 400
+    return Response(
+        body,
+        mimetype="application/json",
+        headers={"X-Data-Age": str(snapshot.age_seconds())},
+    )
 
 @app.route("/data.json")
 def get_json_data():
+    """Whole bulletin, or a query over it when any PriceQuery parameter is given."""
     app.logger.info("Recebida requisição para /data.json")
-    if os.path.exists(DATA_FILE):
-        try:
-            return send_file(DATA_FILE, mimetype="application/json")
-        except Exception as e:
-            app.logger.error(f"Erro ao servir arquivo JSON {DATA_FILE}: {e}")
-            return "Erro ao servir arquivo JSON.", 500
-    else:
-        # Optionally trigger scraping if JSON doesn't exist?
-        # For now, just return error if file is missing.
-        app.logger.error(f"Arquivo JSON {DATA_FILE} não encontrado.")
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+    snapshot = _snapshots.get(market_value)
+    if snapshot is None:
+        app.logger.error(f"Dados JSON do mercado {market_value} ainda não disponíveis.")
         return "Arquivo de dados JSON não encontrado.", 404
+    if any(param in request.args for param in PriceQuery.PARAMS):
+        return _query_response(snapshot)
+    return conditional_response(snapshot.json, request, {"X-Data-Age": str(snapshot.age_seconds())})
+
+@app.route("/api/prices")
+def get_prices():
+    """Paginated price query over the latest bulletin (100 rows per page by default)."""
+    app.logger.info("Recebida requisição para /api/prices")
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+    snapshot = _snapshots.get(market_value)
+    if snapshot is None:
+        return "Dados ainda não disponíveis.", 404
+    return _query_response(snapshot, default_limit=DEFAULT_PAGE_SIZE)
+
+@app.route("/markets.json")
+def get_markets_json():
+    markets = [{"value": value, "name": name} for value, name in get_markets().items()]
+    return Response(json.dumps(markets, ensure_ascii=False), mimetype="application/json")
+
+@app.route("/api/history")
+def get_price_history():
+    """Price history. Query params: product (exact name), start/end (dd/mm/yyyy or yyyy-mm-dd),
+    market (value, as in the other routes; all markets without it)."""
+    app.logger.info("Recebida requisição para /api/history")
+    market_name = None
+    if request.args.get("market"):
+        market_value = _requested_market()
+        if market_value is None:
+            return "Mercado desconhecido.", 404
+        market_name = get_markets()[market_value]
+    try:
+        rows = _history.query_prices(
+            product=request.args.get("product"),
+            start_date=request.args.get("start"),
+            end_date=request.args.get("end"),
+            market=market_name,
+        )
+    except ValueError as e:
+        return f"Parâmetro de data inválido: {e}", 400
+    return Response(json.dumps(rows, ensure_ascii=False), mimetype="application/json")
+
+_changes_payloads = {} # (market name, from ISO date, to ISO date) -> Payload; diffs never change
+CHANGES_CACHE_SIZE = 512
+
+@app.route("/api/changes")
+def get_changes():
+    """What moved between two bulletins. Query params: since (required), until (default: latest), market."""
+    app.logger.info("Recebida requisição para /api/changes")
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+    market_name = get_markets()[market_value]
+    if not request.args.get("since"):
+        return "Parâmetro since é obrigatório.", 400
+    try:
+        since = to_iso_date(request.args["since"])
+        until = to_iso_date(request.args["until"]) if request.args.get("until") else _history.latest_bulletin_date(market_name)
+    except ValueError as e:
+        return f"Parâmetro de data inválido: {e}", 400
+
+    key = (market_name, since, until)
+    payload = _changes_payloads.get(key)
+    if payload is None:
+        changes = _history.changes(market_name, since, until) if until else None
+        if changes is None:
+            return "Boletim não encontrado no histórico.", 404
+        if len(_changes_payloads) >= CHANGES_CACHE_SIZE:
+            _changes_payloads.clear()
+        payload = _changes_payloads[key] = Payload(changes.encode("utf-8"), "application/json", datetime.now())
+    return conditional_response(payload, request)
+
+@app.route("/api/analytics/product")
+def get_product_analytics():
+    """Moving averages, spread, volatility and percentile rank of one product. Query params: product, package, market."""
+    app.logger.info("Recebida requisição para /api/analytics/product")
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+    if not request.args.get("product"):
+        return "Parâmetro product é obrigatório.", 400
+    analytics = analytics_cache().get(get_markets()[market_value])
+    stats = analytics.product_stats(request.args["product"], request.args.get("package")) if analytics else None
+    if stats is None:
+        return "Produto não encontrado no histórico.", 404
+    return Response(json.dumps(stats, ensure_ascii=False), mimetype="application/json")
+
+@app.route("/api/analytics/summary")
+def get_analytics_summary():
+    """Statistics of every product on the market's latest bulletin in the history."""
+    app.logger.info("Recebida requisição para /api/analytics/summary")
+    market_value = _requested_market()
+    if market_value is None:
+        return "Mercado desconhecido.", 404
+    analytics = analytics_cache().get(get_markets()[market_value])
+    if analytics is None:
+        return "Histórico vazio para este mercado.", 404
+    document = {"market": analytics.market, "bulletin_date": analytics.latest_date, "data": analytics.summary()}
+    return Response(json.dumps(document, ensure_ascii=False), mimetype="application/json")
+
+@app.route("/api/compare")
+def get_comparison():
+    """Product x market MIN/M.C./MAX matrix for one date. Query param: date (default: newest in the history)."""
+    app.logger.info("Recebida requisição para /api/compare")
+    try:
+        iso_date = to_iso_date(request.args["date"]) if request.args.get("date") else _history.latest_bulletin_date()
+    except ValueError as e:
+        return f"Parâmetro de data inválido: {e}", 400
+    payload = comparison_cache().get(iso_date) if iso_date else None
+    if payload is None:
+        return "Nenhum boletim desta data no histórico.", 404
+    return conditional_response(payload, request)
+
+@app.route("/api/search")
+def search_products():
+    """Accent- and typo-tolerant product name search. Query params: q (required), market (optional scope), limit."""
+    app.logger.info("Recebida requisição para /api/search")
+    query = request.args.get("q", "").strip()
+    if not query:
+        return "Parâmetro q é obrigatório.", 400
+    market_name = None
+    if request.args.get("market"):
+        market_value = _requested_market()
+        if market_value is None:
+            return "Mercado desconhecido.", 404
+        market_name = get_markets()[market_value]
+    try:
+        limit = int(request.args.get("limit") or SEARCH_DEFAULT_LIMIT)
+    except ValueError:
+        return "Parâmetro inválido: limit deve ser um número inteiro", 400
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return f"Parâmetro inválido: limit deve estar entre 1 e {SEARCH_MAX_LIMIT}", 400
+    document = {"query": query, "market": market_name, "data": _search.get().search(query, market_name, limit)}
+    return Response(json.dumps(document, ensure_ascii=False), mimetype="application/json")
+
+# Warm the snapshot before the first request and keep it fresh in the background
+load_snapshot_from_disk()
+if WARMUP_MODULES:
+    start_warm_up()
+if SCHEDULER_ENABLED:
+    start_scheduler()
 
 if __name__ == "__main__":
     # Run Flask app - listen on all interfaces for Render compatibility
@@ -0,0 +1,347 @@
+# asgi_app.py
+# ASGI service mode: one event loop runs the request handling, the
+# background scheduler and the scrapes of every market (async HTTP engine
+# and async Playwright, async_engines.py), so a single process serves many
+# concurrent readers while refreshes run, without more gunicorn workers:
+#
+#   uvicorn asgi_app:application --host 0.0.0.0 --port 8080
+#
+# The snapshot routes (/, /data.json, /api/prices, /markets.json, /metrics
+# and /static) are answered on the loop straight from the SnapshotStore of
+# app.py. Every other route is handed to the Flask app in a worker thread,
+# so the history, changes and analytics endpoints behave exactly the same.
+import os
+
+# app.py starts its thread-based scheduler on import unless told not to;
+# here the event loop below does the refreshing
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+import asyncio
+import io
+import json
+import mimetypes
+import sys
+import time
+import logging
+from urllib.parse import parse_qsl
+import app as wsgi
+from async_engines import AsyncHostLimiter, AsyncHttpFetchEngine, AsyncBrowserPool, AsyncPlaywrightFetchEngine, AsyncFetchStage
+from bulletin_probe import BulletinProbe
+from http_cache import negotiate
+from metrics import REGISTRY, CONTENT_TYPE, STALE_SERVED, REQUEST_SECONDS
+from page_renderer import STATIC_DIR
+from price_query import PriceQuery, QueryError, DEFAULT_PAGE_SIZE
+from single_flight import AsyncSingleFlight
+from ingestion import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+STATIC_MAX_AGE_SECONDS = 365 * 24 * 3600 # Assets are referenced with a content hash (?v=...)
+
+# --- Async fetch engines, same configuration as app.py ---
+_host_limiter = AsyncHostLimiter(max_concurrent=wsgi.HOST_MAX_CONCURRENT_REQUESTS, min_interval=wsgi.HOST_MIN_REQUEST_INTERVAL_SECONDS)
+_browser_pool = AsyncBrowserPool(
+    size=wsgi.BROWSER_POOL_SIZE,
+    recycle_after_jobs=wsgi.BROWSER_RECYCLE_AFTER_SCRAPES,
+    recycle_after_seconds=wsgi.BROWSER_RECYCLE_AFTER_SECONDS,
+)
+_engines_by_name = {
+    "http": AsyncHttpFetchEngine(timeout=wsgi.HTTP_TIMEOUT_SECONDS, limiter=_host_limiter, clients=wsgi.MARKET_WORKERS),
+    "playwright": AsyncPlaywrightFetchEngine(_browser_pool, timeout=wsgi.BROWSER_JOB_TIMEOUT_SECONDS, limiter=_host_limiter),
+}
+_fetch_engines = [_engines_by_name[name] for name in wsgi.FETCH_ENGINES if name in _engines_by_name]
+# app.py's pipeline (publish into its SnapshotStore, persist through its writer) with an awaitable fetch
+_pipeline = wsgi._pipeline.replace("fetch", AsyncFetchStage(_fetch_engines))
+_probe = BulletinProbe(
+    _engines_by_name["http"], wsgi._known_bulletin_date,
+    learn=_engines_by_name["playwright"].list_dates if "playwright" in wsgi.FETCH_ENGINES else None,
+)
+
+# --- Refresh on the event loop ---
+_scrape_flights = AsyncSingleFlight()
+_market_slots = asyncio.Semaphore(wsgi.MARKET_WORKERS)
+_background = set() # Running background tasks, referenced so they are not collected
+
+async def discover_markets():
+    discovered = await _engines_by_name["http"].list_markets()
+    # Loads the snapshots left on disk for new markets
+    return await asyncio.to_thread(wsgi.set_markets, discovered)
+
+async def _scrape_and_process(market_value):
+    wsgi._last_refresh_attempt[market_value] = time.monotonic()
+    market_name = wsgi.get_markets().get(market_value, wsgi.TARGET_MARKET_NAME)
+    logger.info(f"Iniciando atualização do mercado {market_value} (motores: {', '.join(e.name for e in _fetch_engines)})...")
+    async with _market_slots:
+        job = await _pipeline.run_async(IngestionJob(market_value, market_name))
+    return wsgi._record_refresh(market_value, job)
+
+async def refresh_data(market_value=wsgi.TARGET_MARKET_VALUE, wait_timeout=wsgi.SCRAPE_WAIT_TIMEOUT_SECONDS):
+    """app.refresh_data() on the event loop: one scrape per market at a time,
+    shared by every caller. False when it failed or the wait timed out."""
+    key = (market_value, wsgi.LATEST_DATE_KEY)
+    return bool(await _scrape_flights.run(key, lambda: _scrape_and_process(market_value), wait_timeout))
+
+async def refresh_markets(market_values=None):
+    """Refresh several markets concurrently (at most MARKET_WORKERS at a time). Returns {market value: success}."""
+    market_values = list(market_values or wsgi.get_markets())
+    results = await asyncio.gather(*(refresh_data(market_value, wait_timeout=None) for market_value in market_values))
+    return dict(zip(market_values, results))
+
+async def probe_market(market_value):
+    """app.probe_market() with the async HTTP engine."""
+    wsgi._last_probe[market_value] = time.monotonic()
+    return wsgi._record_probe(market_value, await _probe.check_async(market_value))
+
+def refresh_in_background(market_value):
+    """Start a refresh task unless one is running or failed recently."""
+    if _scrape_flights.in_flight((market_value, wsgi.LATEST_DATE_KEY)) or wsgi._recently_attempted(market_value):
+        return
+    task = asyncio.ensure_future(refresh_data(market_value, wait_timeout=None))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+async def _scheduler_loop():
+    logger.info("Agendador de atualização (asyncio) iniciado.")
+    while True:
+        try:
+            if not wsgi._markets_discovered:
+                await discover_markets()
+            interval = wsgi.current_refresh_interval()
+            to_probe = wsgi._markets_to_probe()
+            probed = await asyncio.gather(*(probe_market(market_value) for market_value in to_probe))
+            due = wsgi._due_markets(dict(zip(to_probe, probed)))
+            if due:
+                await refresh_markets(due)
+            ages = [wsgi._market_age(market_value) for market_value in wsgi.get_markets()]
+            oldest = max((age for age in ages if age is not None), default=interval)
+            await asyncio.sleep(max(1, min(interval - oldest, 60)) if oldest < interval else 60)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Erro no agendador de atualização.")
+            await asyncio.sleep(60)
+
+# --- Requests ---
+class Headers(dict):
+    """Request headers keyed by lower-case name; get() is case-insensitive like Flask's."""
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+class Request:
+    """What the native handlers need from an ASGI scope."""
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {}
+        for name, value in parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True):
+            self.args.setdefault(name, value) # First value wins, as with Flask's request.args.get
+        self.headers = Headers()
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1").lower(), value.decode("latin-1")
+            self.headers[name] = f"{self.headers[name]},{value}" if name in self.headers else value
+
+def _content_type(mimetype):
+    return f"{mimetype}; charset=utf-8" if mimetype.startswith("text/") else mimetype
+
+def _text(status, message):
+    return status, message.encode("utf-8"), {"Content-Type": "text/html; charset=utf-8"}
+
+def _json(document, headers=None):
+    body = document if isinstance(document, str) else json.dumps(document, ensure_ascii=False)
+    return 200, body.encode("utf-8"), {"Content-Type": "application/json", **(headers or {})}
+
+def _conditional(request, payload, headers=None):
+    status, body, response_headers = negotiate(payload, request.headers, headers)
+    if status == 200:
+        response_headers["Content-Type"] = _content_type(payload.mimetype)
+    return status, body, response_headers
+
+async def _requested_market(request):
+    market_value = request.args.get("market", wsgi.TARGET_MARKET_VALUE)
+    if market_value not in wsgi.get_markets() and not wsgi._markets_discovered:
+        await discover_markets()
+    return market_value if market_value in wsgi.get_markets() else None
+
+async def get_data(request):
+    """app.get_data(): the bulletin page, refreshed on the loop when cold, expired or ?refresh=1."""
+    market_value = await _requested_market(request)
+    if market_value is None:
+        return _text(404, "Mercado desconhecido.")
+    snapshot = wsgi._snapshots.get(market_value)
+    if snapshot is None or request.args.get("refresh") == "1":
+        refreshed = await refresh_data(market_value)
+        snapshot = wsgi._snapshots.get(market_value)
+        if snapshot is None:
+            logger.error("Scraping falhou e não há dados antigos para servir.")
+            return _text(500, "Erro ao obter dados do CEASA.")
+        if not refreshed:
+            STALE_SERVED.inc(market=market_value, reason="refresh_failed")
+    elif wsgi._market_age(market_value) >= wsgi.current_refresh_interval():
+        STALE_SERVED.inc(market=market_value, reason="expired")
+        refresh_in_background(market_value)
+
+    page = snapshot.html
+    if request.args.get("situation"):
+        page = snapshot.variants.get(request.args["situation"].upper())
+        if page is None:
+            return _text(404, "Situação não encontrada neste boletim.")
+    return _conditional(request, page, {
+        "X-Data-Age": str(snapshot.age_seconds()),
+        "X-Data-Timestamp": snapshot.generated_at.isoformat(),
+    })
+
+def _query(request, snapshot, default_limit=None):
+    try:
+        body = wsgi.query_document(snapshot, request.args, default_limit)
+    except QueryError as e:
+        return _text(400, f"Parâmetro inválido: {e}")
+    return _json(body, {"X-Data-Age": str(snapshot.age_seconds())})
+
+async def get_json_data(request):
+    market_value = await _requested_market(request)
+    if market_value is None:
+        return _text(404, "Mercado desconhecido.")
+    snapshot = wsgi._snapshots.get(market_value)
+    if snapshot is None:
+        return _text(404, "Arquivo de dados JSON não encontrado.")
+    if any(param in request.args for param in PriceQuery.PARAMS):
+        return _query(request, snapshot)
+    return _conditional(request, snapshot.json, {"X-Data-Age": str(snapshot.age_seconds())})
+
+async def get_prices(request):
+    market_value = await _requested_market(request)
+    if market_value is None:
+        return _text(404, "Mercado desconhecido.")
+    snapshot = wsgi._snapshots.get(market_value)
+    if snapshot is None:
+        return _text(404, "Dados ainda não disponíveis.")
+    return _query(request, snapshot, default_limit=DEFAULT_PAGE_SIZE)
+
+async def get_markets_json(request):
+    return _json([{"value": value, "name": name} for value, name in wsgi.get_markets().items()])
+
+async def get_metrics(request):
+    return 200, REGISTRY.render().encode("utf-8"), {"Content-Type": CONTENT_TYPE}
+
+_static_files = {} # name -> (body, content type); the assets never change while running
+
+async def get_static(request):
+    name = request.path[len("/static/"):]
+    if name not in _static_files:
+        path = os.path.join(STATIC_DIR, name)
+        if "/" in name or name.startswith(".") or not os.path.isfile(path):
+            return _text(404, "Arquivo não encontrado.")
+        with open(path, "rb") as f:
+            _static_files[name] = (f.read(), mimetypes.guess_type(name)[0] or "application/octet-stream")
+    body, mimetype = _static_files[name]
+    return 200, body, {"Content-Type": _content_type(mimetype), "Cache-Control": f"public, max-age={STATIC_MAX_AGE_SECONDS}"}
+
+ROUTES = {
+    "/": get_data,
+    "/data.json": get_json_data,
+    "/api/prices": get_prices,
+    "/markets.json": get_markets_json,
+    "/metrics": get_metrics,
+}
+
+# --- Everything else: the Flask app, in a worker thread ---
+def _wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _call_wsgi(environ):
+    started = []
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(" ", 1)[0]), headers]
+    result = wsgi.app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    status, headers = started
+    return status, body, headers
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def _send(send, status, body, headers, head_only=False):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": b"" if head_only else body})
+
+async def _lifespan(receive, send):
+    scheduler = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if SCHEDULER_ENABLED:
+                scheduler = asyncio.ensure_future(_scheduler_loop())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if scheduler is not None:
+                scheduler.cancel()
+            await _engines_by_name["http"].aclose()
+            await _browser_pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    started = time.perf_counter()
+    handler = ROUTES.get(scope["path"]) or (get_static if scope["path"].startswith("/static/") else None)
+    if handler is None or scope["method"] not in ("GET", "HEAD"):
+        # Flask observes its own route latency
+        status, body, headers = await asyncio.to_thread(_call_wsgi, _wsgi_environ(scope, await _read_body(receive)))
+        return await _send(send, status, body, headers)
+    request = Request(scope)
+    try:
+        status, body, headers = await handler(request)
+    except Exception:
+        logger.exception(f"Erro ao servir {request.path}")
+        status, body, headers = _text(500, "Erro interno.")
+    headers.setdefault("Content-Length", str(len(body)))
+    await _send(send, status, body, headers.items(), head_only=request.method == "HEAD")
+    route = "/static/<path:filename>" if handler is get_static else request.path
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+
+if __name__ == "__main__":
+    import uvicorn # pip install uvicorn httpx
+    uvicorn.run(application, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,356 @@
+# async_engines.py
+# asyncio counterparts of fetch_engines.py and browser_pool.py for the ASGI
+# service (asgi_app.py): the same ScriptCase form replay over an
+# httpx.AsyncClient and the same browser walk on playwright.async_api, so
+# the scrapes of every market share the service's event loop instead of
+# each holding a thread for the whole navigation.
+import asyncio
+import time
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+from fetch_engines import (
+    FILTER_URL, POST_URL, HEADERS, MARKET_PARAM_NAME, LATEST_DATE_OPTION_INDEX,
+    MARKET_SELECT_INDEX, DATE_SELECT_INDEX, OK_BUTTON_INDEX,
+    NAVIGATION_TIMEOUT_MS, BLOCKED_RESOURCE_TYPES, RESULTS_SELECTOR, DATE_OPTIONS_READY_JS, is_bulletin_response,
+    decode_response, validate_bulletin_html, parse_date_options, parse_market_options,
+    parse_hidden_fields, build_form_payload, date_requests, match_date_request,
+)
+from browser_pool import DEFAULT_LAUNCH_ARGS, BrowserCrashedError
+from ingestion import IngestionError
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- Politeness ---
+class AsyncHostLimiter:
+    """HostLimiter for coroutines: at most max_concurrent requests in flight and
+    at least min_interval seconds between request starts to the same host.
+    Only used from the service's event loop, so it needs no lock."""
+
+    def __init__(self, max_concurrent=4, min_interval=0.25):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._hosts = {} # host -> [semaphore, last_start]
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlsplit(url).netloc
+        state = self._hosts.setdefault(host, [asyncio.Semaphore(self.max_concurrent), 0.0])
+        async with state[0]:
+            wait = state[1] + self.min_interval - time.monotonic()
+            state[1] = max(state[1] + self.min_interval, time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+
+_unlimited = AsyncHostLimiter(max_concurrent=1000, min_interval=0)
+
+# --- Engines ---
+class AsyncHttpFetchEngine:
+    """HttpFetchEngine on httpx.AsyncClient.
+
+    Each client keeps its own ScriptCase cookies, like the per-thread
+    sessions of the sync engine, so up to `clients` form replays run at once
+    while keep-alive connections are reused between scrapes.
+    """
+
+    name = "http"
+
+    def __init__(self, timeout=30, limiter=None, clients=4):
+        self.timeout = timeout
+        self.limiter = limiter or _unlimited
+        self.clients = clients
+        self._idle = None # asyncio.Queue of clients, created on the service's loop
+
+    def _new_client(self):
+        return httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=self.timeout,
+            # A pooled keep-alive connection may have been closed by the server;
+            # retry once on a fresh one (the form POST is a read-only search)
+            transport=httpx.AsyncHTTPTransport(retries=1),
+        )
+
+    @asynccontextmanager
+    async def _client(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.clients):
+                self._idle.put_nowait(None) # Created on first use
+        client = await self._idle.get()
+        try:
+            if client is None or client.is_closed:
+                client = self._new_client()
+            yield client
+        finally:
+            self._idle.put_nowait(client)
+
+    async def get_filter_page(self, client, params=None):
+        async with self.limiter.slot(FILTER_URL):
+            with STEP_SECONDS.time(step="http_get_filter"):
+                response = await client.get(FILTER_URL, params=params)
+        response.raise_for_status()
+        return decode_response(response)
+
+    async def list_markets(self):
+        """Discover the markets offered by the filter form. Returns [] on failure."""
+        try:
+            async with self._client() as client:
+                return parse_market_options(await self.get_filter_page(client))
+        except httpx.HTTPError as e:
+            logger.error(f"[http] Erro ao listar mercados: {e}")
+            return []
+
+    async def list_dates(self, market_value):
+        """HttpFetchEngine.list_dates: the filter page's dates, else the recorded date-list call replayed."""
+        try:
+            async with self._client() as client:
+                filter_page = await self.get_filter_page(client, {MARKET_PARAM_NAME: market_value})
+                dates = parse_date_options(filter_page)
+                recorded = date_requests.get()
+                if dates or recorded is None:
+                    return dates
+                method, url, params, data, headers = recorded.build(market_value, parse_hidden_fields(filter_page))
+                fields = {}
+                for name, value in data or ():
+                    fields.setdefault(name, []).append(value)
+                async with self.limiter.slot(url):
+                    with STEP_SECONDS.time(step="http_date_list"):
+                        response = await client.request(method, url, params=params, data=fields or None, headers=headers)
+                response.raise_for_status()
+                return parse_date_options(decode_response(response))
+        except httpx.HTTPError as e:
+            logger.error(f"[http] Erro ao listar datas do mercado {market_value}: {e}")
+            return []
+
+    async def fetch(self, market_value, date_value=None):
+        async with self._client() as client:
+            try:
+                logger.info(f"[http] GET {FILTER_URL}")
+                payload = build_form_payload(parse_hidden_fields(await self.get_filter_page(client)), market_value, date_value)
+                logger.info(f"[http] POST {POST_URL} com {len(payload)} parâmetros...")
+                async with self.limiter.slot(POST_URL):
+                    with STEP_SECONDS.time(step="http_post_bulletin"):
+                        response = await client.post(POST_URL, data=payload, timeout=self.timeout * 2)
+                response.raise_for_status()
+                return decode_response(response)
+            except httpx.HTTPError as e:
+                logger.error(f"[http] Erro de requisição: {e}")
+                # Drop the client so the next attempt starts with fresh cookies
+                await client.aclose()
+                return None
+
+    async def aclose(self):
+        while self._idle is not None and not self._idle.empty():
+            client = self._idle.get_nowait()
+            if client is not None:
+                await client.aclose()
+
+class AsyncBrowserPool:
+    """One warm Chromium on playwright.async_api, shared by up to `size`
+    pages at once (each in a fresh context). The browser is relaunched when
+    it crashes and recycled, once idle, after recycle_after_jobs scrapes or
+    recycle_after_seconds of uptime."""
+
+    def __init__(self, size=1, recycle_after_jobs=50, recycle_after_seconds=3600, launch_args=None, context_options=None):
+        self.size = size
+        self.recycle_after_jobs = recycle_after_jobs
+        self.recycle_after_seconds = recycle_after_seconds
+        self.launch_args = launch_args or DEFAULT_LAUNCH_ARGS
+        self.context_options = context_options or {}
+        self.playwright = None
+        self.browser = None
+        self.launched_at = None
+        self.jobs_done = 0
+        self._pages = None
+        self._launch_lock = None
+        self._active = 0
+
+    async def _launch(self):
+        from playwright.async_api import async_playwright
+        logger.info("[async-browser] Iniciando Chromium...")
+        with STEP_SECONDS.time(step="browser_launch"):
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=True, args=self.launch_args)
+        self.launched_at = time.monotonic()
+        self.jobs_done = 0
+
+    async def _close(self):
+        try:
+            if self.browser:
+                await self.browser.close()
+        except Exception as e:
+            logger.warning(f"[async-browser] Erro ao fechar navegador: {e}")
+        try:
+            if self.playwright:
+                await self.playwright.stop()
+        except Exception as e:
+            logger.warning(f"[async-browser] Erro ao encerrar Playwright: {e}")
+        self.browser = None
+        self.playwright = None
+        self.launched_at = None
+
+    def _needs_recycle(self):
+        if self.jobs_done >= self.recycle_after_jobs:
+            return True
+        return time.monotonic() - self.launched_at >= self.recycle_after_seconds
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            if self.browser is not None and not self.browser.is_connected():
+                logger.warning("[async-browser] Navegador desconectado. Reiniciando.")
+                await self._close()
+            elif self.browser is not None and self._active == 0 and self._needs_recycle():
+                logger.info(f"[async-browser] Reciclando navegador ({self.jobs_done} scrapes).")
+                await self._close()
+            if self.browser is None:
+                await self._launch()
+            return self.browser
+
+    async def _run_job(self, fn):
+        async with self._pages:
+            browser = await self._ensure_browser()
+            self._active += 1
+            context = await browser.new_context(**self.context_options)
+            try:
+                return await fn(await context.new_page())
+            except Exception:
+                if not browser.is_connected():
+                    raise BrowserCrashedError("Navegador caiu durante o scraping.")
+                raise
+            finally:
+                self._active -= 1
+                self.jobs_done += 1
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+
+    async def run(self, fn, timeout=None):
+        """Await fn(page) on the pooled browser. Raises asyncio.TimeoutError after timeout."""
+        if self._pages is None:
+            self._pages = asyncio.Semaphore(self.size)
+            self._launch_lock = asyncio.Lock()
+        try:
+            return await asyncio.wait_for(self._run_job(fn), timeout)
+        except BrowserCrashedError:
+            logger.warning("[async-browser] Repetindo scraping após queda do navegador.")
+            return await asyncio.wait_for(self._run_job(fn), timeout)
+
+    async def shutdown(self):
+        await self._close()
+
+# --- Browser page walks (mirror fetch_engines.scrape_bulletin_page) ---
+async def _route_resource(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def _select_market(page, market_value, date_value=None, record_dates=False):
+    await page.route("**/*", _route_resource)
+    logger.info(f"Navegando para {FILTER_URL}")
+    with STEP_SECONDS.time(step="page_goto"):
+        await page.goto(FILTER_URL, timeout=NAVIGATION_TIMEOUT_MS, wait_until="domcontentloaded")
+    requests_seen = []
+    if record_dates or date_requests.get() is None:
+        page.on("requestfinished", requests_seen.append)
+    with STEP_SECONDS.time(step="select_market"):
+        await page.locator("select").nth(MARKET_SELECT_INDEX - 1).select_option(value=market_value)
+    logger.info(f"Mercado selecionado: {market_value}")
+    with STEP_SECONDS.time(step="date_options_wait"):
+        await page.wait_for_function(
+            DATE_OPTIONS_READY_JS, arg=[DATE_SELECT_INDEX - 1, LATEST_DATE_OPTION_INDEX, date_value],
+            timeout=NAVIGATION_TIMEOUT_MS,
+        )
+    if requests_seen:
+        page.remove_listener("requestfinished", requests_seen.append)
+        await _record_date_request(page, requests_seen, market_value)
+
+async def _record_date_request(page, requests_seen, market_value):
+    dates = parse_date_options(await page.content())
+    candidates = []
+    for request in requests_seen:
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or request.url.split("?")[0] == FILTER_URL and request.method == "GET":
+            continue
+        response = await request.response()
+        try:
+            text = await response.text() if response else None
+        except Exception:
+            continue
+        candidates.append((request.method, request.url, request.post_data, request.headers, text))
+    recorded = match_date_request(candidates, market_value, dates)
+    if recorded is not None:
+        await asyncio.to_thread(date_requests.save, recorded)
+
+async def scrape_bulletin_page(page, market_value, date_value=None):
+    await _select_market(page, market_value, date_value)
+    date_select = page.locator("select").nth(DATE_SELECT_INDEX - 1)
+    with STEP_SECONDS.time(step="select_date"):
+        if date_value:
+            await date_select.select_option(value=date_value)
+        else:
+            await date_select.select_option(index=LATEST_DATE_OPTION_INDEX)
+    with STEP_SECONDS.time(step="click_ok"):
+        async with page.expect_response(is_bulletin_response, timeout=NAVIGATION_TIMEOUT_MS):
+            await page.locator(f":nth-match(a:has-text(\"Ok\"), {OK_BUTTON_INDEX})").click()
+    with STEP_SECONDS.time(step="results_wait"):
+        await page.wait_for_selector(RESULTS_SELECTOR, state="attached", timeout=NAVIGATION_TIMEOUT_MS)
+    logger.info(f"Página de resultados carregada: {page.url}")
+    return await page.content()
+
+async def list_dates_page(page, market_value):
+    await _select_market(page, market_value, record_dates=True)
+    return parse_date_options(await page.content())
+
+class AsyncPlaywrightFetchEngine:
+    """Runs the page walks above on an AsyncBrowserPool."""
+
+    name = "playwright"
+
+    def __init__(self, pool, timeout=180, limiter=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.limiter = limiter or _unlimited
+
+    async def _run(self, fn):
+        async with self.limiter.slot(FILTER_URL):
+            return await self.pool.run(fn, timeout=self.timeout)
+
+    async def fetch(self, market_value, date_value=None):
+        try:
+            return await self._run(lambda page: scrape_bulletin_page(page, market_value, date_value))
+        except Exception as e:
+            logger.error(f"[playwright] Erro durante o scraping: {e!r}")
+            return None
+
+    async def list_dates(self, market_value):
+        try:
+            return await self._run(lambda page: list_dates_page(page, market_value))
+        except Exception as e:
+            logger.error(f"[playwright] Erro ao listar datas do mercado {market_value}: {e!r}")
+            return []
+
+async def fetch_with_fallback(engines, market_value, date_value=None):
+    """fetch_engines.fetch_with_fallback for async engines: (html_content, engine_name) or (None, None)."""
+    for engine in engines:
+        html_content = await engine.fetch(market_value, date_value)
+        problem = validate_bulletin_html(html_content)
+        if problem is None:
+            logger.info(f"Boletim obtido com o motor '{engine.name}'.")
+            return html_content, engine.name
+        logger.warning(f"Motor '{engine.name}' falhou na validação: {problem}.")
+    return None, None
+
+class AsyncFetchStage:
+    """ingestion.FetchStage for Pipeline.run_async()."""
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    async def __call__(self, job):
+        job.html, job.engine = await fetch_with_fallback(self.engines, job.market_value, job.date_value)
+        if job.html is None:
+            raise IngestionError("falha no download")
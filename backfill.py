@@ -0,0 +1,147 @@
+# backfill.py
+# Loads past bulletins into the history store by walking the date dropdown
+# of every market. Progress is checkpointed after each bulletin, so an
+# interrupted run picks up where it stopped instead of refetching.
+#
+#   python backfill.py                      # every market, every listed date
+#   python backfill.py --markets 211 --since 2024-01-01 --workers 4
+import argparse
+import json
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fetch_engines import HttpFetchEngine, PlaywrightFetchEngine, HostLimiter, list_dates_with_fallback
+from history_store import HistoryStore
+from ingestion import IngestionJob, HistoryStage, build_pipeline
+from raw_archive import RawArchive
+
+HISTORY_DB_FILE = os.environ.get("HISTORY_DB_FILE", "ceasa_history.sqlite3")
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "ceasa_archive") # Columnar history archive kept in step, as in app.py ("" disables)
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR", "ceasa_raw") # Downloaded pages are archived too ("" disables)
+CHECKPOINT_FILE = "backfill_checkpoint.jsonl"
+TARGET_MARKET_NAME = "CEASA GRANDE VITÓRIA"
+TARGET_MARKET_VALUE = "211"
+
+logger = logging.getLogger("backfill")
+
+class Checkpoint:
+    """Finished (market value, date value) pairs, kept in an append-only JSON
+    lines file so recording progress costs one small write per bulletin."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # Last line cut short by an interruption
+                    pair = (entry["market"], entry["date"])
+                    if entry["status"] == "done":
+                        self.done.add(pair)
+                        self.failed.pop(pair, None)
+                    else:
+                        self.failed[pair] = entry.get("reason")
+            logger.info(f"Checkpoint carregado: {len(self.done)} boletins já processados.")
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _append(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def mark_done(self, market_value, date_value):
+        self.done.add((market_value, date_value))
+        self._append({"market": market_value, "date": date_value, "status": "done"})
+
+    def mark_failed(self, market_value, date_value, reason):
+        self.failed[(market_value, date_value)] = reason
+        self._append({"market": market_value, "date": date_value, "status": "failed", "reason": reason})
+
+    def close(self):
+        self._file.close()
+
+def backfill_one(pipeline, checkpoint, market_value, market_name, date_value, iso_date):
+    job = pipeline.run(IngestionJob(market_value, market_name, date_value=date_value, requested_date=iso_date))
+    if job.ok:
+        checkpoint.mark_done(market_value, date_value)
+    else:
+        checkpoint.mark_failed(market_value, date_value, job.error)
+    return job
+
+def plan_backfill(engines, history, checkpoint, markets, since=None, until=None):
+    """(market value, market name, date value, iso date) pairs still missing."""
+    pending = []
+    for market_value, market_name in markets.items():
+        dates = list_dates_with_fallback(engines, market_value)
+        logger.info(f"{market_name}: {len(dates)} datas disponíveis.")
+        for date_value, iso_date in dates:
+            if since and iso_date < since or until and iso_date > until:
+                continue
+            if (market_value, date_value) in checkpoint.done or history.has_bulletin(market_name, iso_date):
+                continue
+            pending.append((market_value, market_name, date_value, iso_date))
+    return pending
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Carrega boletins antigos no histórico.")
+    arg_parser.add_argument("--markets", nargs="*", help="Valores dos mercados (padrão: todos)")
+    arg_parser.add_argument("--since", help="Data inicial (AAAA-MM-DD)")
+    arg_parser.add_argument("--until", help="Data final (AAAA-MM-DD)")
+    arg_parser.add_argument("--workers", type=int, default=4, help="Boletins baixados ao mesmo tempo")
+    arg_parser.add_argument("--min-interval", type=float, default=0.5, help="Intervalo mínimo entre requisições ao servidor (s)")
+    arg_parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    arg_parser.add_argument("--no-browser", action="store_true", help="Usar apenas o motor HTTP")
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    limiter = HostLimiter(max_concurrent=args.workers, min_interval=args.min_interval)
+    http_engine = HttpFetchEngine(limiter=limiter)
+    engines = [http_engine]
+    pool = None
+    if not args.no_browser:
+        from browser_pool import BrowserPool
+        pool = BrowserPool(size=1)
+        engines.append(PlaywrightFetchEngine(pool, limiter=limiter))
+
+    history = HistoryStore(HISTORY_DB_FILE)
+    checkpoint = Checkpoint(args.checkpoint)
+    # Same stages as the app, minus rendering; bulletins only go to the history
+    pipeline = build_pipeline(
+        engines, render=False, persist=[("persist", HistoryStage(history, ARCHIVE_DIR or None))],
+        raw_archive=RawArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None,
+    )
+
+    markets = dict(http_engine.list_markets()) or {TARGET_MARKET_VALUE: TARGET_MARKET_NAME}
+    if TARGET_MARKET_VALUE in markets:
+        markets[TARGET_MARKET_VALUE] = TARGET_MARKET_NAME # Same history key as app.py
+    if args.markets:
+        markets = {value: markets.get(value, value) for value in args.markets}
+
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill")
+    try:
+        pending = plan_backfill(engines, history, checkpoint, markets, args.since, args.until)
+        print(f"{len(pending)} boletins para baixar.")
+        finished = stored = failed = 0
+        futures = [executor.submit(backfill_one, pipeline, checkpoint, *item) for item in pending]
+        for future in as_completed(futures):
+            job = future.result()
+            finished, stored, failed = finished + 1, stored + job.stored, failed + (not job.ok)
+            if finished % 25 == 0:
+                print(f"Progresso: {finished}/{len(pending)} ({failed} falhas)")
+        print(f"\n--- Backfill concluído: {stored} boletins novos, {finished - stored - failed} já no histórico, {failed} falhas ---")
+    except KeyboardInterrupt:
+        print("\nInterrompido. Execute novamente para continuar do checkpoint.")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        checkpoint.close()
+        if pool:
+            pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench_parser.py
+# Compares the old BeautifulSoup + pandas.read_html processing with the
+# single-pass bulletin_parser on post_response.html and on synthetic
+# bulletins with 10x/100x/1000x as many rows.
+#
+#   python bench_parser.py [--repeat 5]
+import argparse
+import re
+import time
+from io import StringIO
+from bs4 import BeautifulSoup
+import pandas as pd
+from bulletin_parser import parse_bulletin
+
+SAMPLE_FILE = "post_response.html"
+SCALES = [1, 10, 100, 1000]
+
+def legacy_parse(html_content):
+    """The processing done by app.process_html_data() before bulletin_parser."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    data_table = None
+    grid_body_div = soup.find("div", id="sc_grid_body")
+    if grid_body_div:
+        data_table = grid_body_div.find("table", class_="scGridTabela")
+    if not data_table:
+        for table in soup.find_all("table"):
+            if table.get("border") == "1" and "Produtos" in table.text:
+                data_table = table
+                break
+    df = pd.read_html(StringIO(str(data_table)), header=0, decimal=",", thousands=".")[0]
+    df = df.dropna(how="all")
+    df.columns = ["Produtos", "Embalagem", "MIN", "M.C.", "MAX", "Situação"]
+    df = df.dropna(subset=["MIN", "M.C.", "MAX"], how="all")
+    for col in ["MIN", "M.C.", "MAX"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    soup.find("title")
+    soup.find("td", class_="scGridLabel")
+    soup.find(lambda tag: tag.name == "td" and "Data Pesquisada:" in tag.get_text())
+    return df.to_dict(orient="records")
+
+def synthetic_bulletin(sample_html, scale):
+    """Repeat the sample's data rows `scale` times inside the same page."""
+    rows = re.findall(r"<tr><td>.*?</tr>", sample_html)
+    body = "\n".join(rows * scale)
+    return re.sub(r"(</tr>\s*)(<tr><td>.*</tr>)", lambda m: m.group(1) + body, sample_html, count=1, flags=re.S)
+
+def best_of(fn, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    with open(SAMPLE_FILE, "r", encoding="utf-8") as f:
+        sample_html = f.read()
+
+    print(f"{'linhas':>8} {'legado (ms)':>12} {'parser (ms)':>12} {'ganho':>7}")
+    for scale in SCALES:
+        html_content = synthetic_bulletin(sample_html, scale)
+        rows = len(parse_bulletin(html_content).rows)
+        assert rows == len(legacy_parse(html_content)), "parsers disagree on row count"
+        repeat = args.repeat if scale < 1000 else max(1, args.repeat // 2)
+        legacy = best_of(legacy_parse, html_content, repeat)
+        single_pass = best_of(parse_bulletin, html_content, repeat)
+        print(f"{rows:>8} {legacy * 1000:>12.2f} {single_pass * 1000:>12.2f} {legacy / single_pass:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
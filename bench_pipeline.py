@@ -0,0 +1,210 @@
+# bench_pipeline.py
+# End-to-end benchmark of the ingestion pipeline against fixture_server.py,
+# so runs are offline and repeatable: fetch (HTTP form replay as in
+# scraper.py, or the Playwright browser walk as in the app), parse,
+# normalize, validate, render and persist, on post_response.html and on
+# synthetic bulletins with 10x/100x/1000x as many rows.
+#
+# Each (engine, scale) scenario runs in its own Python process, so its peak
+# RSS is not inflated by the scenarios before it. Results (latency
+# percentiles, throughput, peak RSS and per-stage times) are printed and
+# written as JSON, to be compared between commits:
+#
+#   python bench_pipeline.py [--engines http,playwright] [--scales 1,10,100,1000]
+#                            [--repeat 20] [--concurrency 1] [--latency 0]
+#                            [--output results.json] [--compare previous.json]
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fixture_server import FixtureServer
+
+ENGINES = ["http", "playwright"]
+SCALES = [1, 10, 100, 1000]
+RESULTS_DIR = "bench_results"
+MARKET_VALUE = "211"
+MARKET_NAME = "CEASA GRANDE VITÓRIA"
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return {}
+    return {
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 0.50), 3),
+        "p90": round(percentile(values, 0.90), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "max": round(values[-1], 3),
+    }
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# --- Worker: one scenario, in a fresh process ---
+def run_scenario(engine_name, scale, repeat, warmup, concurrency):
+    """Run the pipeline repeat times (after warmup untimed runs) and return the
+    scenario's result dict. CEASA_BASE_URL must already point at the fixture."""
+    from fetch_engines import HttpFetchEngine, PlaywrightFetchEngine
+    from history_store import HistoryStore
+    from ingestion import IngestionJob, PersistStage, build_pipeline
+    from snapshot import SnapshotWriter
+
+    pool = None
+    if engine_name == "playwright":
+        from browser_pool import BrowserPool
+        pool = BrowserPool(size=concurrency)
+        engine = PlaywrightFetchEngine(pool)
+    else:
+        engine = HttpFetchEngine()
+
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        writer = SnapshotWriter(HistoryStore(os.path.join(workdir, "history.sqlite3")), os.path.join(workdir, "archive"))
+        files = (os.path.join(workdir, "ceasa_data.json"), os.path.join(workdir, "ceasa_tabela.html"))
+        pipeline = build_pipeline([engine], persist=[("persist", PersistStage(writer, lambda market_value: files))])
+
+        def run_once(_):
+            started = time.perf_counter()
+            job = pipeline.run(IngestionJob(MARKET_VALUE, MARKET_NAME))
+            return job, (time.perf_counter() - started) * 1000
+
+        try:
+            for _ in range(warmup):
+                run_once(None)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                runs = list(executor.map(run_once, range(repeat)))
+            elapsed = time.perf_counter() - started
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    ok_runs = [(job, ms) for job, ms in runs if job.ok]
+    failures = [f"{job.failed_stage}: {job.error}" for job, _ in runs if not job.ok]
+    rows = len(ok_runs[0][0].rows) if ok_runs else 0
+    stages = {}
+    for job, _ in ok_runs:
+        for name, seconds in job.timings.items():
+            stages.setdefault(name, []).append(seconds * 1000)
+    return {
+        "engine": engine_name,
+        "scale": scale,
+        "rows": rows,
+        "runs": len(runs),
+        "failures": len(failures),
+        "first_failure": failures[0] if failures else None,
+        "concurrency": concurrency,
+        "latency_ms": summarize([ms for _, ms in ok_runs]),
+        "throughput_per_s": round(len(ok_runs) / elapsed, 2),
+        "rows_per_s": round(len(ok_runs) * rows / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        # The browser runs in child processes, accounted once they exit
+        "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+    }
+
+# --- Driver ---
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def spawn_scenario(server, engine_name, scale, args):
+    repeat = args.repeat if scale < 1000 else max(3, args.repeat // 4)
+    command = [
+        sys.executable, __file__, "--worker",
+        "--engines", engine_name, "--scales", str(scale),
+        "--repeat", str(repeat), "--warmup", str(args.warmup), "--concurrency", str(args.concurrency),
+    ]
+    server.scale = scale
+    environment = dict(os.environ, CEASA_BASE_URL=server.base_url)
+    completed = subprocess.run(command, env=environment, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"cenário {engine_name} {scale}x falhou:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def print_table(results, baseline=None):
+    previous = {(r["engine"], r["scale"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'motor':<11} {'linhas':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'exec/s':>7} {'RSS MB':>7}  etapas (p50 ms)")
+    for r in results:
+        latency = r["latency_ms"] or {}
+        stages = ", ".join(f"{name} {values['p50']:.1f}" for name, values in r["stages_ms"].items())
+        line = (f"{r['engine']:<11} {r['rows']:>7} {latency.get('p50', 0):>9.1f} {latency.get('p90', 0):>9.1f} "
+                f"{latency.get('p99', 0):>9.1f} {r['throughput_per_s']:>7.1f} {r['peak_rss_mb']:>7.1f}  {stages}")
+        before = previous.get((r["engine"], r["scale"]))
+        if before and before["latency_ms"] and latency:
+            line += f"  [p50 {latency['p50'] / before['latency_ms']['p50']:.2f}x do anterior]"
+        if r["failures"]:
+            line += f"  ({r['failures']} falhas; {r['first_failure']})"
+        print(line)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark do pipeline de ingestão contra o servidor local.")
+    arg_parser.add_argument("--engines", default=",".join(ENGINES))
+    arg_parser.add_argument("--scales", default=",".join(map(str, SCALES)))
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--warmup", type=int, default=2)
+    arg_parser.add_argument("--concurrency", type=int, default=1)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="atraso por resposta do servidor, em segundos")
+    arg_parser.add_argument("--output", help=f"arquivo JSON de resultados (padrão: {RESULTS_DIR}/pipeline-<data>.json)")
+    arg_parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    arg_parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    scales = [int(scale) for scale in args.scales.split(",")]
+
+    if args.worker:
+        print(json.dumps(run_scenario(engines[0], scales[0], args.repeat, args.warmup, args.concurrency)))
+        return
+
+    if "playwright" in engines and importlib.util.find_spec("playwright") is None:
+        print("Playwright não instalado; cenários do motor playwright ignorados.")
+        engines.remove("playwright")
+
+    results = []
+    with FixtureServer(latency=args.latency) as server:
+        for engine_name in engines:
+            for scale in scales:
+                print(f"Executando {engine_name} {scale}x...", file=sys.stderr)
+                results.append(spawn_scenario(server, engine_name, scale, args))
+
+    report = {
+        "benchmark": "pipeline",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"repeat": args.repeat, "warmup": args.warmup, "concurrency": args.concurrency, "latency": args.latency},
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench_startup.py
+# Cold-start report for the Flask app: imports app.py in fresh processes
+# under `python -X importtime` (scheduler and warm-up off, throwaway history
+# database) and prints the import time of each module app.py imports and the
+# total time until the app can serve the snapshot left on disk. Exits with
+# status 1 when the median startup is over the budget or a heavy module
+# (pandas, numpy, BeautifulSoup, requests, Playwright) was imported on the
+# way, so it can gate changes that touch the startup path:
+#
+#   python bench_startup.py [--budget-ms 1000] [--repeat 5] [--top 15]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DEFAULT_BUDGET_MS = 1000
+HEAVY_MODULES = ("pandas", "numpy", "bs4", "requests", "urllib3", "playwright", "httpx")
+CHILD_CODE = (
+    "import json, time\n"
+    "started = time.perf_counter()\n"
+    "import app\n"
+    "print(json.dumps({'total_ms': (time.perf_counter() - started) * 1000, 'snapshot': app._snapshots.get(app.TARGET_MARKET_VALUE) is not None}))\n"
+)
+
+def parse_importtime(stderr):
+    """{module: (importing module or None, cumulative ms)} from -X importtime
+    output. A module's line comes after those of the modules it imported, so
+    each line adopts the pending lines one level deeper."""
+    cumulative_ms, parents, pending = {}, {}, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        while pending and pending[-1][0] > depth:
+            parents[pending.pop()[1]] = name
+        cumulative_ms.setdefault(name, int(cumulative) / 1000)
+        pending.append((depth, name))
+    return {name: (parents.get(name), ms) for name, ms in cumulative_ms.items()}
+
+def imported_by(modules, name, root="app"):
+    """The module root imported directly on the way to name (name itself for
+    root's direct imports), or None if root didn't import it."""
+    while name is not None and modules.get(name, (None,))[0] != root:
+        name = modules.get(name, (None,))[0]
+    return name
+
+def run_once(workdir):
+    environment = dict(
+        os.environ,
+        SCHEDULER_ENABLED="0",
+        WARMUP_MODULES="",
+        HISTORY_DB_FILE=os.path.join(workdir, "history.sqlite3"),
+        ARCHIVE_DIR="",
+        RAW_ARCHIVE_DIR="",
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE],
+        env=environment, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import app falhou:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["modules"] = parse_importtime(completed.stderr)
+    return result
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Tempo de inicialização do app (import por módulo).")
+    arg_parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=15)
+    arg_parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        runs = [run_once(workdir) for _ in range(args.repeat)]
+
+    total_ms = statistics.median(run["total_ms"] for run in runs)
+    children = {}
+    for run in runs:
+        for name, (parent, cumulative_ms) in run["modules"].items():
+            if parent == "app":
+                children.setdefault(name, []).append(cumulative_ms)
+    children = sorted(((statistics.median(values), name) for name, values in children.items()), reverse=True)
+    heavy = {} # Heavy module -> app's direct import that pulled it in
+    for run in runs:
+        for name in run["modules"]:
+            if name.split(".")[0] in HEAVY_MODULES:
+                heavy.setdefault(name.split(".")[0], imported_by(run["modules"], name))
+    heavy_via = set(heavy.values())
+    over_budget = total_ms > args.budget_ms
+
+    if args.json:
+        print(json.dumps({
+            "total_ms": round(total_ms, 1),
+            "budget_ms": args.budget_ms,
+            "snapshot_loaded": runs[-1]["snapshot"],
+            "modules_ms": {name: round(ms, 1) for ms, name in children[:args.top]},
+            "heavy_modules": {name: heavy[name] for name in sorted(heavy)},
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'módulo':<32} {'import (ms)':>12}")
+        for ms, name in children[:args.top]:
+            print(f"{name:<32} {ms:>12.1f}{'  * importa módulo pesado' if name in heavy_via else ''}")
+        print(f"\nInicialização (import app, mediana de {len(runs)}): {total_ms:.1f} ms; orçamento {args.budget_ms:.0f} ms"
+              f"{' — ACIMA DO ORÇAMENTO' if over_budget else ''}.")
+        print(f"Snapshot carregado do disco: {'sim' if runs[-1]['snapshot'] else 'não'}.")
+        if heavy:
+            print("Módulos pesados importados na inicialização: " + ", ".join(
+                f"{name} (via {heavy[name] or '?'})" for name in sorted(heavy)
+            ))
+    sys.exit(1 if over_budget or heavy else 0)
+
+if __name__ == "__main__":
+    main()
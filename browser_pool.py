@@ -0,0 +1,192 @@
+# browser_pool.py
+# Long-lived headless Chromium owned by the app. Playwright's sync API is
+# bound to the thread that started it, so each pool slot is a worker thread
+# that owns one browser and runs scrape jobs, each in a fresh context.
+import threading
+import queue
+import time
+import traceback
+import logging
+from concurrent.futures import Future
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAUNCH_ARGS = ["--no-sandbox", "--disable-setuid-sandbox"] # Render compatibility
+
+class BrowserCrashedError(Exception):
+    pass
+
+class _Slot:
+    """One worker thread owning a Playwright instance and a browser."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.playwright = None
+        self.browser = None
+        self.launched_at = None
+        self.jobs_done = 0
+        self.thread = threading.Thread(target=self._loop, name=f"browser-pool-{index}", daemon=True)
+
+    # --- Browser lifecycle (only called from this slot's thread) ---
+    def _launch(self):
+        from playwright.sync_api import sync_playwright
+        logger.info(f"[browser-pool-{self.index}] Iniciando Chromium...")
+        started = time.monotonic()
+        with STEP_SECONDS.time(step="browser_launch"):
+            self.playwright = sync_playwright().start()
+            self.browser = self.playwright.chromium.launch(headless=True, args=self.pool.launch_args)
+        self.launched_at = time.monotonic()
+        self.jobs_done = 0
+        logger.info(f"[browser-pool-{self.index}] Chromium iniciado em {self.launched_at - started:.2f}s.")
+
+    def _close(self):
+        try:
+            if self.browser:
+                self.browser.close()
+        except Exception as e:
+            logger.warning(f"[browser-pool-{self.index}] Erro ao fechar navegador: {e}")
+        try:
+            if self.playwright:
+                self.playwright.stop()
+        except Exception as e:
+            logger.warning(f"[browser-pool-{self.index}] Erro ao encerrar Playwright: {e}")
+        self.browser = None
+        self.playwright = None
+        self.launched_at = None
+
+    def is_healthy(self):
+        return self.browser is not None and self.browser.is_connected()
+
+    def _needs_recycle(self):
+        if self.jobs_done >= self.pool.recycle_after_jobs:
+            return True
+        return time.monotonic() - self.launched_at >= self.pool.recycle_after_seconds
+
+    def _ensure_browser(self):
+        if self.browser is not None and not self.is_healthy():
+            logger.warning(f"[browser-pool-{self.index}] Navegador desconectado. Reiniciando.")
+            self._close()
+        elif self.browser is not None and self._needs_recycle():
+            logger.info(f"[browser-pool-{self.index}] Reciclando navegador ({self.jobs_done} scrapes).")
+            self._close()
+        if self.browser is None:
+            self._launch()
+
+    def _run_job(self, fn):
+        self._ensure_browser()
+        context = self.browser.new_context(**self.pool.context_options)
+        try:
+            page = context.new_page()
+            return fn(page)
+        except Exception:
+            if not self.is_healthy():
+                raise BrowserCrashedError("Navegador caiu durante o scraping.")
+            raise
+        finally:
+            self.jobs_done += 1
+            try:
+                context.close()
+            except Exception:
+                pass
+
+    def _loop(self):
+        while True:
+            try:
+                job = self.pool._jobs.get(timeout=self.pool.health_check_interval)
+            except queue.Empty:
+                # Idle health check: relaunch a dead browser, recycle an old one
+                if self.browser is not None and (not self.is_healthy() or self._needs_recycle()):
+                    self._close()
+                continue
+
+            if job is None: # Shutdown sentinel
+                self._close()
+                return
+
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                try:
+                    result = self._run_job(fn)
+                except BrowserCrashedError:
+                    logger.warning(f"[browser-pool-{self.index}] Repetindo scraping após queda do navegador.")
+                    self._close()
+                    result = self._run_job(fn)
+                future.set_result(result)
+            except BaseException as e:
+                if not self.is_healthy():
+                    self._close()
+                future.set_exception(e)
+
+class BrowserPool:
+    """Keeps warm browsers around so a scrape only pays for a context and navigation.
+
+    size is the number of browsers, which is also the cap on pages open at
+    once. Browsers are relaunched when they crash and recycled after
+    recycle_after_jobs scrapes or recycle_after_seconds of uptime.
+    """
+
+    def __init__(self, size=1, recycle_after_jobs=50, recycle_after_seconds=3600,
+                 health_check_interval=30, launch_args=None, context_options=None):
+        self.size = size
+        self.recycle_after_jobs = recycle_after_jobs
+        self.recycle_after_seconds = recycle_after_seconds
+        self.health_check_interval = health_check_interval
+        self.launch_args = launch_args or DEFAULT_LAUNCH_ARGS
+        self.context_options = context_options or {}
+        self._jobs = queue.Queue()
+        self._slots = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._slots:
+                return
+            self._slots = [_Slot(self, i) for i in range(self.size)]
+            for slot in self._slots:
+                slot.thread.start()
+
+    def run(self, fn, timeout=None):
+        """Run fn(page) on a pooled browser and return its result.
+
+        Raises concurrent.futures.TimeoutError if no result within timeout.
+        """
+        self.start()
+        future = Future()
+        self._jobs.put((fn, future))
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def health(self):
+        return [{
+            "slot": slot.index,
+            "running": slot.browser is not None,
+            "uptime_seconds": round(time.monotonic() - slot.launched_at, 1) if slot.launched_at else 0,
+            "jobs_done": slot.jobs_done,
+        } for slot in self._slots]
+
+    def shutdown(self):
+        with self._start_lock:
+            for _ in self._slots:
+                self._jobs.put(None)
+            for slot in self._slots:
+                slot.thread.join(timeout=10)
+            self._slots = []
+
+if __name__ == "__main__":
+    # Quick manual check: python browser_pool.py
+    logging.basicConfig(level=logging.INFO)
+    pool = BrowserPool()
+    try:
+        print(pool.run(lambda page: page.evaluate("navigator.userAgent"), timeout=60))
+        print(pool.health())
+    except Exception:
+        traceback.print_exc()
+    finally:
+        pool.shutdown()
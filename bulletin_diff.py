@@ -0,0 +1,48 @@
+# bulletin_diff.py
+# Differences between two bulletins of the same market, keyed by
+# (Produtos, Embalagem): products added and removed, price deltas and
+# percentage changes per column, and Situação transitions. Prices are
+# compared in integer centavos so float rounding never reports a change.
+
+PRICE_FIELDS = ("MIN", "M.C.", "MAX")
+
+def _to_reais(cents):
+    return cents / 100 if cents is not None else None
+
+def _price_change(old_cents, new_cents):
+    change = {"from": _to_reais(old_cents), "to": _to_reais(new_cents)}
+    if old_cents is not None and new_cents is not None:
+        change["delta"] = _to_reais(new_cents - old_cents)
+        change["pct"] = round((new_cents - old_cents) * 100 / old_cents, 2) if old_cents else None
+    return change
+
+def _record(key, prices):
+    product, package = key
+    min_cents, mc_cents, max_cents, situation = prices
+    return {
+        "Produtos": product, "Embalagem": package,
+        "MIN": _to_reais(min_cents), "M.C.": _to_reais(mc_cents), "MAX": _to_reais(max_cents),
+        "Situação": situation,
+    }
+
+def diff_bulletins(old, new):
+    """Compare two bulletins given as {(product, package): (min_cents, mc_cents, max_cents, situation)}.
+
+    Returns {"added": [...], "removed": [...], "changed": [...]}, each sorted
+    by product. Changed entries only carry the fields that moved.
+    """
+    added = [_record(key, new[key]) for key in sorted(new.keys() - old.keys())]
+    removed = [{"Produtos": key[0], "Embalagem": key[1]} for key in sorted(old.keys() - new.keys())]
+    changed = []
+    for key in sorted(old.keys() & new.keys()):
+        old_prices, new_prices = old[key], new[key]
+        if old_prices == new_prices:
+            continue
+        entry = {"Produtos": key[0], "Embalagem": key[1]}
+        for field, old_cents, new_cents in zip(PRICE_FIELDS, old_prices[:3], new_prices[:3]):
+            if old_cents != new_cents:
+                entry[field] = _price_change(old_cents, new_cents)
+        if old_prices[3] != new_prices[3]:
+            entry["Situação"] = {"from": old_prices[3], "to": new_prices[3]}
+        changed.append(entry)
+    return {"added": added, "removed": removed, "changed": changed}
@@ -0,0 +1,127 @@
+# bulletin_parser.py
+# Single-pass parser for the CEASA-ES bulletin page. Walks the document once
+# with html.parser.HTMLParser and emits typed rows plus the bulletin date and
+# market, without building a soup tree or a DataFrame.
+import re
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from html.parser import HTMLParser
+
+COLUMNS = ["Produtos", "Embalagem", "MIN", "M.C.", "MAX", "Situação"]
+PRICE_COLUMNS = ["MIN", "M.C.", "MAX"]
+
+BulletinRow = namedtuple("BulletinRow", ["product", "package", "min", "mc", "max", "situation"])
+Bulletin = namedtuple("Bulletin", ["rows", "bulletin_date", "market"])
+
+_DATE_RE = re.compile(r"Data Pesquisada:\s*(\d{2}/\d{2}/\d{4})")
+_MARKET_RE = re.compile(r"Mercado:\s*([^\n]+?)\s*(?:Data Pesquisada:|\n|$)")
+_BLOCK_TAGS = {"p", "div", "td", "th", "tr", "title", "h1", "h2", "h3", "br", "table"}
+
+def parse_price(text):
+    """Convert a Brazilian formatted price ("1.234,56") to Decimal, or None."""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return Decimal(text.replace(".", "").replace(",", "."))
+    except InvalidOperation:
+        return None
+
+class _BulletinHTMLParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.text_parts = [] # Text outside the data table, searched for date/market
+        self._tables = [] # Stack: True when that table is the data table
+        self._found_table = False # The first data table wins; later ones are ignored
+        self._cells = None # Cells of the row being read, or None outside a row
+        self._cell = None # Text parts of the cell being read
+
+    def _in_data_table(self):
+        return bool(self._tables) and self._tables[-1]
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._tables.append(False)
+        elif tag == "tr" and self._tables:
+            self._cells = []
+        elif tag in ("td", "th") and self._cells is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            self._cells.append("".join(self._cell).strip())
+            self._cell = None
+        elif tag == "tr" and self._cells is not None:
+            self._end_row(self._cells)
+            self._cells = None
+        elif tag == "table" and self._tables:
+            if self._tables.pop():
+                self._found_table = True
+        if tag in _BLOCK_TAGS:
+            self.text_parts.append("\n")
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        if not self._in_data_table():
+            self.text_parts.append(data)
+
+    def _end_row(self, cells):
+        if not self._in_data_table():
+            # A header row turns the enclosing table into the data table
+            if (not self._found_table and cells and cells[0].startswith("Produto")
+                    and "Embalagem" in cells and len(cells) >= len(COLUMNS)):
+                self._tables[-1] = True
+            return
+        if len(cells) < len(COLUMNS) or not any(cells):
+            return
+        prices = [parse_price(cells[i]) for i in (2, 3, 4)]
+        if all(price is None for price in prices):
+            return # Grouping/blank rows carry no prices
+        self.rows.append(BulletinRow(cells[0], cells[1], prices[0], prices[1], prices[2], cells[5]))
+
+def parse_bulletin(html_content):
+    """Parse a bulletin page. Returns a Bulletin, or None if no data table was found."""
+    parser = _BulletinHTMLParser()
+    parser.feed(html_content)
+    parser.close()
+    if not parser._found_table and not parser._in_data_table():
+        return None
+
+    text = "".join(parser.text_parts)
+    date_match = _DATE_RE.search(text)
+    market_match = _MARKET_RE.search(text)
+    return Bulletin(
+        rows=parser.rows,
+        bulletin_date=date_match.group(1) if date_match else None,
+        market=market_match.group(1).strip() if market_match else None,
+    )
+
+def row_to_record(row):
+    """Row as the JSON record shape used in ceasa_data.json (prices as floats)."""
+    return {
+        "Produtos": row.product,
+        "Embalagem": row.package,
+        "MIN": float(row.min) if row.min is not None else None,
+        "M.C.": float(row.mc) if row.mc is not None else None,
+        "MAX": float(row.max) if row.max is not None else None,
+        "Situação": row.situation or None,
+    }
+
+def _record_price(value):
+    if value is None or value != value: # None or NaN (pandas output)
+        return None
+    return Decimal(str(value))
+
+def record_to_row(record):
+    """Inverse of row_to_record. Also accepts the older "Produto" key and NaN prices."""
+    package, situation = record.get("Embalagem"), record.get("Situação")
+    return BulletinRow(
+        record.get("Produtos", record.get("Produto")),
+        package if isinstance(package, str) else "",
+        _record_price(record.get("MIN")),
+        _record_price(record.get("M.C.")),
+        _record_price(record.get("MAX")),
+        situation if isinstance(situation, str) else "",
+    )
@@ -0,0 +1,72 @@
+# bulletin_probe.py
+# Cheap "was a new bulletin published?" check. Instead of downloading and
+# parsing the whole bulletin, the probe asks the HTTP engine for the
+# market's date dropdown (the filter page plus the replayed AJAX call that
+# fills the dropdown on the live site) and compares the newest listed date
+# with the date of the bulletin already in memory, so the scheduler can
+# poll often and scrape only when a new date shows up.
+import time
+import logging
+from metrics import PROBES, STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+NEW, UNCHANGED, UNKNOWN = "new", "unchanged", "unknown"
+LEARN_RETRY_SECONDS = 3600 # Minimum gap between browser walks recording the date-list call
+
+def compare_dates(listed_dates, known_iso_date):
+    """NEW, UNCHANGED or UNKNOWN for [(value, iso_date), ...] from the date
+    dropdown against the ISO date we already have. UNKNOWN when either side
+    is missing (no date-list call recorded yet, the request failed or our
+    bulletin had no date): the caller falls back to a full refresh
+    on its usual interval."""
+    newest = max((iso_date for _, iso_date in listed_dates), default=None)
+    if newest is None or known_iso_date is None:
+        return UNKNOWN
+    return NEW if newest > known_iso_date else UNCHANGED
+
+class BulletinProbe:
+    """Probe a market's date list with engine.list_dates (an HttpFetchEngine
+    or, through check_async, an AsyncHttpFetchEngine). known_date(market
+    value) is the ISO date of the bulletin we hold, or None.
+
+    When the HTTP engine lists nothing (the date-list call was never
+    recorded, or the site changed it), learn(market_value) - the browser
+    engine's list_dates, which records the call - is tried instead, at most
+    once per LEARN_RETRY_SECONDS; later probes are plain HTTP again.
+    """
+
+    def __init__(self, engine, known_date, learn=None):
+        self.engine = engine
+        self.known_date = known_date
+        self.learn = learn
+        self._next_learn = 0.0
+
+    def _should_learn(self, listed_dates):
+        if listed_dates or self.learn is None or time.monotonic() < self._next_learn:
+            return False
+        self._next_learn = time.monotonic() + LEARN_RETRY_SECONDS
+        logger.info("Lista de datas vazia por HTTP; registrando a requisição de datas com o navegador.")
+        return True
+
+    def _result(self, market_value, listed_dates):
+        known = self.known_date(market_value)
+        result = compare_dates(listed_dates, known)
+        PROBES.inc(market=market_value, result=result)
+        if result == NEW:
+            logger.info(f"Novo boletim listado para o mercado {market_value} (temos {known}).")
+        return result
+
+    def check(self, market_value):
+        with STEP_SECONDS.time(step="probe"):
+            listed_dates = self.engine.list_dates(market_value)
+        if self._should_learn(listed_dates):
+            listed_dates = self.learn(market_value)
+        return self._result(market_value, listed_dates)
+
+    async def check_async(self, market_value):
+        with STEP_SECONDS.time(step="probe"):
+            listed_dates = await self.engine.list_dates(market_value)
+        if self._should_learn(listed_dates):
+            listed_dates = await self.learn(market_value)
+        return self._result(market_value, listed_dates)
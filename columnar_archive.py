@@ -0,0 +1,222 @@
+# columnar_archive.py
+# Compact columnar files for bulletins and price history. Dates, products,
+# packages and situations are dictionary-encoded (small unsigned codes plus
+# one string table each) and prices are int32 centavos, so a row costs ~20
+# bytes instead of a JSON object with repeated keys. Every column is stored
+# raw and 8-byte aligned after a JSON header, which lets ColumnarArchive
+# memory-map the file and decode only what a caller touches.
+#
+# SnapshotWriter and backfill's HistoryStage keep <market>/history.col in
+# step with the SQLite history by merging each new bulletin into the
+# existing file, and AnalyticsCache loads its frames from it.
+#
+#   python columnar_archive.py export "CEASA GRANDE VITÓRIA" historico.col
+#   python columnar_archive.py info historico.col
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import numpy as np
+
+MAGIC = b"CEASACOL"
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+MISSING_PRICE = -2 ** 31 # np.iinfo(np.int32).min, sentinel for a price the bulletin left blank
+DICTIONARY_COLUMNS = ("date", "product", "package", "situation")
+PRICE_COLUMNS = ("min", "mc", "max")
+HISTORY_FILE = "history.col"
+
+_update_lock = threading.Lock() # One history.col merge at a time per process
+
+def _code_dtype(size):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    raise ValueError("dicionário grande demais")
+
+def _encode(values):
+    """Dictionary-encode strings: (sorted distinct values, codes array)."""
+    dictionary = sorted(set(values))
+    lookup = {value: code for code, value in enumerate(dictionary)}
+    codes = np.fromiter((lookup[value] for value in values), dtype=_code_dtype(len(dictionary)), count=len(values))
+    return dictionary, codes
+
+def _prices(values):
+    return np.fromiter((MISSING_PRICE if value is None else value for value in values), dtype="<i4", count=len(values))
+
+def encode_archive(market, rows):
+    """Serialize rows of (iso date, product, package, min_cents, mc_cents, max_cents, situation)."""
+    rows = sorted(rows, key=lambda row: (row[0], row[1], row[2]))
+    columns = list(zip(*rows)) if rows else [()] * 7
+    dictionaries, arrays = {}, {}
+    for name, values in zip(("date", "product", "package"), columns[:3]):
+        dictionaries[name], arrays[name] = _encode(values)
+    dictionaries["situation"], arrays["situation"] = _encode([value or "" for value in columns[6]])
+    for name, values in zip(PRICE_COLUMNS, columns[3:6]):
+        arrays[name] = _prices(values)
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        "version": FORMAT_VERSION, "market": market, "rows": len(rows),
+        "dictionaries": dictionaries, "columns": layout,
+    }, ensure_ascii=False).encode("utf-8")
+    prefix_size = len(MAGIC) + 4
+    header += b" " * (-(prefix_size + len(header)) % ALIGNMENT)
+
+    parts = [MAGIC, struct.pack("<I", len(header)), header]
+    for array in arrays.values():
+        data = array.tobytes()
+        parts.append(data + b"\0" * (-len(data) % ALIGNMENT))
+    return b"".join(parts)
+
+class ColumnarArchive:
+    """Read-only, memory-mapped view of an archive file. Columns are NumPy
+    arrays backed by the page cache; only decoded strings cost memory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} não é um arquivo colunar do CEASA")
+            (header_size,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_size))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Versão de formato não suportada: {header['version']}")
+        self.market = header["market"]
+        self.rows = header["rows"]
+        self.dictionaries = header["dictionaries"]
+        data_offset = len(MAGIC) + 4 + header_size
+        self.columns = {}
+        for name, column in header["columns"].items():
+            self.columns[name] = np.memmap(
+                path, dtype=np.dtype(column["dtype"]), mode="r", offset=data_offset + column["offset"], shape=(self.rows,),
+            ) if self.rows else np.empty(0, dtype=np.dtype(column["dtype"]))
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def dates(self):
+        return self.dictionaries["date"]
+
+    @property
+    def version(self):
+        """(latest bulletin date, bulletin count), comparable with HistoryStore.bulletin_version."""
+        return (self.dates[-1] if self.dates else None), len(self.dates)
+
+    def date_range(self, start=None, end=None):
+        """(first, last) row positions of ISO dates in [start, end]; rows are sorted by date."""
+        dates = self.dates
+        first = np.searchsorted(self.columns["date"], np.searchsorted(dates, start, "left")) if start else 0
+        last = np.searchsorted(self.columns["date"], np.searchsorted(dates, end, "right"), "left") if end else self.rows
+        return int(first), int(last)
+
+    def prices(self, column, start=None, end=None):
+        """Price column in centavos as float64, NaN where missing."""
+        first, last = self.date_range(start, end)
+        values = self.columns[column][first:last].astype(np.float64)
+        values[self.columns[column][first:last] == MISSING_PRICE] = np.nan
+        return values
+
+    def to_frame(self, start=None, end=None):
+        """pandas DataFrame with categorical strings (codes are not copied into Python objects)."""
+        import pandas as pd
+        first, last = self.date_range(start, end)
+        frame = {
+            name if name != "date" else "bulletin_date": pd.Categorical.from_codes(
+                self.columns[name][first:last].astype(np.int32), categories=self.dictionaries[name],
+            )
+            for name in DICTIONARY_COLUMNS
+        }
+        for name in PRICE_COLUMNS:
+            frame[f"{name}_cents"] = self.prices(name, start, end)
+        return pd.DataFrame(frame)
+
+    def price_rows(self):
+        """Rows as (iso date, product, package, min_cents, mc_cents, max_cents, situation), like HistoryStore.price_rows."""
+        columns = [
+            [self.dictionaries[name][code] for code in self.columns[name].tolist()]
+            for name in ("date", "product", "package")
+        ]
+        columns += [[None if cents == MISSING_PRICE else cents for cents in self.columns[name].tolist()] for name in PRICE_COLUMNS]
+        columns.append([self.dictionaries["situation"][code] or None for code in self.columns["situation"].tolist()])
+        return list(zip(*columns))
+
+    def records(self):
+        """Rows in the ceasa_data.json shape, plus bulletin_date."""
+        decode = {name: self.dictionaries[name] for name in DICTIONARY_COLUMNS}
+        codes = {name: self.columns[name].tolist() for name in DICTIONARY_COLUMNS}
+        prices = {name: self.columns[name].tolist() for name in PRICE_COLUMNS}
+        to_reais = lambda cents: None if cents == MISSING_PRICE else cents / 100
+        return [{
+            "bulletin_date": decode["date"][codes["date"][i]],
+            "Produtos": decode["product"][codes["product"][i]],
+            "Embalagem": decode["package"][codes["package"][i]],
+            "MIN": to_reais(prices["min"][i]),
+            "M.C.": to_reais(prices["mc"][i]),
+            "MAX": to_reais(prices["max"][i]),
+            "Situação": decode["situation"][codes["situation"][i]] or None,
+        } for i in range(self.rows)]
+
+def history_path(archive_dir, market_value):
+    return os.path.join(archive_dir, market_value, HISTORY_FILE)
+
+def open_archive(path):
+    """ColumnarArchive of path, or None when it is missing or unreadable."""
+    try:
+        return ColumnarArchive(path)
+    except (OSError, ValueError):
+        return None
+
+def update_history(path, history, market, iso_date, rows, write):
+    """Merge one bulletin's rows into the history archive at path (replacing
+    rows already stored for iso_date) and write(path, data) the result.
+    The file is rebuilt from history.price_rows only when there is none yet
+    or it no longer matches the history store (bulletins stored while
+    archiving was off). Returns the archive's row count."""
+    with _update_lock:
+        archive = open_archive(path)
+        merged = None
+        if archive is not None and archive.market == market:
+            merged = [row for row in archive.price_rows() if row[0] != iso_date] + list(rows)
+            dates = {row[0] for row in merged}
+            if (max(dates, default=None), len(dates)) != tuple(history.bulletin_version(market)):
+                merged = None
+        if merged is None:
+            merged = history.price_rows(market)
+        write(path, encode_archive(market, merged))
+        return len(merged)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Arquivo colunar do histórico de preços.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Exporta o histórico de um mercado")
+    export.add_argument("market", help="Nome do mercado no histórico")
+    export.add_argument("output")
+    export.add_argument("--db", default=os.environ.get("HISTORY_DB_FILE", "ceasa_history.sqlite3"))
+    info = commands.add_parser("info", help="Mostra o conteúdo de um arquivo")
+    info.add_argument("path")
+    args = arg_parser.parse_args()
+
+    if args.command == "export":
+        from history_store import HistoryStore
+        rows = HistoryStore(args.db).price_rows(args.market)
+        with open(args.output, "wb") as f:
+            f.write(encode_archive(args.market, rows))
+        print(f"{len(rows)} linhas exportadas para {args.output} ({os.path.getsize(args.output)} bytes).")
+    else:
+        archive = ColumnarArchive(args.path)
+        print(f"Mercado: {archive.market}")
+        print(f"Linhas: {len(archive)}")
+        if archive.dates:
+            print(f"Boletins: {len(archive.dates)} ({archive.dates[0]} a {archive.dates[-1]})")
+        print(f"Produtos: {len(archive.dictionaries['product'])}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
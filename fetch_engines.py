@@ -0,0 +1,568 @@
+# fetch_engines.py
+# Pluggable ways of getting the raw bulletin HTML from the CEASA-ES site.
+# The HTTP engine replays the ScriptCase form with plain requests (a couple
+# of round trips); the Playwright engine drives a real browser and is only
+# used when the HTTP response does not look like a bulletin. requests and
+# BeautifulSoup are imported on first use, keeping them off the app's
+# startup path.
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+from datetime import datetime
+import logging
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = os.environ.get("CEASA_BASE_URL", "http://200.198.51.71/detec/").rstrip("/") + "/" # Overridable for the offline fixture server
+FILTER_URL = BASE_URL + "filtro_boletim_es/filtro_boletim_es.php"
+POST_URL = BASE_URL + "boletim_completo_es/boletim_completo_es.php"
+MARKET_PARAM_NAME = "mercado"
+DATE_PARAM_NAME = "datas"
+LATEST_DATE_OPTION_INDEX = 1 # Index for the latest date in the dropdown
+MARKET_SELECT_INDEX = 3 # Browser index for market dropdown
+DATE_SELECT_INDEX = 4 # Browser index for date dropdown
+OK_BUTTON_INDEX = 5 # Browser index for the OK button
+DEFAULT_ENCODING = "windows-1252" # What the ScriptCase pages use when they don't say otherwise
+DATE_REQUEST_FILE = os.environ.get("DATE_REQUEST_FILE", ".date_list_request.json") # Recorded date-list AJAX call
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36",
+    "Referer": FILTER_URL,
+}
+
+DB_ERROR_MARKERS = ("Erro ao acessar o banco de dados", "Incorrect syntax")
+_META_CHARSET_RE = re.compile(rb"<meta[^>]+charset=[\"']?([A-Za-z0-9_-]+)", re.IGNORECASE)
+
+def decode_response(response):
+    """Decode a CEASA response using the declared charset, else windows-1252."""
+    content_type = response.headers.get("Content-Type", "")
+    if "charset=" in content_type.lower():
+        encoding = content_type.lower().split("charset=")[-1].split(";")[0].strip()
+    else:
+        match = _META_CHARSET_RE.search(response.content[:2048])
+        encoding = match.group(1).decode("ascii") if match else DEFAULT_ENCODING
+    try:
+        return response.content.decode(encoding)
+    except (LookupError, UnicodeDecodeError):
+        return response.content.decode(DEFAULT_ENCODING, errors="replace")
+
+def validate_bulletin_html(html_content):
+    """Return None when the HTML looks like a bulletin, else the reason it doesn't."""
+    if not html_content:
+        return "resposta vazia"
+    for marker in DB_ERROR_MARKERS:
+        if marker in html_content:
+            return f"erro do banco de dados na resposta ({marker})"
+    if "<table" not in html_content.lower():
+        return "nenhuma tabela na resposta"
+    if "Produto" not in html_content or "Embalagem" not in html_content:
+        return "tabela de preços não encontrada"
+    return None
+
+# --- Politeness ---
+class HostLimiter:
+    """Per-host politeness: at most max_concurrent requests in flight and at
+    least min_interval seconds between request starts to the same host."""
+
+    def __init__(self, max_concurrent=4, min_interval=0.25):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._hosts = {} # host -> [semaphore, last_start]
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.setdefault(host, [threading.BoundedSemaphore(self.max_concurrent), 0.0])
+        state[0].acquire()
+        try:
+            with self._lock:
+                wait = state[1] + self.min_interval - time.monotonic()
+                state[1] = max(state[1] + self.min_interval, time.monotonic())
+            if wait > 0:
+                time.sleep(wait)
+            yield
+        finally:
+            state[0].release()
+
+_unlimited = HostLimiter(max_concurrent=1000, min_interval=0)
+
+_DATE_FORMATS = ("%Y%m%d", "%d/%m/%Y", "%Y-%m-%d")
+
+def option_to_iso_date(value, text=""):
+    """ISO date for a date dropdown option (value like 20250425 or text like 25/04/2025), or None."""
+    for candidate in (value, text):
+        candidate = (candidate or "").strip()
+        for date_format in _DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).date().isoformat()
+            except ValueError:
+                continue
+    return None
+
+_DATE_TOKEN_RE = re.compile(r"(?<!\d)(\d{8}|\d{2}\\?/\d{2}\\?/\d{4})(?!\d)")
+
+def _json_date_options(document, dates):
+    """Collect {"value": ..., "label": ...} options anywhere in a JSON answer
+    (ScriptCase's AJAX field refresh lists them under fldList[].optList)."""
+    if isinstance(document, dict):
+        if "value" in document:
+            value = str(document["value"]).strip()
+            iso_date = option_to_iso_date(value, str(document.get("label", document.get("text", ""))))
+            if value and iso_date:
+                dates.append((value, iso_date))
+        for item in document.values():
+            _json_date_options(item, dates)
+    elif isinstance(document, list):
+        for item in document:
+            _json_date_options(item, dates)
+    return dates
+
+def _dynamic_date_options(content):
+    """Dates from the answer of the AJAX call that fills the date dropdown:
+    JSON option lists, or a script carrying the date values in order."""
+    try:
+        dates = _json_date_options(json.loads(content), [])
+    except ValueError:
+        dates = []
+        for token in _DATE_TOKEN_RE.findall(content):
+            token = token.replace("\\/", "/")
+            iso_date = option_to_iso_date(token)
+            if iso_date:
+                dates.append((token, iso_date))
+    unique, seen = [], set()
+    for value, iso_date in dates:
+        if iso_date not in seen: # A script lists each date as value then label
+            seen.add(iso_date)
+            unique.append((value, iso_date))
+    return unique
+
+def parse_date_options(html_content):
+    """[(value, iso_date), ...] newest first as listed, from the date <select>
+    of a page or HTML fragment, or from the date-list AJAX answer. A full
+    page without options has no dates (the live filter page fills them in
+    with JavaScript)."""
+    lowered = (html_content or "").lower()
+    if "<option" not in lowered:
+        return [] if "<html" in lowered or not lowered else _dynamic_date_options(html_content)
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    select_tag = soup.find("select", {"name": DATE_PARAM_NAME})
+    # The AJAX refresh may answer with bare <option> tags and no <select>
+    candidates = [select_tag] if select_tag else soup.find_all("select") or [soup]
+    for select_tag in candidates:
+        dates = []
+        for option in select_tag.find_all("option"):
+            value = option.get("value", "").strip()
+            iso_date = option_to_iso_date(value, option.get_text(strip=True))
+            if value and iso_date:
+                dates.append((value, iso_date))
+        if dates:
+            return dates
+    return []
+
+def parse_market_options(html_content):
+    """[(value, name), ...] from the market <select> on the filter page."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    for select_tag in soup.find_all("select"):
+        options = [(option.get("value", "").strip(), option.get_text(strip=True)) for option in select_tag.find_all("option")]
+        markets = [(value, name) for value, name in options if value and "CEASA" in name.upper()]
+        if markets:
+            return markets
+    return []
+
+def parse_hidden_fields(html_content):
+    """{name: value} of the filter form's hidden inputs (ScriptCase session and CSRF token)."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    hidden_inputs = {}
+    for hidden_input in soup.find_all("input", {"type": "hidden"}):
+        name = hidden_input.get("name")
+        if name:
+            hidden_inputs[name] = hidden_input.get("value", "")
+    logger.info(f"Encontrados {len(hidden_inputs)} campos ocultos únicos.")
+    return hidden_inputs
+
+def build_form_payload(hidden_inputs, market_value, date_value=None):
+    """The bulletin POST body: nmgp_parms plus the hidden fields of the filter form."""
+    nmgp_parms = f"{MARKET_PARAM_NAME}?#?{market_value}?@?"
+    if date_value:
+        nmgp_parms += f"{DATE_PARAM_NAME}?#?{date_value}?@?"
+    return {
+        "nmgp_parms": nmgp_parms,
+        "script_case_init": hidden_inputs.get("script_case_init", ""),
+        "script_case_session": hidden_inputs.get("script_case_session", ""),
+        "csrf_token": hidden_inputs.get("csrf_token", ""),
+        "nm_form_submit": hidden_inputs.get("nm_form_submit", "1"),
+        "bok": hidden_inputs.get("bok", "OK"),
+        "nmgp_opcao": "pesq",
+    }
+
+# --- Dynamic date list ---
+# On the live site the filter page comes with an empty date <select>: a
+# ScriptCase AJAX call fills it in after a market is picked, so a plain GET
+# lists no dates. The browser walk records that call (whatever URL and
+# fields it uses) when it sees the dates arrive; the HTTP engines then
+# replay it with another market and the fresh session fields.
+_RECORDED_HEADERS = ("x-requested-with", "accept", "content-type")
+_SESSION_FIELDS = ("script_case_init", "script_case_session", "csrf_token") # Change with every filter page
+
+class DateListRequest:
+    """A recorded date-list call: method, URL, the ordered (name, value)
+    pairs of its query string and body, the names of the fields that carried
+    the market value and the few headers the server may check."""
+
+    def __init__(self, method, url, query, body, market_fields, headers=None):
+        self.method = method
+        self.url = url
+        self.query = [tuple(pair) for pair in query]
+        self.body = [tuple(pair) for pair in body]
+        self.market_fields = set(market_fields)
+        self.headers = headers or {}
+
+    @classmethod
+    def record(cls, method, url, post_data, market_value, headers=None):
+        """The request as a template, or None when no field carries market_value."""
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        body = parse_qsl(post_data or "", keep_blank_values=True)
+        market_fields = {name for name, value in query + body if value == market_value}
+        if not market_fields:
+            return None
+        kept_headers = {name: value for name, value in (headers or {}).items() if name.lower() in _RECORDED_HEADERS}
+        return cls(method.upper(), urlunsplit(parts._replace(query="")), query, body, market_fields, kept_headers)
+
+    def build(self, market_value, hidden_fields=None):
+        """(method, url, params, data, headers) asking for market_value's dates.
+        The per-session tokens (ScriptCase session, CSRF token) take their
+        fresh values from hidden_fields; every other recorded field, such as
+        the nmgp_opcao naming the refresh, is sent as recorded."""
+        hidden_fields = hidden_fields or {}
+        def fill(pairs):
+            return [
+                (name, market_value if name in self.market_fields
+                 else hidden_fields.get(name, value) if name in _SESSION_FIELDS else value)
+                for name, value in pairs
+            ]
+        return self.method, self.url, fill(self.query), fill(self.body) or None, dict(self.headers)
+
+    def to_dict(self):
+        return {
+            "method": self.method, "url": self.url, "query": self.query, "body": self.body,
+            "market_fields": sorted(self.market_fields), "headers": self.headers,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["method"], data["url"], data["query"], data["body"], data["market_fields"], data.get("headers"))
+
+def match_date_request(candidates, market_value, dates):
+    """The DateListRequest among candidates [(method, url, post_data, headers,
+    response text), ...] whose answer lists the dates now in the dropdown."""
+    values = [value for value, _ in dates]
+    for method, url, post_data, headers, text in candidates:
+        if BULLETIN_PATH in url or not text or not all(value in text for value in values[:3]):
+            continue
+        recorded = DateListRequest.record(method, url, post_data, market_value, headers)
+        if recorded is not None:
+            return recorded
+    return None
+
+class DateRequestStore:
+    """The recorded DateListRequest, kept in a JSON file so every worker
+    process (and the next run) can replay it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._request = None
+
+    def get(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._request = DateListRequest.from_dict(json.load(f))
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error(f"Requisição da lista de datas inválida em {self.path}: {e}")
+                    self._request = None
+                self._mtime = mtime
+            return self._request
+
+    def save(self, request):
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(request.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path) # Readers see the old or the new file, never half of one
+        logger.info(f"Requisição da lista de datas registrada ({request.method} {request.url}).")
+
+date_requests = DateRequestStore(DATE_REQUEST_FILE)
+
+# --- Engines ---
+class FetchEngine:
+    """Interface: fetch(market_value, date_value=None) returns the bulletin HTML
+    or None (date_value None means the newest bulletin); list_dates(market_value)
+    returns the [(date_value, iso_date), ...] offered for a market."""
+
+    name = "base"
+
+    def fetch(self, market_value, date_value=None):
+        raise NotImplementedError
+
+    def list_dates(self, market_value):
+        raise NotImplementedError
+
+class HttpFetchEngine(FetchEngine):
+    """Replays the filter form with requests: GET hidden fields, POST nmgp_parms.
+
+    Sessions are kept per thread so keep-alive connections to the CEASA host
+    are reused between scrapes.
+    """
+
+    name = "http"
+
+    def __init__(self, timeout=30, limiter=None):
+        self.timeout = timeout
+        self.limiter = limiter or _unlimited
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            # A pooled keep-alive connection may have been closed by the server;
+            # retry once on a fresh one (the form POST is a read-only search)
+            retries = Retry(total=2, connect=2, read=1, status=0, allowed_methods=None, backoff_factor=0.2)
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+            self._local.session = session
+        return session
+
+    def get_filter_page(self, session):
+        with self.limiter.slot(FILTER_URL), STEP_SECONDS.time(step="http_get_filter"):
+            response_get = session.get(FILTER_URL, timeout=self.timeout)
+        response_get.raise_for_status()
+        return decode_response(response_get)
+
+    def list_markets(self):
+        """Discover the markets offered by the filter form. Returns [] on failure."""
+        import requests
+        try:
+            return parse_market_options(self.get_filter_page(self._session()))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"[http] Erro ao listar mercados: {e}")
+            return []
+
+    def get_hidden_fields(self, session):
+        return parse_hidden_fields(self.get_filter_page(session))
+
+    def list_dates(self, market_value):
+        """Dates offered for a market: from the filter page when it lists
+        them, else by replaying the recorded date-list call. Empty when
+        neither works (no call recorded yet: the browser engine records it)."""
+        import requests
+        session = self._session()
+        try:
+            with self.limiter.slot(FILTER_URL):
+                response = session.get(FILTER_URL, params={MARKET_PARAM_NAME: market_value}, timeout=self.timeout)
+            response.raise_for_status()
+            filter_page = decode_response(response)
+            dates = parse_date_options(filter_page)
+            recorded = date_requests.get()
+            if dates or recorded is None:
+                return dates
+            method, url, params, data, headers = recorded.build(market_value, parse_hidden_fields(filter_page))
+            with self.limiter.slot(url), STEP_SECONDS.time(step="http_date_list"):
+                response = session.request(method, url, params=params, data=data, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            return parse_date_options(decode_response(response))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"[http] Erro ao listar datas do mercado {market_value}: {e}")
+            return []
+
+    def fetch(self, market_value, date_value=None):
+        import requests
+        session = self._session()
+        try:
+            logger.info(f"[http] GET {FILTER_URL}")
+            hidden_inputs = self.get_hidden_fields(session)
+            payload = build_form_payload(hidden_inputs, market_value, date_value)
+            logger.info(f"[http] POST {POST_URL} com {len(payload)} parâmetros...")
+            with self.limiter.slot(POST_URL), STEP_SECONDS.time(step="http_post_bulletin"):
+                response_post = session.post(POST_URL, data=payload, timeout=self.timeout * 2)
+            response_post.raise_for_status()
+            return decode_response(response_post)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"[http] Erro de requisição: {e}")
+            # Drop the session so the next attempt starts with fresh cookies
+            self._local.session = None
+            return None
+
+# --- Browser page walks (run on a BrowserPool page) ---
+# Each step waits on the signal it actually needs instead of fixed sleeps or
+# networkidle (which on the ScriptCase page often waits on unrelated requests).
+NAVIGATION_TIMEOUT_MS = 60000
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "stylesheet", "media"}) # Never needed to read the table
+RESULTS_SELECTOR = "table[border='1'], #sc_grid_body"
+BULLETIN_PATH = "boletim_completo_es.php"
+# True once the date <select> (by position) lists more than `minimum` options,
+# or the requested one when `value` is given; it is filled in after the market
+DATE_OPTIONS_READY_JS = """([index, minimum, value]) => {
+    const select = document.querySelectorAll("select")[index];
+    if (!select) return false;
+    if (value) return Array.from(select.options).some(option => option.value === value);
+    return select.options.length > minimum;
+}"""
+
+def _route_resource(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return route.abort()
+    return route.continue_()
+
+def is_bulletin_response(response):
+    """The form POST answered by boletim_completo_es.php."""
+    return BULLETIN_PATH in response.url and response.request.method == "POST"
+
+def _select_market(page, market_value, date_value=None, record_dates=False):
+    """Open the filter page, pick the market and wait for its dates. When
+    record_dates is set or no date-list call is recorded yet, the requests
+    made meanwhile are checked for the one that brought the dates."""
+    page.route("**/*", _route_resource)
+    logger.info(f"Navegando para {FILTER_URL}")
+    with STEP_SECONDS.time(step="page_goto"):
+        page.goto(FILTER_URL, timeout=NAVIGATION_TIMEOUT_MS, wait_until="domcontentloaded")
+    logger.info("Página carregada. Selecionando opções...")
+    requests_seen = []
+    if record_dates or date_requests.get() is None:
+        page.on("requestfinished", requests_seen.append)
+
+    # Select Market
+    with STEP_SECONDS.time(step="select_market"):
+        page.locator("select").nth(MARKET_SELECT_INDEX - 1).select_option(value=market_value)
+    logger.info(f"Mercado selecionado: {market_value}")
+    with STEP_SECONDS.time(step="date_options_wait"):
+        page.wait_for_function(
+            DATE_OPTIONS_READY_JS, arg=[DATE_SELECT_INDEX - 1, LATEST_DATE_OPTION_INDEX, date_value],
+            timeout=NAVIGATION_TIMEOUT_MS,
+        )
+    if requests_seen:
+        page.remove_listener("requestfinished", requests_seen.append)
+        _record_date_request(page, requests_seen, market_value)
+
+def _record_date_request(page, requests_seen, market_value):
+    dates = parse_date_options(page.content())
+    candidates = []
+    for request in requests_seen:
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or request.url.split("?")[0] == FILTER_URL and request.method == "GET":
+            continue # The page itself or assets
+        response = request.response()
+        try:
+            text = response.text() if response else None
+        except Exception:
+            continue
+        candidates.append((request.method, request.url, request.post_data, request.headers, text))
+    recorded = match_date_request(candidates, market_value, dates)
+    if recorded is not None:
+        date_requests.save(recorded)
+
+def scrape_bulletin_page(page, market_value, date_value=None):
+    _select_market(page, market_value, date_value)
+
+    # Select Date (latest unless a specific one was asked for)
+    date_select = page.locator("select").nth(DATE_SELECT_INDEX - 1)
+    with STEP_SECONDS.time(step="select_date"):
+        if date_value:
+            date_select.select_option(value=date_value)
+        else:
+            date_select.select_option(index=LATEST_DATE_OPTION_INDEX)
+    logger.info(f"Data selecionada: {date_value}" if date_value else "Data mais recente selecionada.")
+
+    # Click OK and wait for the bulletin POST to be answered
+    logger.info("Clicando no botão OK...")
+    # Use a more robust selector if index fails
+    ok_button_selector = f":nth-match(a:has-text(\"Ok\"), {OK_BUTTON_INDEX})"
+    with STEP_SECONDS.time(step="click_ok"):
+        with page.expect_response(is_bulletin_response, timeout=NAVIGATION_TIMEOUT_MS):
+            page.locator(ok_button_selector).click()
+
+    logger.info("Aguardando a tabela de resultados...")
+    with STEP_SECONDS.time(step="results_wait"):
+        page.wait_for_selector(RESULTS_SELECTOR, state="attached", timeout=NAVIGATION_TIMEOUT_MS)
+    logger.info(f"Página de resultados carregada: {page.url}")
+
+    # Get HTML content
+    html_content = page.content()
+    logger.info("Conteúdo HTML da página de resultados obtido.")
+    return html_content
+
+def list_dates_page(page, market_value):
+    _select_market(page, market_value, record_dates=True)
+    return parse_date_options(page.content())
+
+class PlaywrightFetchEngine(FetchEngine):
+    """Runs the page walks above on a warm browser from a BrowserPool."""
+
+    name = "playwright"
+
+    def __init__(self, pool, timeout=180, limiter=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.limiter = limiter or _unlimited
+
+    def _run(self, fn):
+        with self.limiter.slot(FILTER_URL):
+            return self.pool.run(fn, timeout=self.timeout)
+
+    def fetch(self, market_value, date_value=None):
+        try:
+            return self._run(lambda page: scrape_bulletin_page(page, market_value, date_value))
+        except Exception as e:
+            logger.error(f"[playwright] Erro durante o scraping: {e}")
+            traceback.print_exc()
+            return None
+
+    def list_dates(self, market_value):
+        try:
+            return self._run(lambda page: list_dates_page(page, market_value))
+        except Exception as e:
+            logger.error(f"[playwright] Erro ao listar datas do mercado {market_value}: {e}")
+            return []
+
+def fetch_with_fallback(engines, market_value, date_value=None):
+    """Try each engine in order until one returns HTML that passes validation.
+
+    Returns (html_content, engine_name), or (None, None) if every engine failed.
+    """
+    for engine in engines:
+        html_content = engine.fetch(market_value, date_value)
+        problem = validate_bulletin_html(html_content)
+        if problem is None:
+            logger.info(f"Boletim obtido com o motor '{engine.name}'.")
+            return html_content, engine.name
+        logger.warning(f"Motor '{engine.name}' falhou na validação: {problem}.")
+    return None, None
+
+def list_dates_with_fallback(engines, market_value):
+    """Dates available for a market from the first engine that can list them."""
+    for engine in engines:
+        dates = engine.list_dates(market_value)
+        if dates:
+            return dates
+        logger.warning(f"Motor '{engine.name}' não listou datas para o mercado {market_value}.")
+    return []
@@ -0,0 +1,216 @@
+# fixture_server.py
+# Offline stand-in for the CEASA host, for benchmarks and local runs without
+# network access. Serves a filter page shaped like the real one (market and
+# date selects at the positions the browser walk expects, hidden form
+# fields, the fifth "Ok" link submitting the form) and answers the bulletin
+# POST with post_response.html, optionally scaled to 10x/100x/1000x rows.
+# With dynamic_dates, the date dropdown starts empty and is filled in by an
+# AJAX POST after a market is picked, answered with ScriptCase's field
+# refresh JSON, as on the live site.
+#
+# Point the fetch engines at it with CEASA_BASE_URL=<server.base_url> set
+# before fetch_engines is imported, or run it on its own:
+#
+#   python fixture_server.py [--port 8765] [--scale 1] [--latency 0.05]
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SAMPLE_FILE = "post_response.html"
+FILTER_PATH = "/detec/filtro_boletim_es/filtro_boletim_es.php"
+BULLETIN_PATH = "/detec/boletim_completo_es/boletim_completo_es.php"
+MARKETS = [
+    ("211", "CEASA GRANDE VITÓRIA"),
+    ("212", "CEASA COLATINA"),
+    ("213", "CEASA CACHOEIRO DE ITAPEMIRIM"),
+]
+DATES = ["20250425", "20250424", "20250423", "20250422"]
+DATE_LIST_OPTION = "ajax_refresh_datas" # nmgp_opcao of the dynamic date-list call
+
+FILTER_PAGE = """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">
+<html>
+<head><meta http-equiv="Content-Type" content="text/html; charset=utf-8" /><title>Boletim Diário de Preços</title></head>
+<body>
+<form name="F1" method="post" action="../boletim_completo_es/boletim_completo_es.php">
+<input type="hidden" name="script_case_init" value="1234">
+<input type="hidden" name="script_case_session" value="fixture">
+<input type="hidden" name="csrf_token" value="fixture-token">
+<input type="hidden" name="nm_form_submit" value="1">
+<input type="hidden" name="bok" value="OK">
+<input type="hidden" name="nmgp_opcao" value="pesq">
+<a href="#">Ok</a> <a href="#">Ok</a> <a href="#">Ok</a> <a href="#">Ok</a>
+<select name="tipo"><option value="1">Completo</option></select>
+<select name="ordem"><option value="1">Produto</option></select>
+<select name="mercado"{onchange}>
+<option value="">Selecione</option>
+{markets}
+</select>
+<select name="datas">
+<option value="">Selecione</option>
+{dates}
+</select>
+<a href="#" onclick="document.F1.submit(); return false;">Ok</a>
+</form>
+{script}
+</body>
+</html>
+"""
+
+# Mimics the ScriptCase AJAX refresh of the date field after a market is picked
+DATE_LIST_SCRIPT = """<script>
+function sc_refresh_datas(market) {
+  var request = new XMLHttpRequest();
+  request.open("POST", "filtro_boletim_es.php");
+  request.setRequestHeader("Content-Type", "application/x-www-form-urlencoded");
+  request.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+  request.onload = function () {
+    var field = JSON.parse(request.responseText).fldList[0];
+    var select = document.F1.datas;
+    select.options.length = 0;
+    field.optList.forEach(function (option) { select.add(new Option(option.label, option.value)); });
+  };
+  request.send("nmgp_opcao=DATE_LIST_OPTION&script_case_init=" + document.F1.script_case_init.value + "&mercado=" + encodeURIComponent(market));
+}
+</script>""".replace("DATE_LIST_OPTION", DATE_LIST_OPTION)
+
+def date_list_response(market):
+    """The JSON ScriptCase answers the date field refresh with."""
+    options = [{"value": "", "label": "Selecione"}] + [
+        {"value": value, "label": f"{value[6:]}/{value[4:6]}/{value[:4]}"} for value in DATES
+    ] if market else [{"value": "", "label": "Selecione"}]
+    return json.dumps({"result": "OK", "fldList": [{"fldName": "datas", "fldType": "select", "optList": options}]})
+
+def synthetic_bulletin(sample_html, scale):
+    """The sample page with its data rows repeated `scale` times. Copies after
+    the first get a numbered product name, so the pipeline keeps every row
+    instead of dropping them as repeated (product, package) pairs."""
+    rows = re.findall(r"<tr><td>.*?</tr>", sample_html)
+    copies = [
+        row if copy == 0 else re.sub(r"<tr><td>(.*?)</td>", lambda m: f"<tr><td>{m.group(1)} {copy}</td>", row, count=1)
+        for copy in range(scale) for row in rows
+    ]
+    body = "\n".join(copies)
+    return re.sub(r"(</tr>\s*)(<tr><td>.*</tr>)", lambda m: m.group(1) + body, sample_html, count=1, flags=re.S)
+
+def filter_page(selected_market=None, dynamic_dates=False):
+    markets = "\n".join(
+        f'<option value="{value}"{" selected" if value == selected_market else ""}>{name}</option>' for value, name in MARKETS
+    )
+    if dynamic_dates:
+        return FILTER_PAGE.format(
+            markets=markets, dates="", onchange=' onchange="sc_refresh_datas(this.value)"', script=DATE_LIST_SCRIPT,
+        )
+    dates = "\n".join(f'<option value="{value}">{value[6:]}/{value[4:6]}/{value[:4]}</option>' for value in DATES)
+    return FILTER_PAGE.format(markets=markets, dates=dates, onchange="", script="")
+
+class FixtureServer:
+    """ThreadingHTTPServer on 127.0.0.1 in a daemon thread.
+
+    scale multiplies the bulletin rows; latency (seconds) is added to every
+    response to stand in for the round trip to the real host. dynamic_dates
+    serves the date list through the AJAX call instead of the page.
+    """
+
+    def __init__(self, scale=1, latency=0.0, port=0, sample_file=SAMPLE_FILE, dynamic_dates=False):
+        with open(sample_file, "r", encoding="utf-8") as f:
+            self.sample_html = f.read()
+        self.latency = latency
+        self.dynamic_dates = dynamic_dates
+        self.requests_served = 0
+        self._bulletins = {}
+        self._lock = threading.Lock()
+        self.scale = scale
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/detec/"
+
+    def bulletin(self, scale=None):
+        """Encoded bulletin page for scale (default: the server's), built once."""
+        scale = scale or self.scale
+        with self._lock:
+            if scale not in self._bulletins:
+                self._bulletins[scale] = synthetic_bulletin(self.sample_html, scale).encode("utf-8")
+            return self._bulletins[scale]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real host
+            disable_nagle_algorithm = True # Headers and body go out in separate writes
+
+            def _send(self, status, body=b"", content_type="text/html; charset=utf-8"):
+                if fixture.latency:
+                    time.sleep(fixture.latency)
+                with fixture._lock:
+                    fixture.requests_served += 1
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == FILTER_PATH:
+                    market = parse_qs(url.query).get("mercado", [None])[0]
+                    self._send(200, filter_page(market, fixture.dynamic_dates).encode("utf-8"))
+                elif url.path == "/favicon.ico":
+                    self._send(404)
+                else:
+                    self._send(404, b"not found")
+
+            def do_POST(self):
+                fields = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8"))
+                path = urlsplit(self.path).path
+                if path == BULLETIN_PATH:
+                    self._send(200, fixture.bulletin())
+                elif path == FILTER_PATH and fields.get("nmgp_opcao") == [DATE_LIST_OPTION]:
+                    body = date_list_response(fields.get("mercado", [None])[0]).encode("utf-8")
+                    self._send(200, body, "application/json; charset=utf-8")
+                else:
+                    self._send(404, b"not found")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Servidor local que imita o site da CEASA-ES.")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--scale", type=int, default=1, help="multiplica as linhas do boletim")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="atraso por resposta, em segundos")
+    arg_parser.add_argument("--dynamic-dates", action="store_true", help="datas carregadas por AJAX, como no site real")
+    args = arg_parser.parse_args()
+    server = FixtureServer(scale=args.scale, latency=args.latency, port=args.port, dynamic_dates=args.dynamic_dates).start()
+    print(f"Servindo em {server.base_url} (CEASA_BASE_URL={server.base_url}). Ctrl+C para sair.")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# history_store.py
+# Append-only SQLite store with every bulletin ever processed, so price
+# history survives the overwrite of ceasa_data.json. Prices are kept as
+# integer centavos; (market, bulletin_date, product, package) is the
+# clustered primary key and (product, bulletin_date) covers product lookups.
+# The diff against the market's previous bulletin is computed on insert and
+# kept in bulletin_changes, so change feeds never re-read whole bulletins.
+import json
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime
+from bulletin_diff import diff_bulletins
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulletins (
+    id INTEGER PRIMARY KEY,
+    market TEXT NOT NULL,
+    bulletin_date TEXT NOT NULL, -- ISO YYYY-MM-DD
+    fetched_at TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    UNIQUE (market, bulletin_date)
+);
+CREATE TABLE IF NOT EXISTS prices (
+    market TEXT NOT NULL,
+    bulletin_date TEXT NOT NULL,
+    product TEXT NOT NULL,
+    package TEXT NOT NULL,
+    min_cents INTEGER,
+    mc_cents INTEGER,
+    max_cents INTEGER,
+    situation TEXT,
+    PRIMARY KEY (market, bulletin_date, product, package)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_prices_product_date ON prices (product, bulletin_date, market);
+CREATE TABLE IF NOT EXISTS bulletin_changes (
+    market TEXT NOT NULL,
+    from_date TEXT NOT NULL,
+    to_date TEXT NOT NULL,
+    changes TEXT NOT NULL, -- Compact JSON document, served as is
+    PRIMARY KEY (market, from_date, to_date)
+) WITHOUT ROWID;
+"""
+
+def to_iso_date(bulletin_date):
+    """'25/04/2025' (as shown on the bulletin) -> '2025-04-25'. ISO input passes
+    through once validated. Raises ValueError for anything else."""
+    if len(bulletin_date) == 10 and bulletin_date[4] == "-":
+        return date.fromisoformat(bulletin_date).isoformat()
+    return datetime.strptime(bulletin_date, "%d/%m/%Y").date().isoformat()
+
+def to_cents(value):
+    if value is None or value != value: # None or NaN
+        return None
+    return int(round(float(value) * 100))
+
+def from_cents(cents):
+    return cents / 100 if cents is not None else None
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL") # Readers don't block the ingesting writer
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_bulletin(self, market, bulletin_date, records, fetched_at=None):
+        """Insert a bulletin's records unless (market, bulletin_date) is already stored.
+
+        records use the ceasa_data.json shape ("Produtos", "Embalagem", "MIN",
+        "M.C.", "MAX", "Situação"). Returns True if the bulletin was new.
+        """
+        iso_date = to_iso_date(bulletin_date)
+        fetched_at = fetched_at or datetime.now().isoformat()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO bulletins (market, bulletin_date, fetched_at, row_count) VALUES (?, ?, ?, ?)",
+                (market, iso_date, fetched_at, len(records)),
+            )
+            if cursor.rowcount == 0:
+                logger.info(f"Boletim {market} {iso_date} já está no histórico.")
+                return False
+            conn.executemany(
+                "INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(
+                    market, iso_date,
+                    record.get("Produtos", record.get("Produto")), record.get("Embalagem") or "",
+                    to_cents(record.get("MIN")), to_cents(record.get("M.C.")), to_cents(record.get("MAX")),
+                    record.get("Situação") if isinstance(record.get("Situação"), str) else None,
+                ) for record in records],
+            )
+            # Backfill can insert between two stored bulletins: diff both neighbours
+            previous_date, next_date = self._neighbour_dates(conn, market, iso_date)
+            if previous_date:
+                self._store_changes(conn, market, previous_date, iso_date)
+            if next_date:
+                self._store_changes(conn, market, iso_date, next_date)
+        logger.info(f"Boletim {market} {iso_date} adicionado ao histórico ({len(records)} linhas).")
+        return True
+
+    def _neighbour_dates(self, conn, market, iso_date):
+        row = conn.execute(
+            "SELECT (SELECT MAX(bulletin_date) FROM bulletins WHERE market = ?1 AND bulletin_date < ?2),"
+            " (SELECT MIN(bulletin_date) FROM bulletins WHERE market = ?1 AND bulletin_date > ?2)",
+            (market, iso_date),
+        ).fetchone()
+        return row[0], row[1]
+
+    def _bulletin_prices(self, conn, market, iso_date):
+        rows = conn.execute(
+            "SELECT product, package, min_cents, mc_cents, max_cents, situation FROM prices"
+            " WHERE market = ? AND bulletin_date = ?",
+            (market, iso_date),
+        )
+        return {(row[0], row[1]): tuple(row[2:]) for row in rows}
+
+    def _store_changes(self, conn, market, from_date, to_date):
+        diff = diff_bulletins(self._bulletin_prices(conn, market, from_date), self._bulletin_prices(conn, market, to_date))
+        changes = json.dumps(
+            {"market": market, "from": from_date, "to": to_date, **diff}, ensure_ascii=False, separators=(",", ":")
+        )
+        conn.execute("INSERT OR REPLACE INTO bulletin_changes VALUES (?, ?, ?, ?)", (market, from_date, to_date, changes))
+        return changes
+
+    def changes(self, market, since, until=None):
+        """Compact JSON diff from bulletin since to bulletin until (default: latest).
+
+        Diffs between consecutive bulletins are stored at insert time; other
+        pairs are computed on first request and stored too. None if either
+        bulletin is not in the history.
+        """
+        since = to_iso_date(since)
+        until = to_iso_date(until) if until else self.latest_bulletin_date(market)
+        if until is None or not (self.has_bulletin(market, since) and self.has_bulletin(market, until)):
+            return None
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT changes FROM bulletin_changes WHERE market = ? AND from_date = ? AND to_date = ?",
+            (market, since, until),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        with conn:
+            return self._store_changes(conn, market, since, until)
+
+    def has_bulletin(self, market, bulletin_date):
+        row = self._connect().execute(
+            "SELECT 1 FROM bulletins WHERE market = ? AND bulletin_date = ?",
+            (market, to_iso_date(bulletin_date)),
+        ).fetchone()
+        return row is not None
+
+    def latest_bulletin_date(self, market=None):
+        """Newest ISO bulletin date of a market (of any market when None)."""
+        if market is None:
+            return self._connect().execute("SELECT MAX(bulletin_date) FROM bulletins").fetchone()[0]
+        row = self._connect().execute(
+            "SELECT MAX(bulletin_date) FROM bulletins WHERE market = ?", (market,)
+        ).fetchone()
+        return row[0]
+
+    def bulletin_version(self, market):
+        """(latest bulletin date, bulletin count) of a market; changes whenever a bulletin is added."""
+        row = self._connect().execute(
+            "SELECT MAX(bulletin_date), COUNT(*) FROM bulletins WHERE market = ?", (market,)
+        ).fetchone()
+        return row[0], row[1]
+
+    def catalog_version(self):
+        """(bulletin count, latest fetch) over every market; changes whenever a bulletin is added."""
+        row = self._connect().execute("SELECT COUNT(*), MAX(fetched_at) FROM bulletins").fetchone()
+        return row[0], row[1]
+
+    def product_catalog(self):
+        """(market, product, last ISO date listed) of every product ever stored."""
+        return [tuple(row) for row in self._connect().execute(
+            "SELECT market, product, MAX(bulletin_date) FROM prices GROUP BY market, product"
+        )]
+
+    def bulletins_on(self, bulletin_date):
+        """((market, fetched_at), ...) of the bulletins stored for a date, by market."""
+        return tuple(tuple(row) for row in self._connect().execute(
+            "SELECT market, fetched_at FROM bulletins WHERE bulletin_date = ? ORDER BY market",
+            (to_iso_date(bulletin_date),),
+        ))
+
+    def prices_on(self, bulletin_date):
+        """(market, product, package, min_cents, mc_cents, max_cents) of every market's bulletin of a date."""
+        iso_date = to_iso_date(bulletin_date)
+        return [tuple(row) for row in self._connect().execute(
+            "SELECT market, product, package, min_cents, mc_cents, max_cents FROM prices"
+            " WHERE market IN (SELECT market FROM bulletins WHERE bulletin_date = ?1) AND bulletin_date = ?1",
+            (iso_date,),
+        )]
+
+    def list_bulletins(self, market=None):
+        sql = "SELECT market, bulletin_date, fetched_at, row_count FROM bulletins"
+        params = ()
+        if market:
+            sql += " WHERE market = ?"
+            params = (market,)
+        return [dict(row) for row in self._connect().execute(sql + " ORDER BY bulletin_date, market", params)]
+
+    def price_rows(self, market):
+        """(bulletin_date, product, package, min_cents, mc_cents, max_cents, situation) tuples of a market."""
+        return [tuple(row) for row in self._connect().execute(
+            "SELECT bulletin_date, product, package, min_cents, mc_cents, max_cents, situation FROM prices WHERE market = ?",
+            (market,),
+        )]
+
+    def query_prices(self, product=None, start_date=None, end_date=None, market=None):
+        """Price rows filtered by exact product, ISO date range and market."""
+        clauses, params = [], []
+        if product:
+            clauses.append("product = ?")
+            params.append(product)
+        if market:
+            clauses.append("market = ?")
+            params.append(market)
+        if start_date:
+            clauses.append("bulletin_date >= ?")
+            params.append(to_iso_date(start_date))
+        if end_date:
+            clauses.append("bulletin_date <= ?")
+            params.append(to_iso_date(end_date))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            "SELECT market, bulletin_date, product, package, min_cents, mc_cents, max_cents, situation"
+            f" FROM prices{where} ORDER BY bulletin_date, market, product",
+            params,
+        )
+        return [{
+            "market": row["market"],
+            "bulletin_date": row["bulletin_date"],
+            "Produtos": row["product"],
+            "Embalagem": row["package"],
+            "MIN": from_cents(row["min_cents"]),
+            "M.C.": from_cents(row["mc_cents"]),
+            "MAX": from_cents(row["max_cents"]),
+            "Situação": row["situation"],
+        } for row in rows]
@@ -0,0 +1,103 @@
+# http_cache.py
+# Conditional, precompressed responses for bulletin snapshots. Each payload
+# is hashed and compressed once when the snapshot is built; requests are then
+# answered from memory with 304s or the best matching encoding.
+import gzip
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from flask import Response
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=600"
+
+class Payload:
+    """A response body with its ETag, Last-Modified and compressed variants."""
+
+    def __init__(self, body, mimetype, last_modified):
+        self.body = body
+        self.mimetype = mimetype
+        # Second resolution, as in the HTTP date format
+        self.last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+        self.last_modified_header = format_datetime(self.last_modified, usegmt=True)
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Compressed variants carry a suffix; they all represent the same snapshot
+        if candidate.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+def _not_modified_since(if_modified_since, last_modified):
+    try:
+        return last_modified <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+def _accepted_encoding(accept_encoding, payload):
+    """Pick br, then gzip, when the client accepts them (q=0 means refused)."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in payload.encodings and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+def negotiate(payload, request_headers, headers=None):
+    """(status, body, headers) of the 304 or (possibly compressed) 200 answer
+    to a request for payload. request_headers only needs a case-insensitive
+    get(), so the Flask app and the ASGI service share this."""
+    response_headers = {
+        "ETag": f'"{payload.etag}"',
+        "Last-Modified": payload.last_modified_header,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    response_headers.update(headers or {})
+
+    if_none_match = request_headers.get("If-None-Match")
+    if_modified_since = request_headers.get("If-Modified-Since")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, payload.etag)
+    else:
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, payload.last_modified)
+    if not_modified:
+        return 304, b"", response_headers
+
+    encoding = _accepted_encoding(request_headers.get("Accept-Encoding") or "", payload)
+    body = payload.body
+    if encoding:
+        body = payload.encodings[encoding]
+        response_headers["Content-Encoding"] = encoding
+        response_headers["ETag"] = f'"{payload.etag}-{encoding}"'
+    return 200, body, response_headers
+
+def conditional_response(payload, request, headers=None):
+    """Build a 304 or a (possibly compressed) 200 Flask response for payload."""
+    status, body, response_headers = negotiate(payload, request.headers, headers)
+    if status == 304:
+        return Response(status=304, headers=response_headers)
+    return Response(body, mimetype=payload.mimetype, headers=response_headers)
@@ -0,0 +1,280 @@
+# ingestion.py
+# The one bulletin ingestion pipeline shared by the Flask app, scraper.py,
+# process_html.py and backfill.py. Each stage is a callable taking the
+# IngestionJob being built and filling in its part:
+#
+#   fetch -> raw_archive -> parse -> normalize -> validate -> render -> persist -> mark_processed
+#
+# Entry points pick the stages they need (process_html.py starts from a
+# saved page, backfill.py only persists to the history) and can swap any of
+# them. With a RawArchive, every downloaded page is archived and a page
+# identical to the one last processed ends the job after raw_archive.
+# Pipeline.run() times every stage and reports it through on_stage;
+# Pipeline.run_async() does the same on the ASGI service's event loop.
+import asyncio
+import inspect
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from bulletin_parser import parse_bulletin, row_to_record
+from fetch_engines import fetch_with_fallback
+from history_store import to_cents, to_iso_date
+from snapshot import build_snapshot, write_atomic
+
+logger = logging.getLogger(__name__)
+
+class IngestionError(Exception):
+    """A stage rejected the job; the message says why (shown in logs and checkpoints)."""
+
+class IngestionSkipped(Exception):
+    """A stage found nothing new to process: the job stops there but is not a failure."""
+
+@dataclass
+class IngestionJob:
+    market_value: str
+    market_name: str
+    date_value: str = None # Dropdown value of a past bulletin; None for the latest
+    requested_date: str = None # ISO date the caller expects, used when the page has none
+    html: str = None
+    engine: str = None # Fetch engine that produced html
+    content_hash: str = None # SHA-256 of html, set by RawArchiveStage
+    bulletin: object = None # bulletin_parser.Bulletin
+    rows: list = None # Normalized BulletinRow values
+    bulletin_date: str = None # As printed on the bulletin (dd/mm/yyyy)
+    iso_date: str = None
+    snapshot: object = None # snapshot.Snapshot
+    warnings: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict) # Stage name -> seconds
+    failed_stage: str = None
+    error: str = None
+    skipped: str = None # Why the job stopped early without changes, if it did
+    persist_failed: bool = False # The snapshot is good but was not written to disk
+    stored: bool = False # HistoryStage inserted the bulletin (it was not in the history yet)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def records(self):
+        return [row_to_record(row) for row in self.rows]
+
+class FetchStage:
+    """Download the bulletin page, trying each engine in order."""
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    def __call__(self, job):
+        job.html, job.engine = fetch_with_fallback(self.engines, job.market_value, job.date_value)
+        if job.html is None:
+            raise IngestionError("falha no download")
+
+class RawArchiveStage:
+    """Archive the downloaded page (raw_archive.RawArchive) and skip the rest
+    of the job when unchanged(job) says the caller's output already comes
+    from this very page. By default that is the archive's processed marker:
+    the page the (market, date) bulletin was last fully persisted from.
+    Callers whose output lives in memory pass their own check (the app
+    compares with the content_hash of the snapshot it is serving).
+
+    mark_processed is the pipeline's last stage: only a job that went all the
+    way through, persist included, records its page as processed.
+    """
+
+    def __init__(self, archive, unchanged=None):
+        self.archive = archive
+        self.unchanged = unchanged or self.processed_before
+
+    def processed_before(self, job):
+        return self.archive.last_processed(job.market_value, job.date_value) == job.content_hash
+
+    def __call__(self, job):
+        try:
+            job.content_hash = self.archive.store(job.html, job.market_value, job.date_value, job.engine)
+        except OSError as e:
+            job.warnings.append(f"resposta bruta não foi arquivada: {e}")
+            return
+        if self.unchanged(job):
+            raise IngestionSkipped(f"página idêntica à última processada ({job.content_hash[:12]})")
+
+    def mark_processed(self, job):
+        if job.content_hash is not None and not job.persist_failed:
+            self.archive.mark_processed(job.market_value, job.date_value, job.content_hash)
+
+def parse_stage(job):
+    job.bulletin = parse_bulletin(job.html)
+    if job.bulletin is None:
+        raise IngestionError("tabela não encontrada")
+
+def normalize_stage(job):
+    """Trim names, drop rows without a product and repeated (product, package)
+    pairs, and resolve the bulletin date."""
+    rows, seen = [], set()
+    for row in job.bulletin.rows:
+        product, package = (row.product or "").strip(), (row.package or "").strip()
+        if not product or (product, package) in seen:
+            continue
+        seen.add((product, package))
+        rows.append(row._replace(product=product, package=package, situation=(row.situation or "").strip()))
+    job.rows = rows
+    job.bulletin_date = job.bulletin.bulletin_date
+    # Trust the date on the page over the one the caller asked for
+    job.iso_date = to_iso_date(job.bulletin_date) if job.bulletin_date else job.requested_date
+
+def validate_stage(job):
+    if not job.rows:
+        raise IngestionError("boletim sem linhas")
+    if job.bulletin_date is None:
+        job.warnings.append("data do boletim não encontrada na página")
+    inverted = sum(1 for row in job.rows if row.min is not None and row.max is not None and row.min > row.max)
+    if inverted:
+        job.warnings.append(f"{inverted} linhas com MIN maior que MAX")
+
+def render_stage(job):
+    """Build the in-memory snapshot (JSON, page and its variants)."""
+    job.snapshot = build_snapshot(
+        job.market_value, job.market_name, job.bulletin_date, job.rows, datetime.now(), job.content_hash,
+    )
+
+class PublishStage:
+    """Swap the new snapshot into a SnapshotStore, before it is persisted."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __call__(self, job):
+        self.store.swap(job.snapshot)
+
+class PersistStage:
+    """Write the snapshot's JSON/HTML files (and history) through a SnapshotWriter.
+
+    files_for(market_value) -> (data file, html file). wait_timeout bounds how
+    long the job waits for the write; a failed or slow write is a warning,
+    the snapshot is still good.
+    """
+
+    def __init__(self, writer, files_for, wait_timeout=None):
+        self.writer = writer
+        self.files_for = files_for
+        self.wait_timeout = wait_timeout
+
+    def __call__(self, job):
+        persisted = self.writer.submit(job.snapshot, *self.files_for(job.market_value))
+        try:
+            persisted.result(timeout=self.wait_timeout)
+        except Exception as e:
+            job.persist_failed = True
+            job.warnings.append(f"snapshot não foi salvo em disco: {e}")
+
+class HistoryStage:
+    """Store the bulletin in the history only (batch backfills). With an
+    archive_dir, a bulletin new to the history is also merged into the
+    market's columnar history archive, as SnapshotWriter does for the app."""
+
+    def __init__(self, history, archive_dir=None):
+        self.history = history
+        self.archive_dir = archive_dir
+
+    def __call__(self, job):
+        if job.iso_date is None:
+            raise IngestionError("data do boletim desconhecida")
+        if job.requested_date and job.iso_date != job.requested_date:
+            # The site answered with another bulletin (usually the latest one)
+            raise IngestionError(f"página trouxe o boletim de {job.iso_date}, não o de {job.requested_date}")
+        job.stored = self.history.add_bulletin(job.market_name, job.iso_date, job.records())
+        if job.stored and self.archive_dir:
+            try:
+                self._archive(job)
+            except Exception as e:
+                job.warnings.append(f"arquivo colunar não foi atualizado: {e}")
+
+    def _archive(self, job):
+        from columnar_archive import history_path, update_history # numpy, only when archiving
+        path = history_path(self.archive_dir, job.market_value)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows = [(job.iso_date, row.product, row.package, to_cents(row.min), to_cents(row.mc), to_cents(row.max), row.situation or None)
+                for row in job.rows]
+        update_history(path, self.history, job.market_name, job.iso_date, rows, write_atomic)
+
+class Pipeline:
+    """Ordered (name, stage) pairs. on_stage(name, seconds, ok) is called after each stage."""
+
+    def __init__(self, stages, on_stage=None):
+        self.stages = list(stages)
+        self.on_stage = on_stage
+
+    def replace(self, name, stage):
+        """Copy of this pipeline with one stage swapped."""
+        return Pipeline([(n, stage if n == name else s) for n, s in self.stages], self.on_stage)
+
+    def _stage_failed(self, job, name, error):
+        if isinstance(error, IngestionSkipped):
+            job.skipped = str(error)
+        elif isinstance(error, IngestionError):
+            job.failed_stage, job.error = name, str(error)
+        else:
+            logger.error(f"Erro inesperado na etapa {name} ({job.market_value})", exc_info=error)
+            job.failed_stage, job.error = name, f"erro inesperado: {error}"
+
+    def _stage_done(self, job, name, started):
+        """Record a stage's time; False when the job failed or was skipped and must stop."""
+        job.timings[name] = time.perf_counter() - started
+        if self.on_stage:
+            self.on_stage(name, job.timings[name], job.ok)
+        if not job.ok:
+            logger.error(f"Ingestão de {job.market_name} falhou na etapa {name}: {job.error}")
+        elif job.skipped:
+            logger.info(f"Ingestão de {job.market_name} encerrada na etapa {name}: {job.skipped}")
+        return job.ok and not job.skipped
+
+    def _finished(self, job):
+        for warning in job.warnings:
+            logger.warning(f"{job.market_name}: {warning}")
+        logger.info(f"Ingestão de {job.market_name}: " + ", ".join(f"{n} {s * 1000:.0f} ms" for n, s in job.timings.items()))
+        return job
+
+    def run(self, job):
+        for name, stage in self.stages:
+            started = time.perf_counter()
+            try:
+                stage(job)
+            except Exception as e:
+                self._stage_failed(job, name, e)
+            if not self._stage_done(job, name, started):
+                break
+        return self._finished(job)
+
+    async def run_async(self, job):
+        """run() for the ASGI service: coroutine stages are awaited and the
+        others run in a worker thread, so the event loop keeps serving."""
+        for name, stage in self.stages:
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(stage) or inspect.iscoroutinefunction(getattr(stage, "__call__", None)):
+                    await stage(job)
+                else:
+                    await asyncio.to_thread(stage, job)
+            except Exception as e:
+                self._stage_failed(job, name, e)
+            if not self._stage_done(job, name, started):
+                break
+        return self._finished(job)
+
+def build_pipeline(engines=None, render=True, persist=(), on_stage=None, raw_archive=None, unchanged=None):
+    """The standard stages: fetch (when engines are given), parse, normalize,
+    validate and render (unless render=False), followed by the (name, stage)
+    pairs in persist. With a raw_archive (and engines), downloaded pages are
+    archived and unchanged ones skipped (see RawArchiveStage)."""
+    stages = [("fetch", FetchStage(engines))] if engines is not None else []
+    archive_stage = RawArchiveStage(raw_archive, unchanged) if raw_archive is not None and engines is not None else None
+    if archive_stage:
+        stages.append(("raw_archive", archive_stage))
+    stages += [("parse", parse_stage), ("normalize", normalize_stage), ("validate", validate_stage)]
+    if render:
+        stages.append(("render", render_stage))
+    stages += list(persist)
+    if archive_stage:
+        stages.append(("mark_processed", archive_stage.mark_processed))
+    return Pipeline(stages, on_stage)
@@ -0,0 +1,87 @@
+# market_comparison.py
+# Product x market price matrix for one bulletin date, so buyers can compare
+# the same product across CEASA units. The date's rows of every market come
+# from the history store in one query, are pivoted with pandas into MIN,
+# M.C. and MAX matrices (one column per market) and serialized once; the
+# JSON is cached per date until another bulletin of that date is stored.
+import json
+import threading
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from http_cache import Payload
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = {"MIN": "min_cents", "M.C.": "mc_cents", "MAX": "max_cents"}
+CACHE_SIZE = 64 # Dates kept in memory
+
+def _reais_lists(cents):
+    """Centavos matrix (NaN for missing) -> per-row lists of reais, None for missing."""
+    reais = np.round(cents / 100, 2).astype(object)
+    reais[np.isnan(cents)] = None
+    return reais.tolist()
+
+def build_comparison(iso_date, rows):
+    """The comparison document for rows of (market, product, package,
+    min_cents, mc_cents, max_cents) from a single bulletin date.
+
+    Each entry of "data" has one price per market for MIN, M.C. and MAX,
+    in the order of "markets", and the market with the lowest M.C.
+    """
+    if not rows:
+        return {"date": iso_date, "markets": [], "data": []}
+    frame = pd.DataFrame.from_records(
+        rows, columns=["market", "product", "package", "min_cents", "mc_cents", "max_cents"],
+    )
+    for column in PRICE_COLUMNS.values():
+        frame[column] = frame[column].astype("float64") # None -> NaN
+    markets = sorted(frame["market"].unique())
+    # (product, package, market) is unique per date, so a plain pivot is enough
+    matrix = frame.pivot(index=["product", "package"], columns="market", values=list(PRICE_COLUMNS.values()))
+    matrix = matrix.reindex(columns=pd.MultiIndex.from_product([list(PRICE_COLUMNS.values()), markets])).sort_index()
+
+    prices = {field: matrix[column].to_numpy(dtype="float64") for field, column in PRICE_COLUMNS.items()}
+    mc = prices["M.C."]
+    cheapest = np.where(np.isnan(mc), np.inf, mc).argmin(axis=1)
+    priced = ~np.isnan(mc).all(axis=1)
+    columns = {field: _reais_lists(values) for field, values in prices.items()}
+    data = [{
+        "Produtos": product,
+        "Embalagem": package,
+        **{field: columns[field][position] for field in PRICE_COLUMNS},
+        "cheapest": markets[cheapest[position]] if priced[position] else None,
+    } for position, (product, package) in enumerate(matrix.index)]
+    return {"date": iso_date, "markets": markets, "data": data}
+
+class ComparisonCache:
+    """Comparison payloads per ISO date, rebuilt when a bulletin of that date
+    is added (or backfilled) for any market."""
+
+    def __init__(self, history):
+        self.history = history
+        self._payloads = {} # iso date -> (version, Payload)
+        self._lock = threading.Lock()
+
+    def get(self, iso_date):
+        """Payload of the comparison for iso_date, or None if no market has a bulletin that day."""
+        version = self.history.bulletins_on(iso_date)
+        if not version:
+            return None
+        cached = self._payloads.get(iso_date)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            cached = self._payloads.get(iso_date)
+            if cached is None or cached[0] != version:
+                with STEP_SECONDS.time(step="comparison_pivot"):
+                    document = build_comparison(iso_date, self.history.prices_on(iso_date))
+                body = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                last_fetch = max(datetime.fromisoformat(fetched_at) for _, fetched_at in version)
+                if len(self._payloads) >= CACHE_SIZE:
+                    self._payloads.clear()
+                cached = self._payloads[iso_date] = (version, Payload(body, "application/json", last_fetch))
+                logger.info(f"Comparação de {iso_date} calculada ({len(document['data'])} produtos, {len(document['markets'])} mercados).")
+        return cached[1]
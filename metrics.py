@@ -0,0 +1,171 @@
+# metrics.py
+# In-process counters, gauges and histograms exported in the Prometheus text
+# format (version 0.0.4) on /metrics. Small enough to avoid a client library:
+# every metric keeps its samples per label tuple under one lock, and gauges
+# can be computed at scrape time from a callback.
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond parses up to multi-minute browser scrapes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}, recebeu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())
+        ]
+
+class Gauge(_Metric):
+    """Set directly, or computed at collection time by set_function(fn), where
+    fn returns {label tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def collect(self):
+        if self._function is not None:
+            values = self._function()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = self._header()
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REGISTRY = Registry()
+
+# --- Metrics shared by the app, the pipeline and the fetch engines ---
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "ceasa_ingestion_stage_seconds", "Duração de cada etapa do pipeline de ingestão.", ["stage"],
+))
+STEP_SECONDS = REGISTRY.register(Histogram(
+    "ceasa_step_seconds",
+    "Duração de passos internos: navegador (launch, goto, select, espera das datas, click, espera da tabela), "
+    "requisições HTTP, parse, JSON, renderização e gravação de arquivos.",
+    ["step"],
+))
+SCRAPES = REGISTRY.register(Counter(
+    "ceasa_scrapes_total", "Atualizações de boletim por resultado (success, unchanged, failure).", ["market", "result"],
+))
+PROBES = REGISTRY.register(Counter(
+    "ceasa_probes_total", "Verificações da lista de datas por resultado (new, unchanged, unknown).", ["market", "result"],
+))
+STALE_SERVED = REGISTRY.register(Counter(
+    "ceasa_stale_served_total",
+    "Respostas servidas com um snapshot antigo (reason: expired = atualização em segundo plano, "
+    "refresh_failed = atualização falhou).",
+    ["market", "reason"],
+))
+SNAPSHOT_AGE = REGISTRY.register(Gauge(
+    "ceasa_snapshot_age_seconds", "Idade do snapshot em memória de cada mercado.", ["market"],
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "ceasa_http_request_seconds", "Latência das requisições por rota.", ["route", "method", "status"],
+))
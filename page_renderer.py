@@ -0,0 +1,67 @@
+# page_renderer.py
+# The bulletin page, rendered from typed rows with one Jinja template that
+# is compiled once at import. Styles live in static/ceasa.css and are
+# referenced with a content hash, so browsers can cache them for a year.
+# Used by app.py (one render per snapshot and filter variant) and by the
+# standalone scraper.py / process_html.py scripts.
+import hashlib
+import os
+from urllib.parse import urlencode
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from bulletin_parser import COLUMNS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+CSS_FILE = "ceasa.css"
+SOURCE_URL = "http://200.198.51.71/detec/filtro_boletim_es/filtro_boletim_es.php"
+BULLETIN_DATE_NOT_FOUND = "Não encontrada"
+
+def _format_price(value):
+    return f"{value:.2f}" if value is not None else ""
+
+def _static_version(name):
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+_environment.filters["price"] = _format_price
+_template = _environment.get_template("bulletin.html")
+CSS_URL = f"/static/{CSS_FILE}?v={_static_version(CSS_FILE)}"
+
+def situations_of(rows):
+    """Situations present in the rows, in display order."""
+    return sorted({row.situation for row in rows if row.situation})
+
+def _page_url(market_value, situation):
+    params = {}
+    if market_value:
+        params["market"] = market_value
+    if situation:
+        params["situation"] = situation
+    return "/" + (f"?{urlencode(params)}" if params else "")
+
+def render_bulletin_page(market_name, bulletin_date, generated_at, rows, market_value=None, situation=None, situations=()):
+    """Render the page for rows (already filtered for situation, if any) as UTF-8 bytes.
+
+    situations lists the filter links to show; market_value is kept in those
+    links for markets other than the default.
+    """
+    filters = []
+    if situations:
+        filters.append(("Todos", _page_url(market_value, None), situation is None))
+        filters.extend((name, _page_url(market_value, name), name == situation) for name in situations)
+    return _template.render(
+        market_name=market_name,
+        bulletin_date=bulletin_date or BULLETIN_DATE_NOT_FOUND,
+        generated_at=generated_at,
+        rows=rows,
+        columns=COLUMNS,
+        filters=filters,
+        css_url=CSS_URL,
+        source_url=SOURCE_URL,
+    ).encode("utf-8")
@@ -0,0 +1,211 @@
+# price_query.py
+# Filtering, sorting, projection and cursor pagination over one snapshot's
+# records. PriceIndex is built once per snapshot (sorted product names,
+# per-situation buckets and one sort order per price column), so a query
+# only walks the rows that can match instead of the whole bulletin.
+import base64
+from bisect import bisect_left
+from bulletin_parser import COLUMNS, PRICE_COLUMNS
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NO_SITUATION = "-" # ?situation=- selects rows without a situation
+
+_PRICE_FIELD_ALIASES = {"min": "MIN", "mc": "M.C.", "m.c.": "M.C.", "max": "MAX"}
+_FIELD_ALIASES = {column.lower(): column for column in COLUMNS}
+_FIELD_ALIASES.update({"produto": "Produtos", "situacao": "Situação"}, **_PRICE_FIELD_ALIASES)
+
+class QueryError(ValueError):
+    """Invalid query parameter; the message is shown to the client."""
+
+def fold_name(name):
+    return (name or "").casefold()
+
+class PriceIndex:
+    def __init__(self, records):
+        self.records = tuple(records)
+        self._folded = [fold_name(record["Produtos"]) for record in self.records]
+        # (folded name, position) sorted, with a parallel array of names for bisect
+        by_name = sorted((name, position) for position, name in enumerate(self._folded))
+        self._sorted_names = [name for name, _ in by_name]
+        self._sorted_positions = [position for _, position in by_name]
+        self._by_situation = {}
+        for position, record in enumerate(self.records):
+            self._by_situation.setdefault(record["Situação"] or NO_SITUATION, []).append(position)
+        # Ascending and descending order per price column; ties keep bulletin
+        # order either way and rows without a price always come last
+        self._by_price, self._by_price_descending = {}, {}
+        for column in PRICE_COLUMNS:
+            priced = [(self.records[position][column], position)
+                      for position in range(len(self.records)) if self.records[position][column] is not None]
+            self._by_price[column] = [position for _, position in sorted(priced)]
+            self._by_price_descending[column] = [position for _, position in sorted(priced, key=lambda item: (-item[0], item[1]))]
+        self._without_price = {
+            column: [position for position, record in enumerate(self.records) if record[column] is None]
+            for column in PRICE_COLUMNS
+        }
+
+    @property
+    def situations(self):
+        return sorted(self._by_situation)
+
+    def _prefix_positions(self, prefix):
+        prefix = fold_name(prefix)
+        start = bisect_left(self._sorted_names, prefix)
+        end = start
+        while end < len(self._sorted_names) and self._sorted_names[end].startswith(prefix):
+            end += 1
+        return self._sorted_positions[start:end]
+
+    def _candidates(self, query):
+        """Positions that pass every filter, as a set, or None for 'all rows'."""
+        candidates = None
+        if query.prefix:
+            candidates = set(self._prefix_positions(query.prefix))
+        if query.situations:
+            bucket = set()
+            for situation in query.situations:
+                bucket.update(self._by_situation.get(situation, ()))
+            candidates = bucket if candidates is None else candidates & bucket
+        if query.contains:
+            needle = fold_name(query.contains)
+            pool = range(len(self.records)) if candidates is None else candidates
+            candidates = {position for position in pool if needle in self._folded[position]}
+        if query.min_price is not None or query.max_price is not None:
+            pool = range(len(self.records)) if candidates is None else candidates
+            candidates = {position for position in pool if query.price_in_range(self.records[position])}
+        return candidates
+
+    def _ordered(self, query, candidates):
+        if query.sort is None:
+            order = range(len(self.records))
+        else:
+            priced = (self._by_price_descending if query.descending else self._by_price)[query.sort]
+            order = priced + self._without_price[query.sort]
+        if candidates is None:
+            return list(order)
+        return [position for position in order if position in candidates]
+
+    def query(self, query, version=""):
+        """Run a PriceQuery. Returns (records, total matches, next cursor or None).
+
+        version identifies the snapshot; cursors from another snapshot are rejected.
+        """
+        positions = self._ordered(query, self._candidates(query))
+        offset = query.offset(version)
+        end = len(positions) if query.limit is None else offset + query.limit
+        page = positions[offset:end]
+        next_cursor = encode_cursor(version, end) if end < len(positions) else None
+        records = [self.records[position] for position in page]
+        if query.fields:
+            records = [{field: record[field] for field in query.fields} for record in records]
+        return records, len(positions), next_cursor
+
+def encode_cursor(version, offset):
+    return base64.urlsafe_b64encode(f"{version[:12]}:{offset}".encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, version):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        cursor_version, _, offset = raw.partition(":")
+        offset = int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise QueryError("cursor inválido")
+    if cursor_version != version[:12] or offset < 0:
+        raise QueryError("cursor expirado: o boletim foi atualizado, recomece a paginação")
+    return offset
+
+def _parse_price(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value.replace(",", "."))
+    except ValueError:
+        raise QueryError(f"{name} deve ser um número")
+
+def _parse_price_field(value, name):
+    field = _PRICE_FIELD_ALIASES.get(value.lower())
+    if field is None:
+        raise QueryError(f"{name} deve ser MIN, M.C. ou MAX")
+    return field
+
+class PriceQuery:
+    """Query parameters, validated. Build with PriceQuery.from_args(request.args)."""
+
+    # Parameters that make /data.json answer with a query instead of the whole bulletin
+    PARAMS = ("product", "q", "situation", "min_price", "max_price", "price_field", "sort", "fields", "limit", "cursor")
+
+    def __init__(self, prefix=None, contains=None, situations=(), min_price=None, max_price=None,
+                 price_field="M.C.", sort=None, descending=False, fields=None, limit=None, cursor=None):
+        self.prefix = prefix
+        self.contains = contains
+        self.situations = tuple(situations)
+        self.min_price = min_price
+        self.max_price = max_price
+        self.price_field = price_field
+        self.sort = sort
+        self.descending = descending
+        self.fields = fields
+        self.limit = limit
+        self.cursor = cursor
+
+    @classmethod
+    def from_args(cls, args, default_limit=None):
+        """Parse request args: product (prefix), q (substring), situation (comma
+        separated, '-' for none), min_price/max_price on price_field (default
+        M.C.), sort (MIN, M.C. or MAX, '-' prefix for descending), fields
+        (comma separated projection), limit and cursor."""
+        situations = [s.strip().upper() for s in args.get("situation", "").split(",") if s.strip()]
+
+        sort, descending = args.get("sort") or None, False
+        if sort:
+            descending = sort.startswith("-")
+            sort = _parse_price_field(sort.lstrip("-+"), "sort")
+
+        fields = None
+        if args.get("fields"):
+            fields = []
+            for name in args["fields"].split(","):
+                field = _FIELD_ALIASES.get(name.strip().lower())
+                if field is None:
+                    raise QueryError(f"campo desconhecido: {name.strip()}")
+                fields.append(field)
+
+        limit = args.get("limit")
+        if limit in (None, ""):
+            limit = default_limit
+        else:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise QueryError("limit deve ser um número inteiro")
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise QueryError(f"limit deve estar entre 1 e {MAX_PAGE_SIZE}")
+
+        return cls(
+            prefix=args.get("product") or None,
+            contains=args.get("q") or None,
+            situations=situations,
+            min_price=_parse_price(args, "min_price"),
+            max_price=_parse_price(args, "max_price"),
+            price_field=_parse_price_field(args.get("price_field") or "M.C.", "price_field"),
+            sort=sort,
+            descending=descending,
+            fields=fields,
+            limit=limit,
+            cursor=args.get("cursor") or None,
+        )
+
+    def price_in_range(self, record):
+        price = record[self.price_field]
+        if price is None:
+            return False
+        if self.min_price is not None and price < self.min_price:
+            return False
+        if self.max_price is not None and price > self.max_price:
+            return False
+        return True
+
+    def offset(self, version):
+        return decode_cursor(self.cursor, version) if self.cursor else 0
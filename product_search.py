@@ -0,0 +1,212 @@
+# product_search.py
+# Product name search over every market's catalog (current snapshots and the
+# whole history). Bulletin names are upper case without accents ("AGRIAO",
+# "ALFACE AMERICANA") while users type "agrião" or "alface americ", so names
+# and queries are accent- and case-folded the same way. The index is built
+# once per catalog version: a sorted token array answers word prefixes by
+# bisection (a flattened prefix trie) and per-word trigram postings rank
+# near misses, so a typo in one word of a long name still scores high.
+import threading
+import unicodedata
+from bisect import bisect_left
+from history_store import to_iso_date
+from metrics import STEP_SECONDS
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+FUZZY_MIN_SIMILARITY = 0.3 # Mean over query words of the best word-to-word trigram Jaccard similarity
+MIN_FUZZY_QUERY_LENGTH = 3
+_TOKEN_END = "\uffff" # Sorts after every folded character
+
+# Match kinds, best first
+EXACT, PREFIX, WORD_PREFIX, FUZZY = "exact", "prefix", "word_prefix", "fuzzy"
+_RANK = {EXACT: 0, PREFIX: 1, WORD_PREFIX: 2, FUZZY: 3}
+
+def fold(text):
+    """'Alface  Americâna' -> 'alface americana': no accents, case-folded,
+    punctuation turned into spaces and whitespace collapsed."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return " ".join("".join(c if c.isalnum() else " " for c in stripped).split())
+
+def trigrams(folded):
+    """Trigrams of each word, padded so short words and word starts count."""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def jaccard(grams, other):
+    shared = len(grams & other)
+    return shared / (len(grams) + len(other) - shared) if shared else 0.0
+
+def similarity(query_words, name_words):
+    """Mean, over the query's words, of the best trigram Jaccard similarity
+    with any word of the name: 'alfce' vs 'alface americana' is 0.44, not
+    the 0.2 of comparing it with the whole name."""
+    if not query_words:
+        return 0.0
+    name_grams = [trigrams(word) for word in name_words]
+    return sum(
+        max((jaccard(grams, other) for other in name_grams), default=0.0)
+        for grams in (trigrams(word) for word in query_words)
+    ) / len(query_words)
+
+class _Product:
+    __slots__ = ("name", "folded", "markets")
+
+    def __init__(self, name, folded):
+        self.name = name
+        self.folded = folded
+        self.markets = {} # market name -> last ISO date it was listed
+
+class ProductSearchIndex:
+    """Search index over (market name, product name, ISO date) entries."""
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        by_folded = {}
+        for market, name, iso_date in entries:
+            folded = fold(name)
+            if not folded:
+                continue
+            product = by_folded.get(folded)
+            if product is None:
+                product = by_folded[folded] = _Product(name.strip(), folded)
+            last_seen = product.markets.get(market)
+            if last_seen is None or (iso_date is not None and iso_date > last_seen):
+                product.markets[market] = iso_date
+        self.products = sorted(by_folded.values(), key=lambda product: product.folded)
+
+        token_postings = {}
+        for position, product in enumerate(self.products):
+            for token in set(product.folded.split()):
+                token_postings.setdefault(token, []).append(position)
+        self._tokens = sorted(token_postings)
+        self._token_positions = [token_postings[token] for token in self._tokens]
+        # Trigram -> indexes into _tokens: fuzzy matching is word against word
+        self._token_gram_counts = []
+        self._grams = {}
+        for token_index, token in enumerate(self._tokens):
+            grams = trigrams(token)
+            self._token_gram_counts.append(len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(token_index)
+
+    def __len__(self):
+        return len(self.products)
+
+    def _word_prefix_matches(self, words):
+        """Positions of products where every query word starts some word of the name."""
+        matches = None
+        for word in words:
+            start = bisect_left(self._tokens, word)
+            end = bisect_left(self._tokens, word + _TOKEN_END, start)
+            positions = set()
+            for postings in self._token_positions[start:end]:
+                positions.update(postings)
+            matches = positions if matches is None else matches & positions
+            if not matches:
+                return set()
+        return matches or set()
+
+    def _similarities(self, words):
+        """position -> similarity() with the query words, for products having
+        a word that shares a trigram with some query word."""
+        best = {} # position -> best similarity per query word
+        for word_index, word in enumerate(words):
+            grams = trigrams(word)
+            shared = {}
+            for gram in grams:
+                for token_index in self._grams.get(gram, ()):
+                    shared[token_index] = shared.get(token_index, 0) + 1
+            for token_index, count in shared.items():
+                score = count / (len(grams) + self._token_gram_counts[token_index] - count)
+                for position in self._token_positions[token_index]:
+                    scores = best.setdefault(position, [0.0] * len(words))
+                    scores[word_index] = max(scores[word_index], score)
+        return {position: sum(scores) / len(words) for position, scores in best.items()}
+
+    def search(self, query, market=None, limit=DEFAULT_LIMIT):
+        """Ranked matches for query: exact name, name prefix, every word a word
+        prefix, then fuzzy (trigram) matches, which are only looked up when
+        the others don't fill the page. market restricts to one market name.
+
+        Returns [{"Produtos", "match", "score", "markets": [{"market", "last_seen"}]}],
+        score being similarity() between the query and the name.
+        """
+        folded = fold(query)
+        if not folded:
+            return []
+        in_scope = (lambda position: market in self.products[position].markets) if market else (lambda position: True)
+        words = folded.split()
+        kinds = {}
+        for position in self._word_prefix_matches(words):
+            if not in_scope(position):
+                continue
+            product = self.products[position]
+            if product.folded == folded:
+                kinds[position] = EXACT
+            elif product.folded.startswith(folded):
+                kinds[position] = PREFIX
+            else:
+                kinds[position] = WORD_PREFIX
+        similarities = {}
+        if len(kinds) < limit and len(folded) >= MIN_FUZZY_QUERY_LENGTH:
+            similarities = self._similarities(words)
+            for position, score in similarities.items():
+                if score >= FUZZY_MIN_SIMILARITY and in_scope(position):
+                    kinds.setdefault(position, FUZZY)
+
+        ranked = sorted(kinds, key=lambda position: (
+            _RANK[kinds[position]],
+            -similarities[position] if kinds[position] == FUZZY else 0,
+            len(self.products[position].folded),
+            self.products[position].folded,
+        ))[:limit]
+        results = []
+        for position in ranked:
+            product = self.products[position]
+            score = similarities[position] if position in similarities else similarity(words, product.folded.split())
+            results.append({
+                "Produtos": product.name,
+                "match": kinds[position],
+                "score": round(score, 3),
+                "markets": [{"market": name, "last_seen": last_seen} for name, last_seen in sorted(product.markets.items())],
+            })
+        return results
+
+class ProductSearchCache:
+    """ProductSearchIndex over the history catalog plus the current snapshots,
+    rebuilt only when either changes (a new snapshot or a new bulletin)."""
+
+    def __init__(self, history, snapshots):
+        self.history = history
+        self.snapshots = snapshots
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _version(self, snapshots):
+        return self.history.catalog_version(), tuple(sorted(
+            (market_value, snapshot.json.etag) for market_value, snapshot in snapshots.items()
+        ))
+
+    def _entries(self, snapshots):
+        yield from self.history.product_catalog()
+        for snapshot in snapshots.values():
+            iso_date = to_iso_date(snapshot.bulletin_date) if snapshot.bulletin_date else None
+            for row in snapshot.rows:
+                yield snapshot.market_name, row.product, iso_date
+
+    def get(self):
+        snapshots = self.snapshots.all()
+        version = self._version(snapshots)
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.version != version:
+                with STEP_SECONDS.time(step="search_index"):
+                    self._index = ProductSearchIndex(self._entries(snapshots), version)
+            return self._index
@@ -0,0 +1,153 @@
+# raw_archive.py
+# Content-addressed store of every raw bulletin page downloaded from the
+# CEASA site. Pages are gzipped under their SHA-256 (identical downloads are
+# stored once) and each download appends a (market, date, fetched_at,
+# engine) line to responses.jsonl. The hash of the last page each (market,
+# date) was fully processed from lets ingestion stop right after the fetch
+# when the site still serves the same page, and the objects form a corpus
+# that can be replayed through the parser:
+#
+#   python raw_archive.py list [--market 211]
+#   python raw_archive.py show <sha256> [arquivo.html]
+#   python raw_archive.py replay [--market 211]
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from snapshot import write_atomic
+
+LATEST_DATE_KEY = "latest" # date_value None: whatever the newest bulletin is
+INDEX_FILE = "responses.jsonl"
+
+def content_hash(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+class RawArchive:
+    """Raw responses under directory: objects/<ab>/<sha256>.html.gz, the
+    download log in responses.jsonl and one processed/<market>_<date> file
+    per key holding the hash it was last processed from. Safe to share
+    between threads and worker processes."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "processed"), exist_ok=True)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.directory, "objects", sha256[:2], f"{sha256}.html.gz")
+
+    def _processed_path(self, market_value, date_value):
+        return os.path.join(self.directory, "processed", f"{market_value}_{date_value or LATEST_DATE_KEY}")
+
+    def store(self, html, market_value, date_value=None, engine=None, fetched_at=None):
+        """Archive one downloaded page and log the download. Returns its hash."""
+        sha256 = content_hash(html)
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, gzip.compress(html.encode("utf-8"), mtime=0))
+        line = json.dumps({
+            "sha256": sha256,
+            "market": market_value,
+            "date": date_value,
+            "fetched_at": (fetched_at or datetime.now()).isoformat(timespec="seconds"),
+            "engine": engine,
+        }) + "\n"
+        with self._lock, open(os.path.join(self.directory, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(line) # One short append: lines from several processes don't interleave
+        return sha256
+
+    def load(self, sha256):
+        """The archived page with this hash, or None."""
+        try:
+            with open(self._object_path(sha256), "rb") as f:
+                return gzip.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def last_processed(self, market_value, date_value=None):
+        """Hash of the page the (market, date) bulletin was last processed from, or None."""
+        try:
+            with open(self._processed_path(market_value, date_value), "r", encoding="ascii") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def mark_processed(self, market_value, date_value, sha256):
+        write_atomic(self._processed_path(market_value, date_value), sha256.encode("ascii"))
+
+    def responses(self, market_value=None):
+        """Download log entries, oldest first, optionally for one market."""
+        try:
+            f = open(os.path.join(self.directory, INDEX_FILE), "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # Truncated by a crash mid-write
+                if market_value is None or entry["market"] == market_value:
+                    yield entry
+
+def replay(archive, market_value=None):
+    """Run parse, normalize and validate over every distinct archived page.
+    Yields (log entry, IngestionJob)."""
+    from ingestion import IngestionJob, build_pipeline
+    pipeline = build_pipeline(render=False)
+    seen = set()
+    for entry in archive.responses(market_value):
+        if entry["sha256"] in seen:
+            continue
+        seen.add(entry["sha256"])
+        html = archive.load(entry["sha256"])
+        if html is None:
+            continue
+        yield entry, pipeline.run(IngestionJob(entry["market"], entry["market"], date_value=entry["date"], html=html))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Arquivo das respostas brutas do site da CEASA-ES.")
+    arg_parser.add_argument("--dir", default=os.environ.get("RAW_ARCHIVE_DIR") or "ceasa_raw")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="lista os downloads arquivados")
+    list_parser.add_argument("--market")
+    show_parser = commands.add_parser("show", help="extrai uma página arquivada")
+    show_parser.add_argument("sha256")
+    show_parser.add_argument("output", nargs="?", help="arquivo de saída (padrão: saída padrão)")
+    replay_parser = commands.add_parser("replay", help="reprocessa as páginas arquivadas com o parser atual")
+    replay_parser.add_argument("--market")
+    args = arg_parser.parse_args()
+    archive = RawArchive(args.dir)
+
+    if args.command == "list":
+        for entry in archive.responses(args.market):
+            print(f"{entry['fetched_at']}  {entry['market']:>5}  {entry['date'] or LATEST_DATE_KEY:<12} {entry['engine'] or '-':<11} {entry['sha256']}")
+    elif args.command == "show":
+        html = archive.load(args.sha256)
+        if html is None:
+            sys.exit(f"Resposta {args.sha256} não encontrada em {args.dir}.")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(html)
+        else:
+            sys.stdout.write(html)
+    else:
+        ok = failed = 0
+        for entry, job in replay(archive, args.market):
+            if job.ok:
+                ok += 1
+                print(f"{entry['sha256'][:12]}  {entry['market']:>5}  {job.bulletin_date or '?':<10}  {len(job.rows)} linhas")
+            else:
+                failed += 1
+                print(f"{entry['sha256'][:12]}  {entry['market']:>5}  ERRO na etapa {job.failed_stage}: {job.error}")
+        print(f"\n{ok} páginas reprocessadas, {failed} falhas.")
+        sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# single_flight.py
+# Coalesces concurrent scrapes so only one runs per key, inside a process
+# (threads wait on an Event) and across gunicorn workers (an flock on a
+# shared lock file next to the data files). AsyncSingleFlight does the same
+# for coroutines in the ASGI service.
+import asyncio
+import threading
+import time
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError: # Windows: fall back to in-process coordination only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_INTERVAL_SECONDS = 0.5
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+class FileLock:
+    """Non-reentrant exclusive lock on a file shared by every worker process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def wait_released(self, timeout):
+        """Block until no process holds the lock. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.try_acquire():
+                self.release()
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL_SECONDS)
+
+class SingleFlight:
+    """Run at most one call per key at a time; other callers share its result."""
+
+    def __init__(self, lock_dir="."):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _lock_path(self, key):
+        name = "_".join(str(part) for part in key)
+        safe_name = "".join(c if c.isascii() and c.isalnum() else "_" for c in name)
+        return os.path.join(self.lock_dir, f".scrape_{safe_name}.lock")
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+    def run(self, key, fn, wait_timeout, on_peer_finished=None):
+        """Call fn() unless another thread or process is already doing it.
+
+        The leader thread runs fn() and returns its result. Followers in the
+        same process wait up to wait_timeout seconds for that result and get
+        None on timeout. When another process holds the lock, this process
+        waits for it to finish and returns on_peer_finished() (or None), so the
+        caller can reload whatever the peer wrote to disk.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            logger.info(f"Aguardando atualização em andamento para {key} (até {wait_timeout}s).")
+            if not flight.done.wait(wait_timeout):
+                logger.warning(f"Tempo de espera esgotado aguardando atualização de {key}.")
+                return None
+            return flight.result
+
+        file_lock = FileLock(self._lock_path(key))
+        try:
+            if file_lock.try_acquire():
+                try:
+                    flight.result = fn()
+                finally:
+                    file_lock.release()
+            else:
+                logger.info(f"Outro processo está atualizando {key}. Aguardando término.")
+                if file_lock.wait_released(wait_timeout) and on_peer_finished:
+                    flight.result = on_peer_finished()
+            return flight.result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop (the ASGI service): the
+    first caller's coroutine runs as a task and every caller awaits it.
+
+    There is no file lock: the service is meant to be one process.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    def in_flight(self, key):
+        return key in self._flights
+
+    async def run(self, key, fn, wait_timeout):
+        """Await fn() unless it is already running for key; None on timeout.
+
+        A caller that gives up waiting does not cancel the call, which keeps
+        running for the others (and updates the cache when it finishes).
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            logger.info(f"Aguardando atualização em andamento para {key} (até {wait_timeout}s).")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), wait_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tempo de espera esgotado aguardando atualização de {key}.")
+            return None
@@ -0,0 +1,214 @@
+# snapshot.py
+# Immutable in-memory view of one market's latest bulletin, with its pages
+# and JSON rendered once when it is built. Routes read a Snapshot straight
+# from the SnapshotStore; a new one is swapped in after each successful parse
+# and written to disk afterwards by SnapshotWriter, always through a
+# temporary file and an atomic rename.
+import json
+import os
+import queue
+import tempfile
+import threading
+import logging
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from bulletin_parser import row_to_record, record_to_row
+from http_cache import Payload
+from page_renderer import BULLETIN_DATE_NOT_FOUND, render_bulletin_page, situations_of
+from price_query import PriceIndex
+from history_store import to_iso_date, to_cents
+from metrics import STEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Snapshot:
+    market_value: str
+    market_name: str
+    bulletin_date: str # As printed on the bulletin (dd/mm/yyyy), None if it wasn't found
+    generated_at: datetime
+    rows: tuple # BulletinRow
+    html: Payload
+    json: Payload
+    index: PriceIndex # Query indexes over the records, built once
+    variants: dict # Situação -> Payload of the page showing only that situation
+    content_hash: str = None # SHA-256 of the downloaded page it was built from, when known
+
+    def records(self):
+        return list(self.index.records)
+
+    def document(self):
+        """The ceasa_data.json document for this snapshot."""
+        return {
+            "timestamp": self.generated_at.isoformat(),
+            "market": self.market_name,
+            "bulletin_date": self.bulletin_date or BULLETIN_DATE_NOT_FOUND,
+            "data": self.records(),
+        }
+
+    def age_seconds(self, now=None):
+        return max(0, int(((now or datetime.now()) - self.generated_at).total_seconds()))
+
+def build_snapshot(market_value, market_name, bulletin_date, rows, generated_at, content_hash=None):
+    """Build a snapshot, rendering the page and its per-situation variants once."""
+    rows = tuple(rows)
+    index = PriceIndex(row_to_record(row) for row in rows)
+    document = {
+        "timestamp": generated_at.isoformat(),
+        "market": market_name,
+        "bulletin_date": bulletin_date or BULLETIN_DATE_NOT_FOUND,
+        "data": list(index.records),
+    }
+    # Serve compact JSON; the pretty-printed file on disk is for humans
+    with STEP_SECONDS.time(step="json_dump"):
+        json_bytes = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    situations = situations_of(rows)
+    render = lambda page_rows, situation=None: Payload(render_bulletin_page(
+        market_name, bulletin_date, generated_at, page_rows, market_value, situation, situations,
+    ), "text/html", generated_at)
+    with STEP_SECONDS.time(step="html_render"):
+        html = render(rows)
+        variants = {
+            situation: render([row for row in rows if row.situation == situation], situation)
+            for situation in situations
+        }
+    return Snapshot(
+        market_value=market_value,
+        market_name=market_name,
+        bulletin_date=bulletin_date,
+        generated_at=generated_at,
+        rows=rows,
+        html=html,
+        json=Payload(json_bytes, "application/json", generated_at),
+        index=index,
+        variants=variants,
+        content_hash=content_hash,
+    )
+
+def load_snapshot(market_value, data_file):
+    """Rebuild a snapshot from the data file of a previous run. None if it is missing."""
+    if not os.path.exists(data_file):
+        return None
+    with open(data_file, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    bulletin_date = document["bulletin_date"]
+    return build_snapshot(
+        market_value, document["market"], None if bulletin_date == BULLETIN_DATE_NOT_FOUND else bulletin_date,
+        [record_to_row(record) for record in document["data"]], datetime.fromisoformat(document["timestamp"]),
+    )
+
+class SnapshotStore:
+    """Current snapshot per market. Readers never lock: swap() replaces the
+    whole mapping, so a reader sees either the old or the new snapshot."""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._confirmed = {} # market value -> when upstream was last found unchanged
+        self._lock = threading.Lock()
+
+    def get(self, market_value):
+        return self._snapshots.get(market_value)
+
+    def all(self):
+        return dict(self._snapshots)
+
+    def swap(self, snapshot):
+        with self._lock:
+            snapshots = dict(self._snapshots)
+            snapshots[snapshot.market_value] = snapshot
+            self._snapshots = snapshots
+
+    def confirm(self, market_value, when=None):
+        """Record that the site still serves the bulletin of the market's snapshot."""
+        self._confirmed[market_value] = when or datetime.now()
+
+    def age_seconds(self, market_value, now=None):
+        """Seconds since the market's snapshot was built or last confirmed
+        current, whichever is later; None without a snapshot. This, not the
+        snapshot's own age, decides when a market is due for a refresh."""
+        snapshot = self._snapshots.get(market_value)
+        if snapshot is None:
+            return None
+        confirmed = self._confirmed.get(market_value)
+        checked_at = max(snapshot.generated_at, confirmed) if confirmed else snapshot.generated_at
+        return max(0, int(((now or datetime.now()) - checked_at).total_seconds()))
+
+def write_atomic(path, data):
+    """Write bytes to path so readers only ever see the old or the new file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644) # mkstemp creates 0600 files
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class SnapshotWriter:
+    """Background thread persisting snapshots (JSON, HTML, history and, when
+    archive_dir is set, columnar archives of each new bulletin and of the
+    market's whole history)."""
+
+    def __init__(self, history=None, archive_dir=None):
+        self.history = history
+        self.archive_dir = archive_dir
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot, data_file, html_file):
+        """Queue a snapshot for persistence. Returns a Future resolved when written."""
+        future = Future()
+        self._jobs.put((snapshot, data_file, html_file, future))
+        return future
+
+    def _persist(self, snapshot, data_file, html_file):
+        document = snapshot.document()
+        with STEP_SECONDS.time(step="file_write"):
+            write_atomic(data_file, json.dumps(document, ensure_ascii=False, indent=4).encode("utf-8"))
+            write_atomic(html_file, snapshot.html.body)
+        logger.info(f"Dados salvos em {data_file}")
+        logger.info(f"Tabela HTML salva em {html_file}")
+        # Keep every bulletin in the history store (no-op if already stored)
+        if self.history is not None and snapshot.bulletin_date:
+            try:
+                with STEP_SECONDS.time(step="history_write"):
+                    added = self.history.add_bulletin(snapshot.market_name, snapshot.bulletin_date, document["data"], document["timestamp"])
+            except Exception as e:
+                logger.error(f"Erro ao gravar boletim no histórico: {e}")
+                return
+            if added and self.archive_dir:
+                try:
+                    with STEP_SECONDS.time(step="archive_write"):
+                        self._archive(snapshot)
+                except Exception as e:
+                    logger.error(f"Erro ao gravar arquivo colunar: {e}")
+
+    def _archive(self, snapshot):
+        from columnar_archive import encode_archive, history_path, update_history # numpy, only once a new bulletin is archived
+        directory = os.path.join(self.archive_dir, snapshot.market_value)
+        os.makedirs(directory, exist_ok=True)
+        iso_date = to_iso_date(snapshot.bulletin_date)
+        rows = [(iso_date, row.product, row.package, to_cents(row.min), to_cents(row.mc), to_cents(row.max), row.situation or None)
+                for row in snapshot.rows]
+        write_atomic(os.path.join(directory, f"{iso_date}.col"), encode_archive(snapshot.market_name, rows))
+        total = update_history(
+            history_path(self.archive_dir, snapshot.market_value), self.history, snapshot.market_name, iso_date, rows, write_atomic,
+        )
+        logger.info(f"Arquivo colunar de {snapshot.market_name} atualizado ({total} linhas no histórico).")
+
+    def _loop(self):
+        while True:
+            snapshot, data_file, html_file, future = self._jobs.get()
+            try:
+                self._persist(snapshot, data_file, html_file)
+                future.set_result(True)
+            except Exception as e:
+                logger.error(f"Erro ao salvar snapshot de {snapshot.market_value}: {e}")
+                future.set_exception(e)
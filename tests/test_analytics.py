@@ -0,0 +1,43 @@
+# tests/test_analytics.py
+# Rolling price statistics of analytics.py.
+import math
+import warnings
+import pytest
+
+pytest.importorskip("pandas")
+from analytics import MarketAnalytics, frame_from_rows
+
+ROWS = [
+    ("2025-04-22", "ALFACE LISA", "CX", 90, 100, 110, None),
+    ("2025-04-23", "ALFACE LISA", "CX", None, None, None, None), # Not priced that day
+    ("2025-04-24", "ALFACE LISA", "CX", 100, 110, 120, None),
+    ("2025-04-25", "ALFACE LISA", "CX", 110, 121, 130, "ME"),
+    ("2025-04-25", "TOMATE", "KG", 300, 400, 500, None),
+]
+
+def build():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error") # No deprecation noise on every rebuild
+        return MarketAnalytics("CEASA GRANDE VITÓRIA", frame_from_rows(ROWS), ("2025-04-25", 4))
+
+def test_change_keeps_gaps():
+    analytics = build()
+    frame = analytics.frame[analytics.frame["product"] == "ALFACE LISA"]
+    changes = frame["change_pct"].tolist()
+    assert all(math.isnan(change) for change in changes[:3]) # First bulletin, the gap and the day after it
+    assert changes[3] == pytest.approx(10.0)
+
+def test_summary_of_latest_bulletin():
+    summary = {row["Produtos"]: row for row in build().summary()}
+    assert set(summary) == {"ALFACE LISA", "TOMATE"}
+    assert summary["ALFACE LISA"]["M.C."] == 1.21
+    assert summary["ALFACE LISA"]["ma_7"] == pytest.approx(round((100 + 110 + 121) / 3 / 100, 2))
+    assert summary["ALFACE LISA"]["spread"] == 0.2
+    assert summary["TOMATE"]["volatility"] is None # One bulletin: no change to measure
+
+def test_product_stats_history():
+    stats = build().product_stats("ALFACE LISA")
+    assert [item["Embalagem"] for item in stats] == ["CX"]
+    assert [record["M.C."] for record in stats[0]["history"]] == [1.0, None, 1.1, 1.21]
+    assert stats[0]["summary"]["bulletins"] == 4
+    assert build().product_stats("BATATA") is None
@@ -0,0 +1,52 @@
+# tests/test_bulletin_diff.py
+# Bulletin-to-bulletin differences of bulletin_diff.py and the diffs the
+# history store keeps between consecutive bulletins.
+import json
+from bulletin_diff import diff_bulletins
+from history_store import HistoryStore
+
+OLD = {
+    ("ALFACE LISA", "CX"): (1000, 1250, 1500, "ME"),
+    ("TOMATE", "KG"): (300, 400, 500, None),
+    ("CHUCHU", "CX"): (0, 0, 100, None),
+}
+NEW = {
+    ("ALFACE LISA", "CX"): (1000, 1375, 1500, "MA"),
+    ("TOMATE", "KG"): (300, 400, 500, None),
+    ("CHUCHU", "CX"): (0, 50, None, None),
+    ("BATATA", "SC"): (5000, 5500, 6000, None),
+}
+
+def test_added_removed_and_unchanged():
+    diff = diff_bulletins(OLD, {key: value for key, value in NEW.items() if key[0] != "TOMATE"})
+    assert diff["added"] == [{"Produtos": "BATATA", "Embalagem": "SC", "MIN": 50.0, "M.C.": 55.0, "MAX": 60.0, "Situação": None}]
+    assert diff["removed"] == [{"Produtos": "TOMATE", "Embalagem": "KG"}]
+    assert diff_bulletins(OLD, OLD) == {"added": [], "removed": [], "changed": []}
+
+def test_changed_fields_only():
+    changed = {entry["Produtos"]: entry for entry in diff_bulletins(OLD, NEW)["changed"]}
+    assert set(changed) == {"ALFACE LISA", "CHUCHU"} # TOMATE did not move
+    assert changed["ALFACE LISA"] == {
+        "Produtos": "ALFACE LISA", "Embalagem": "CX",
+        "M.C.": {"from": 12.5, "to": 13.75, "delta": 1.25, "pct": 10.0},
+        "Situação": {"from": "ME", "to": "MA"},
+    }
+
+def test_zero_and_missing_prices():
+    chuchu = next(entry for entry in diff_bulletins(OLD, NEW)["changed"] if entry["Produtos"] == "CHUCHU")
+    assert chuchu["M.C."] == {"from": 0.0, "to": 0.5, "delta": 0.5, "pct": None} # No percentage from zero
+    assert chuchu["MAX"] == {"from": 1.0, "to": None} # No delta to a blank price
+
+def test_history_diffs_neighbours_of_a_backfilled_bulletin(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    market = "CEASA GRANDE VITÓRIA"
+    record = lambda mc: {"Produtos": "ALFACE LISA", "Embalagem": "CX", "MIN": mc, "M.C.": mc, "MAX": mc, "Situação": None}
+    history.add_bulletin(market, "2025-04-23", [record(10.0)])
+    history.add_bulletin(market, "2025-04-25", [record(14.0)])
+    history.add_bulletin(market, "2025-04-24", [record(12.0)]) # Backfilled between the two
+    before = json.loads(history.changes(market, "2025-04-23", "2025-04-24"))
+    after = json.loads(history.changes(market, "2025-04-24"))
+    assert (before["from"], before["to"]) == ("2025-04-23", "2025-04-24")
+    assert before["changed"][0]["M.C."]["delta"] == 2.0
+    assert (after["to"], after["changed"][0]["M.C."]["pct"]) == ("2025-04-25", 16.67)
+    assert history.changes(market, "2025-04-01") is None
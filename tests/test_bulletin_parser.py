@@ -0,0 +1,61 @@
+# tests/test_bulletin_parser.py
+# Single-pass bulletin parsing of bulletin_parser.py: prices, blank cells,
+# the data table, date and market.
+from decimal import Decimal
+import pytest
+from bulletin_parser import BulletinRow, parse_bulletin, parse_price, record_to_row, row_to_record
+
+PAGE = """<html><head><title>Boletim</title></head><body>
+<table><tr><td>Mercado: CEASA GRANDE VITÓRIA</td></tr><tr><td>Data Pesquisada: 25/04/2025</td></tr></table>
+<table>
+  <tr><th>Produtos</th><th>Embalagem</th><th>MIN</th><th>M.C.</th><th>MAX</th><th>Situação</th></tr>
+  <tr><td>ALFACE LISA</td><td>CX</td><td>10,00</td><td>12,50</td><td>15,00</td><td>ME</td></tr>
+  <tr><td>HORTALIÇAS</td><td></td><td></td><td></td><td></td><td></td></tr>
+  <tr><td>ALHO &amp; CIA</td><td>KG</td><td>1.234,56</td><td>-</td><td></td><td></td></tr>
+</table>
+<table><tr><td>Produtos</td><td>Embalagem</td><td>MIN</td><td>M.C.</td><td>MAX</td><td>Situação</td></tr>
+  <tr><td>OUTRA TABELA</td><td>CX</td><td>1,00</td><td>1,00</td><td>1,00</td><td></td></tr></table>
+</body></html>"""
+
+@pytest.mark.parametrize("text, price", [
+    ("12,50", Decimal("12.50")),
+    ("1.234,56", Decimal("1234.56")),
+    (" 0,10 ", Decimal("0.10")),
+    ("", None),
+    ("  ", None),
+    ("-", None),
+    ("n/d", None),
+])
+def test_parse_price(text, price):
+    assert parse_price(text) == price
+
+def test_prices_are_exact_decimals():
+    # Decimal keeps centavos exact where float would not (0.1 + 0.2)
+    assert parse_price("0,10") + parse_price("0,20") == Decimal("0.30")
+
+def test_parses_rows_date_and_market():
+    bulletin = parse_bulletin(PAGE)
+    assert bulletin.bulletin_date == "25/04/2025"
+    assert bulletin.market == "CEASA GRANDE VITÓRIA"
+    assert bulletin.rows == [
+        BulletinRow("ALFACE LISA", "CX", Decimal("10.00"), Decimal("12.50"), Decimal("15.00"), "ME"),
+        BulletinRow("ALHO & CIA", "KG", Decimal("1234.56"), None, None, ""), # "-" and blank cells are missing prices
+    ]
+
+def test_grouping_rows_and_later_tables_are_skipped():
+    products = [row.product for row in parse_bulletin(PAGE).rows]
+    assert "HORTALIÇAS" not in products
+    assert "OUTRA TABELA" not in products
+
+def test_page_without_data_table():
+    assert parse_bulletin("<html><body><p>Nenhum registro encontrado</p></body></html>") is None
+
+def test_record_round_trip():
+    row = parse_bulletin(PAGE).rows[1]
+    record = row_to_record(row)
+    assert record == {"Produtos": "ALHO & CIA", "Embalagem": "KG", "MIN": 1234.56, "M.C.": None, "MAX": None, "Situação": None}
+    assert record_to_row(record) == row
+
+def test_record_to_row_accepts_old_records():
+    row = record_to_row({"Produto": "ALFACE", "Embalagem": float("nan"), "MIN": float("nan"), "M.C.": 1.5, "MAX": None, "Situação": None})
+    assert row == BulletinRow("ALFACE", "", None, Decimal("1.5"), None, "")
@@ -0,0 +1,97 @@
+# tests/test_columnar_archive.py
+# Columnar archive files of columnar_archive.py: encoding round trip, date
+# ranges and merging new bulletins into a market's history archive.
+import pytest
+
+pytest.importorskip("numpy")
+from columnar_archive import ColumnarArchive, encode_archive, history_path, open_archive, update_history
+from history_store import HistoryStore
+
+MARKET = "CEASA GRANDE VITÓRIA"
+ROWS = [
+    ("2025-04-25", "TOMATE", "KG", 300, 400, 500, None),
+    ("2025-04-24", "ALFACE LISA", "CX", 1000, 1250, 1500, "ME"),
+    ("2025-04-25", "ALFACE LISA", "CX", 1100, None, 1600, None),
+]
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def record(product, mc):
+    return {"Produtos": product, "Embalagem": "CX", "MIN": mc, "M.C.": mc, "MAX": mc, "Situação": None}
+
+def test_round_trip_sorted_by_date(tmp_path):
+    path = tmp_path / "history.col"
+    write(path, encode_archive(MARKET, ROWS))
+    archive = ColumnarArchive(str(path))
+    assert (archive.market, len(archive)) == (MARKET, 3)
+    assert archive.dates == ["2025-04-24", "2025-04-25"]
+    assert archive.version == ("2025-04-25", 2)
+    assert archive.price_rows() == sorted(ROWS, key=lambda row: (row[0], row[1], row[2]))
+    assert archive.records()[0] == {
+        "bulletin_date": "2025-04-24", "Produtos": "ALFACE LISA", "Embalagem": "CX",
+        "MIN": 10.0, "M.C.": 12.5, "MAX": 15.0, "Situação": "ME",
+    }
+
+def test_date_range_and_missing_prices(tmp_path):
+    path = tmp_path / "history.col"
+    write(path, encode_archive(MARKET, ROWS))
+    archive = ColumnarArchive(str(path))
+    assert archive.date_range(start="2025-04-25") == (1, 3)
+    assert archive.date_range(end="2025-04-24") == (0, 1)
+    prices = archive.prices("mc", start="2025-04-25")
+    assert prices[1] == 400 and prices[0] != prices[0] # Blank M.C. reads back as NaN
+
+def test_empty_archive(tmp_path):
+    path = tmp_path / "history.col"
+    write(path, encode_archive(MARKET, []))
+    archive = ColumnarArchive(str(path))
+    assert (len(archive), archive.version, archive.price_rows()) == (0, (None, 0), [])
+
+def test_open_archive_rejects_other_files(tmp_path):
+    (tmp_path / "other.col").write_bytes(b"not an archive")
+    assert open_archive(str(tmp_path / "other.col")) is None
+    assert open_archive(str(tmp_path / "missing.col")) is None
+
+def test_update_history_merges_new_bulletins(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    path = history_path(str(tmp_path), "211")
+    (tmp_path / "211").mkdir()
+    history.add_bulletin(MARKET, "2025-04-24", [record("ALFACE LISA", 12.5)])
+    # No archive yet: built from the history store
+    assert update_history(path, history, MARKET, "2025-04-24", [], write) == 1
+    history.add_bulletin(MARKET, "2025-04-25", [record("ALFACE LISA", 13.0)])
+    rows = [("2025-04-25", "ALFACE LISA", "CX", 1300, 1300, 1300, None)]
+    history.price_rows = None # A merge must not read the whole history again
+    assert update_history(path, history, MARKET, "2025-04-25", rows, write) == 2
+    archive = ColumnarArchive(path)
+    assert archive.version == ("2025-04-25", 2)
+    assert [row[4] for row in archive.price_rows()] == [1250, 1300]
+
+def test_update_history_rebuilds_a_stale_archive(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    path = str(tmp_path / "history.col")
+    write(path, encode_archive(MARKET, []))
+    # Two bulletins stored while archiving was off, then a third one arrives
+    for iso_date, mc in (("2025-04-23", 11.0), ("2025-04-24", 12.0), ("2025-04-25", 13.0)):
+        history.add_bulletin(MARKET, iso_date, [record("ALFACE LISA", mc)])
+    rows = [("2025-04-25", "ALFACE LISA", "CX", 1300, 1300, 1300, None)]
+    assert update_history(path, history, MARKET, "2025-04-25", rows, write) == 3
+    assert ColumnarArchive(path).version == tuple(history.bulletin_version(MARKET))
+
+def test_analytics_frame_from_archive(tmp_path):
+    pytest.importorskip("pandas")
+    from analytics import AnalyticsCache
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    path = str(tmp_path / "history.col")
+    history.add_bulletin(MARKET, "2025-04-24", [record("ALFACE LISA", 12.5)])
+    update_history(path, history, MARKET, "2025-04-24", [], write)
+    price_rows = history.price_rows
+    history.price_rows = None # Up-to-date archive: SQLite rows are not read
+    analytics = AnalyticsCache(history, lambda market: path).get(MARKET)
+    assert analytics.summary()[0]["M.C."] == 12.5
+    # A bulletin the archive missed: falls back to SQLite
+    history.add_bulletin(MARKET, "2025-04-25", [record("ALFACE LISA", 13.0)])
+    history.price_rows = price_rows
+    assert AnalyticsCache(history, lambda market: path).get(MARKET).latest_date == "2025-04-25"
@@ -0,0 +1,120 @@
+# tests/test_date_list.py
+# The date dropdown as the live site fills it (an AJAX call after the market
+# is picked): parsing its answers, recording and replaying the call, and the
+# new-bulletin probe built on it (fetch_engines.py, bulletin_probe.py).
+import asyncio
+import pytest
+import fetch_engines
+from bulletin_probe import NEW, UNCHANGED, UNKNOWN, BulletinProbe
+from fetch_engines import DateListRequest, DateRequestStore, match_date_request, parse_date_options
+
+# ScriptCase's answer to the field refresh, as PHP's json_encode writes it
+SCRIPTCASE_JSON = (
+    '{"result":"OK","fldList":[{"fldName":"datas","fldType":"select","valList":[""],"optList":['
+    '{"value":"","label":"Selecione"},{"value":"20250425","label":"25\\/04\\/2025"},'
+    '{"value":"20250424","label":"24\\/04\\/2025"}]}]}'
+)
+# Older ScriptCase (SAJAX) answers with a script instead of JSON
+SAJAX_SCRIPT = '+:var res = [["", "Selecione"], ["20250425", "25\\/04\\/2025"], ["20250424", "24\\/04\\/2025"]]; res;'
+FILTER_PAGE_WITHOUT_DATES = '<html><body><form><select name="datas"></select><input type="hidden" name="x" value="20250101"></form></body></html>'
+
+def test_parses_scriptcase_json_answer():
+    assert parse_date_options(SCRIPTCASE_JSON) == [("20250425", "2025-04-25"), ("20250424", "2025-04-24")]
+
+def test_parses_script_answer():
+    assert parse_date_options(SAJAX_SCRIPT) == [("20250425", "2025-04-25"), ("20250424", "2025-04-24")]
+
+def test_filter_page_without_options_has_no_dates():
+    assert parse_date_options(FILTER_PAGE_WITHOUT_DATES) == []
+
+def test_parses_select_before_loose_options():
+    pytest.importorskip("bs4")
+    page = '<select name="mercado"><option value="211">CEASA</option></select><select name="datas"><option value="20250425">25/04/2025</option></select>'
+    assert parse_date_options(page) == [("20250425", "2025-04-25")]
+
+def test_parses_option_fragment():
+    pytest.importorskip("bs4")
+    fragment = '<option value="">Selecione</option><option value="20250425">25/04/2025</option>'
+    assert parse_date_options(fragment) == [("20250425", "2025-04-25")]
+
+def test_recorded_request_swaps_market_and_refreshes_session_fields():
+    recorded = DateListRequest.record(
+        "post", "http://host/detec/filtro_boletim_es/filtro_boletim_es.php?rnd=1",
+        "nmgp_opcao=ajax_refresh_datas&script_case_init=1234&mercado=211", "211",
+        {"X-Requested-With": "XMLHttpRequest", "Cookie": "secret"},
+    )
+    # The filter form also has a hidden nmgp_opcao ("pesq"): only session tokens are refreshed
+    method, url, params, data, headers = recorded.build("212", {"script_case_init": "9876", "nmgp_opcao": "pesq"})
+    assert (method, url, params) == ("POST", "http://host/detec/filtro_boletim_es/filtro_boletim_es.php", [("rnd", "1")])
+    assert data == [("nmgp_opcao", "ajax_refresh_datas"), ("script_case_init", "9876"), ("mercado", "212")]
+    assert headers == {"X-Requested-With": "XMLHttpRequest"}
+
+def test_request_without_the_market_is_not_recorded():
+    assert DateListRequest.record("POST", "http://host/a.php", "nmgp_opcao=ping", "211") is None
+
+def test_match_picks_the_call_that_brought_the_dates():
+    dates = parse_date_options(SCRIPTCASE_JSON)
+    candidates = [
+        ("POST", "http://host/a.php", "mercado=211&op=log", {}, '{"result":"OK"}'),
+        ("POST", "http://host/filtro.php", "nmgp_opcao=ajax_refresh_datas&mercado=211", {}, SCRIPTCASE_JSON),
+    ]
+    recorded = match_date_request(candidates, "211", dates)
+    assert recorded.url == "http://host/filtro.php"
+    assert recorded.market_fields == {"mercado"}
+
+def test_store_round_trip(tmp_path):
+    store = DateRequestStore(str(tmp_path / "date_request.json"))
+    assert store.get() is None
+    store.save(DateListRequest.record("POST", "http://host/filtro.php", "mercado=211", "211"))
+    assert DateRequestStore(store.path).get().to_dict() == store.get().to_dict()
+
+@pytest.fixture
+def dynamic_site(tmp_path, monkeypatch):
+    pytest.importorskip("requests")
+    pytest.importorskip("bs4")
+    from fixture_server import FixtureServer, FILTER_PATH
+    with FixtureServer(dynamic_dates=True) as server:
+        filter_url = server.base_url.rstrip("/") + FILTER_PATH[len("/detec"):]
+        monkeypatch.setattr(fetch_engines, "FILTER_URL", filter_url)
+        monkeypatch.setattr(fetch_engines, "date_requests", DateRequestStore(str(tmp_path / "date_request.json")))
+        yield filter_url
+
+def test_http_engine_replays_the_recorded_call(dynamic_site):
+    engine = fetch_engines.HttpFetchEngine(timeout=5)
+    assert engine.list_dates("211") == [] # Nothing recorded yet: the page has no dates
+    fetch_engines.date_requests.save(DateListRequest.record(
+        "POST", dynamic_site, "nmgp_opcao=ajax_refresh_datas&script_case_init=1234&mercado=211", "211",
+    ))
+    assert [iso_date for _, iso_date in engine.list_dates("212")] == ["2025-04-25", "2025-04-24", "2025-04-23", "2025-04-22"]
+
+def test_async_http_engine_replays_the_recorded_call(dynamic_site, monkeypatch):
+    async_engines = pytest.importorskip("async_engines")
+    monkeypatch.setattr(async_engines, "FILTER_URL", dynamic_site)
+    monkeypatch.setattr(async_engines, "date_requests", fetch_engines.date_requests)
+    fetch_engines.date_requests.save(DateListRequest.record(
+        "POST", dynamic_site, "nmgp_opcao=ajax_refresh_datas&script_case_init=1234&mercado=211", "211",
+    ))
+    dates = asyncio.run(async_engines.AsyncHttpFetchEngine(timeout=5).list_dates("212"))
+    assert [iso_date for _, iso_date in dates] == ["2025-04-25", "2025-04-24", "2025-04-23", "2025-04-22"]
+
+class FakeEngine:
+    def __init__(self, dates):
+        self.dates = dates
+        self.calls = 0
+
+    def list_dates(self, market_value):
+        self.calls += 1
+        return self.dates
+
+def test_probe_compares_newest_date():
+    engine = FakeEngine([("20250425", "2025-04-25"), ("20250424", "2025-04-24")])
+    assert BulletinProbe(engine, lambda market_value: "2025-04-24").check("211") == NEW
+    assert BulletinProbe(engine, lambda market_value: "2025-04-25").check("211") == UNCHANGED
+    assert BulletinProbe(engine, lambda market_value: None).check("211") == UNKNOWN
+
+def test_probe_learns_with_the_browser_once():
+    browser = FakeEngine([("20250425", "2025-04-25")])
+    probe = BulletinProbe(FakeEngine([]), lambda market_value: "2025-04-24", learn=browser.list_dates)
+    assert probe.check("211") == NEW
+    assert probe.check("211") == UNKNOWN # Within LEARN_RETRY_SECONDS: no second browser walk
+    assert browser.calls == 1
@@ -0,0 +1,23 @@
+# tests/test_history_store.py
+# Date handling and price history queries of history_store.py.
+import pytest
+from history_store import HistoryStore, to_iso_date
+
+def test_bulletin_and_iso_dates():
+    assert to_iso_date("25/04/2025") == "2025-04-25"
+    assert to_iso_date("2025-04-25") == "2025-04-25"
+
+@pytest.mark.parametrize("value", ["2025-13-99", "abcd-efghi", "2025-04-5x", "31/02/2025", "ontem"])
+def test_invalid_dates_are_rejected(value):
+    with pytest.raises(ValueError):
+        to_iso_date(value)
+
+def test_query_prices_by_market_name(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    record = {"Produtos": "ALFACE LISA", "Embalagem": "CX", "MIN": 10.0, "M.C.": 12.0, "MAX": 14.0, "Situação": "ME"}
+    history.add_bulletin("CEASA GRANDE VITÓRIA", "25/04/2025", [record])
+    history.add_bulletin("CEASA COLATINA", "25/04/2025", [record])
+    rows = history.query_prices(market="CEASA COLATINA", start_date="2025-04-01")
+    assert [(row["market"], row["bulletin_date"], row["M.C."]) for row in rows] == [("CEASA COLATINA", "2025-04-25", 12.0)]
+    with pytest.raises(ValueError):
+        history.query_prices(start_date="2025-99-01")
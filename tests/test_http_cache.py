@@ -0,0 +1,62 @@
+# tests/test_http_cache.py
+# ETag / Last-Modified negotiation and precompressed bodies of http_cache.py.
+import gzip
+from datetime import datetime, timedelta, timezone
+import pytest
+
+pytest.importorskip("flask")
+from http_cache import Payload, negotiate
+
+GENERATED_AT = datetime(2025, 4, 25, 12, 30, 15, 123456, tzinfo=timezone.utc)
+BODY = b'{"data": []}' * 50
+
+class Headers(dict):
+    def get(self, name, default=None):
+        return next((value for key, value in self.items() if key.lower() == name.lower()), default)
+
+@pytest.fixture
+def payload():
+    return Payload(BODY, "application/json", GENERATED_AT)
+
+def test_first_request_gets_body_and_validators(payload):
+    status, body, headers = negotiate(payload, Headers())
+    assert (status, body) == (200, BODY)
+    assert headers["ETag"] == f'"{payload.etag}"'
+    assert headers["Last-Modified"] == "Fri, 25 Apr 2025 12:30:15 GMT"
+    assert headers["Vary"] == "Accept-Encoding"
+
+def test_gzip_variant(payload):
+    status, body, headers = negotiate(payload, Headers({"accept-encoding": "br;q=0, gzip, deflate"}))
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"] == f'"{payload.etag}-gzip"'
+    assert gzip.decompress(body) == BODY
+
+def test_refused_encodings_get_identity(payload):
+    _, body, headers = negotiate(payload, Headers({"Accept-Encoding": "gzip;q=0, br;q=0"}))
+    assert body == BODY and "Content-Encoding" not in headers
+
+@pytest.mark.parametrize("if_none_match", [
+    '"{etag}"', 'W/"{etag}"', '"{etag}-gzip"', '"outra", "{etag}-br"', "*",
+])
+def test_matching_etag_is_not_modified(payload, if_none_match):
+    status, body, headers = negotiate(payload, Headers({"If-None-Match": if_none_match.format(etag=payload.etag)}))
+    assert (status, body) == (304, b"")
+    assert headers["ETag"] == f'"{payload.etag}"'
+
+def test_other_etag_gets_body(payload):
+    assert negotiate(payload, Headers({"If-None-Match": '"0000"'}))[0] == 200
+
+def test_if_modified_since(payload):
+    same_second = "Fri, 25 Apr 2025 12:30:15 GMT" # Sub-second part of generated_at is dropped
+    assert negotiate(payload, Headers({"If-Modified-Since": same_second}))[0] == 304
+    earlier = (GENERATED_AT - timedelta(seconds=1)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    assert negotiate(payload, Headers({"If-Modified-Since": earlier}))[0] == 200
+    assert negotiate(payload, Headers({"If-Modified-Since": "ontem"}))[0] == 200
+
+def test_etag_takes_precedence_over_date(payload):
+    request = Headers({"If-None-Match": '"0000"', "If-Modified-Since": "Sat, 26 Apr 2025 00:00:00 GMT"})
+    assert negotiate(payload, request)[0] == 200
+
+def test_extra_headers(payload):
+    _, _, headers = negotiate(payload, Headers(), {"X-Bulletin-Date": "25/04/2025"})
+    assert headers["X-Bulletin-Date"] == "25/04/2025"
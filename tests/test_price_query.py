@@ -0,0 +1,62 @@
+# tests/test_price_query.py
+# Filtering, sorting and cursor pagination of price_query.py.
+import pytest
+from price_query import PriceIndex, PriceQuery, QueryError, decode_cursor, encode_cursor
+
+def record(product, mc, situation=None):
+    return {"Produtos": product, "Embalagem": "CX", "MIN": mc, "M.C.": mc, "MAX": mc, "Situação": situation}
+
+RECORDS = [
+    record("ALFACE LISA", 12.0, "ME"),
+    record("ALFACE CRESPA", 10.0),
+    record("BATATA", 12.0, "MA"),
+    record("ABÓBORA", None),
+    record("TOMATE", 8.0, "ME"),
+    record("ALHO", 12.0),
+]
+VERSION = "0123456789abcdef"
+
+def run(**args):
+    records, total, cursor = PriceIndex(RECORDS).query(PriceQuery.from_args(args), VERSION)
+    return [r["Produtos"] for r in records], total, cursor
+
+def test_filters():
+    assert run(product="alface")[0] == ["ALFACE LISA", "ALFACE CRESPA"] # Unsorted: bulletin order
+    assert run(q="ALHO")[0] == ["ALHO"]
+    assert run(situation="me")[0] == ["ALFACE LISA", "TOMATE"]
+    assert run(situation="-")[0] == ["ALFACE CRESPA", "ABÓBORA", "ALHO"]
+    assert run(min_price="10", max_price="12,0", situation="-")[0] == ["ALFACE CRESPA", "ALHO"]
+
+def test_sort_ties_keep_bulletin_order():
+    assert run(sort="mc")[0] == ["TOMATE", "ALFACE CRESPA", "ALFACE LISA", "BATATA", "ALHO", "ABÓBORA"]
+    assert run(sort="-M.C.")[0] == ["ALFACE LISA", "BATATA", "ALHO", "ALFACE CRESPA", "TOMATE", "ABÓBORA"]
+
+def test_cursor_pages_cover_every_match_once():
+    seen, cursor = [], None
+    while True:
+        args = {"sort": "-mc", "limit": "2"}
+        if cursor:
+            args["cursor"] = cursor
+        names, total, cursor = run(**args)
+        seen += names
+        if cursor is None:
+            break
+    assert total == 6
+    assert seen == run(sort="-mc")[0]
+
+def test_cursor_from_another_snapshot_is_rejected():
+    cursor = encode_cursor("ffffffffffff", 2)
+    with pytest.raises(QueryError, match="expirado"):
+        decode_cursor(cursor, VERSION)
+    with pytest.raises(QueryError, match="inválido"):
+        decode_cursor("@@@", VERSION)
+    assert decode_cursor(encode_cursor(VERSION, 4), VERSION) == 4
+
+def test_projection():
+    records, _, _ = PriceIndex(RECORDS).query(PriceQuery.from_args({"fields": "produto,mc", "limit": "1"}), VERSION)
+    assert records == [{"Produtos": "ALFACE LISA", "M.C.": 12.0}]
+
+@pytest.mark.parametrize("args", [{"limit": "0"}, {"limit": "x"}, {"sort": "preço"}, {"fields": "cor"}, {"min_price": "barato"}])
+def test_invalid_parameters(args):
+    with pytest.raises(QueryError):
+        PriceQuery.from_args(args)
@@ -0,0 +1,57 @@
+# tests/test_product_search.py
+# Accent-, case- and typo-tolerant product search (product_search.py).
+import pytest
+from product_search import EXACT, FUZZY, PREFIX, ProductSearchIndex, fold, similarity
+
+CATALOG = [
+    "AGRIAO", "ALFACE AMERICANA", "ALFACE CRESPA", "ALFACE LISA", "ABOBORA MORANGA",
+    "ABOBORA PAULISTA", "CHUCHU", "REPOLHO VERDE", "REPOLHO ROXO", "TOMATE SALADA",
+]
+
+@pytest.fixture(scope="module")
+def index():
+    return ProductSearchIndex(("CEASA GRANDE VITÓRIA", name, "2025-04-25") for name in CATALOG)
+
+def names(results):
+    return [result["Produtos"] for result in results]
+
+def test_fold_strips_accents_case_and_punctuation():
+    assert fold("  Alface  Americâna/") == "alface americana"
+
+def test_missing_accent_and_case(index):
+    results = index.search("agrião")
+    assert results[0]["Produtos"] == "AGRIAO"
+    assert results[0]["match"] == EXACT
+
+def test_word_prefixes_of_multi_word_name(index):
+    results = index.search("alface americ")
+    assert results[0]["Produtos"] == "ALFACE AMERICANA"
+    assert results[0]["match"] == PREFIX
+
+@pytest.mark.parametrize("query, expected", [
+    ("alfce", "ALFACE"),
+    ("alfase", "ALFACE"),
+    ("repolio", "REPOLHO"),
+    ("abobra", "ABOBORA"),
+    ("chuxu", "CHUCHU"),
+])
+def test_one_letter_typo_finds_multi_word_names(index, query, expected):
+    results = index.search(query)
+    assert results, f"{query!r} não encontrou nada"
+    assert all(result["match"] == FUZZY for result in results)
+    assert results[0]["Produtos"].startswith(expected)
+
+def test_typo_in_one_word_of_a_multi_word_query(index):
+    assert names(index.search("alfce lisa"))[0] == "ALFACE LISA"
+
+def test_unrelated_query_is_below_the_threshold(index):
+    assert index.search("xyzw") == []
+    assert index.search("banana") == []
+
+def test_similarity_is_per_word():
+    assert similarity(["alfce"], ["alface", "americana"]) > 0.4
+    assert similarity(["xyzw"], ["alface", "americana"]) == 0
+
+def test_market_scope():
+    index = ProductSearchIndex([("A", "ALFACE LISA", "2025-04-25"), ("B", "ALFACE CRESPA", "2025-04-25")])
+    assert names(index.search("alface", market="B")) == ["ALFACE CRESPA"]
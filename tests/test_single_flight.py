@@ -0,0 +1,87 @@
+# tests/test_single_flight.py
+# Scrape coalescing of single_flight.py: threads of one process, worker
+# processes sharing the lock file, and the asyncio variant.
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import single_flight
+from single_flight import AsyncSingleFlight, SingleFlight
+
+KEY = ("scrape", "211")
+
+def test_concurrent_threads_share_one_call(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+    calls, started, release = [], threading.Event(), threading.Event()
+
+    def scrape():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "snapshot"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.run(KEY, scrape, 5)))
+    leader.start()
+    started.wait(5)
+    assert flights.in_flight(KEY)
+    followers = [threading.Thread(target=lambda: results.append(flights.run(KEY, scrape, 5))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert (len(calls), results) == (1, ["snapshot"] * 4)
+    assert not flights.in_flight(KEY)
+
+def test_follower_times_out_with_none(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=flights.run, args=(KEY, lambda: started.set() or release.wait(5), 5))
+    leader.start()
+    started.wait(5)
+    assert flights.run(KEY, lambda: "never", 0.05) is None
+    release.set()
+    leader.join(5)
+
+@pytest.mark.skipif(single_flight.fcntl is None, reason="no flock on this platform")
+def test_waits_for_another_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(single_flight, "LOCK_POLL_INTERVAL_SECONDS", 0.02)
+    flights = SingleFlight(str(tmp_path))
+    # Another worker holds the lock file for a moment
+    holder = subprocess.Popen([sys.executable, "-c", (
+        "import fcntl, os, sys, time\n"
+        f"fd = os.open({flights._lock_path(KEY)!r}, os.O_RDWR | os.O_CREAT)\n"
+        "fcntl.flock(fd, fcntl.LOCK_EX)\n"
+        "print('locked', flush=True)\n"
+        "time.sleep(0.5)\n"
+    )], stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        started = time.monotonic()
+        result = flights.run(KEY, lambda: "scraped here", 5, on_peer_finished=lambda: "reloaded from disk")
+        assert result == "reloaded from disk"
+        assert time.monotonic() - started > 0.2 # Waited for the peer instead of scraping
+    finally:
+        holder.wait(5)
+    assert flights.run(KEY, lambda: "scraped here", 5) == "scraped here" # Lock free again
+
+def test_async_callers_share_one_task():
+    calls = []
+
+    async def scrape():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "snapshot"
+
+    async def main():
+        flights = AsyncSingleFlight()
+        results = await asyncio.gather(*(flights.run(KEY, scrape, 5) for _ in range(4)))
+        timed_out = await AsyncSingleFlight().run(KEY, lambda: asyncio.sleep(1), 0.01)
+        return results, flights.in_flight(KEY), timed_out
+
+    results, in_flight, timed_out = asyncio.run(main())
+    assert (len(calls), results, in_flight, timed_out) == (1, ["snapshot"] * 4, False, None)